@@ -43,10 +43,83 @@ class ApiConfiguration:
         self.embedModelName = "text-embedding-3-large"
         self.processingThreads = 4
         self.openAiRequestTimeout = 60
+        self.httpMaxConnections = None  # Connections in the HTTP pool shared by every API client, None for two per processing thread plus two
+        self.httpKeepAliveExpiry = 30   # Seconds an idle pooled connection is kept open for reuse
+        self.httpHttp2 = False          # Use HTTP/2 for the shared pool (needs the h2 package)
+        self.adaptiveTimeouts = False   # Derive each stage's request timeout from its recent latencies instead of openAiRequestTimeout
+        self.timeoutPercentile = 99     # Latency percentile an adaptive timeout is a multiple of
+        self.timeoutMultiplier = 3.0    # Adaptive timeout = timeoutMultiplier x the stage's timeoutPercentile latency
+        self.minAdaptiveTimeout = 5     # Lower bound of an adaptive timeout in seconds, openAiRequestTimeout is the upper bound
+        self.hedgeRequests = False      # Send a duplicate of a request still running after the stage's hedgePercentile latency and use the first answer
+        self.hedgePercentile = 95       # Latency percentile after which a request is hedged
+        self.hedgeMaxRate = 0.05        # Most requests that may be hedged, as a share of all requests, to protect the quota
+        self.latencyWindow = 200        # Recent latencies kept per stage
+        self.latencyMinSamples = 20     # Latencies a stage needs before its timeout or hedge delay adapts
+        self.chatDeployments = None     # Pool of equivalent chat deployments, e.g. [{"endpoint": "https://x.openai.azure.com/", "deployment": "StudioLarge", "api_key_env": "X_KEY", "weight": 2}], None for azureDeploymentName alone
+        self.embeddingDeployments = None    # Pool of equivalent embedding deployments in the same form, None for the single embedding deployment
+        self.deploymentPolicy = "least_outstanding"     # "least_outstanding" or "weighted" (smooth weighted round robin) routing over a pool
+        self.deploymentEjectSeconds = 30    # Seconds a throttled or failing pool member is left out of routing, unless a 429 says otherwise
+        self.retryRules = None          # Overrides of RetryPolicy.DEFAULT_RETRY_RULES by error class, e.g. {"rate_limit": {"attempts": 10, "min_wait": 2, "max_wait": 60}}
+        self.retryBudgetRatio = 0.2     # Retries allowed on top of retryBudgetMinimum, as a share of all calls made
+        self.retryBudgetMinimum = 10    # Retries always allowed, however few calls have been made
+        self.circuitFailureThreshold = 5    # Consecutive 5xx, timeout or connection errors that open an endpoint's circuit
+        self.circuitCooldown = 30       # Seconds an open circuit fails calls fast before letting a probe through
+        self.runDeadlineSeconds = None  # Wall-clock limit of a run, questions not finished by then are marked unprocessed. None for no limit
+        self.runDeadlineAt = None       # Epoch time of the run deadline, set by run_tests and run_queue_worker from runDeadlineSeconds
         self.summaryWordCount = 50      # 50 word summary
         self.chunkDurationMins = 10     # 10 minute long video clips
         self.maxTokens = 4096           # Upper limit on total tokens in an API call. 10 minutes of video = 600 words = 2400 tokens, plus approx 2x headroom
         self.discardIfBelow = 100       # Dont index if less than 100 tokens in an article
+        self.chunkCompactionThreshold = None    # Merge chunks at or above this cosine similarity before searching, None to disable
+        self.chunkIndexDir = None       # Directory of a memory-mapped chunk index (built with ChunkIndex.py), None to search the chunk JSON in memory
+        self.searchBlockSize = 8192     # Chunks scored per block, made smaller so processingThreads blocks fit in 256MB
+        self.processingWorkers = 1      # Worker processes for process_questions, above 1 the chunk index is shared with the workers
+        self.searchShards = 1           # Local shard processes the chunk index is split across, above 1 searches are scattered and gathered
+        self.searchShardAddresses = None    # "host:port" addresses of shard servers already running, in shard order. Overrides searchShards
+        self.articleFanOut = None       # Articles whose chunks are re-ranked after the coarse per-article pass, None scans every chunk
+        self.articleKeyField = "filename"   # Chunk field that identifies the source article for the two-level index
+        self.articleFanOutAudit = False     # Also run a full scan per question and report how often the two-level result differs
+        self.retrievalMode = "dense"    # "dense" for embedding similarity, "lexical" for BM25 over the chunk summaries with no embedding calls, "hybrid" to fuse both
+        self.lexicalHitThreshold = 0.15     # Share of the highest possible BM25 score above which a lexical-only search counts as a hit, about a third of the query term weight matched once
+        self.hybridCandidates = 50      # Chunks taken from each of the dense and BM25 rankings before fusion
+        self.fuseFollowUpStages = False     # Generate the follow-up question and its on-topic check in one JSON completion
+        self.stageGraph = False         # Run each question's stages as a dependency graph, the Gemini judge alongside the search and follow-up
+        self.streamingPipeline = False  # Stream the questions through the stages over bounded queues, writing each result as it is judged
+        self.streamQueueSize = 16       # Questions each queue between two streaming stages holds before the stage feeding it waits
+        self.logJsonLines = False       # Write log records as JSON lines rather than plain text
+        self.logFile = None             # File log records are also written to, None for the console only
+        self.logPayloadSampleRate = 1.0     # Share of the calls whose request and response payloads are logged
+        self.logPayloadMaxChars = 2000  # Characters of a logged payload kept, 0 to keep them all
+        self.profileStages = False      # Profile CPU time and memory by stage and save a pstats file and a stage table with the results
+        self.profileMemory = True       # Trace memory with tracemalloc when profiling, which slows the run down further
+        self.profileDir = None          # Directory the profile is saved to, None for the test destination directory
+        self.enrichmentBatchSize = 1    # Questions enriched per chat completion, 1 sends each question on its own
+        self.enrichmentAuditSample = 0  # Questions enriched both singly and batched to compare the two, 0 to skip the comparison
+        self.questionGenerationShardSize = None     # Persona questions per concurrent JSON request, None asks for all of them in one completion
+        self.questionDedupThreshold = None      # Drop generated questions at or above this cosine similarity to an earlier one, None keeps every question
+        self.regenerateDuplicateQuestions = False   # Ask the persona for replacements for the questions removed as duplicates
+        self.followUpTopicClassifier = False    # Judge follow-ups locally by embedding similarity, asking the LLM only inside the uncertainty band
+        self.topicClassifierBand = None         # (lower, upper) uncertainty band of the topic classifier score, None for TopicClassifier.DEFAULT_TOPIC_BAND, or DEFAULT_PROTOTYPE_BAND with off-topic prototypes
+        self.topicPrototypeFile = None          # JSON file of {"on_topic": [...], "off_topic": [...]} example questions, None to use the knowledge-base centroid
+        self.topicClassifierAuditRate = 0.0     # Share of confident follow-ups also sent to the LLM for the agreement report
+        self.adaptiveStopping = False   # Process questions in random order and stop once the run metrics' confidence intervals are narrow enough
+        self.adaptiveTargetWidths = None    # Interval width per metric ("hit_rate", "hit_relevance", "gemini_score"), None for SequentialStopping.DEFAULT_TARGET_WIDTHS
+        self.adaptiveConfidence = 0.95  # Confidence level of the adaptive run's intervals
+        self.adaptiveMinQuestions = 20  # Questions always processed before the intervals are trusted
+        self.adaptiveMaxQuestions = None    # Question budget of an adaptive run, None for every generated question
+        self.adaptiveCostBudget = None  # Estimated API call budget of an adaptive run, None for no limit
+        self.adaptiveBatchSize = 10     # Questions processed between stop checks
+        self.adaptiveSeed = 0           # Seed of the adaptive run's question order
+        self.queueLeaseSize = 5         # Questions a queue worker leases and processes at a time
+        self.queueVisibilityTimeout = 600   # Seconds before an unfinished queue lease expires and its questions are handed to another worker
+        self.queueMaxAttempts = 3       # Leases a queued question gets before it is marked as failed
+        self.resultsDatabase = None     # SQLite results database (see ResultsStore.py) every run is also saved to, None for the JSON file only
+        self.runId = None               # Label of the run in the results database, e.g. "run3"
+        self.planCacheHitRates = None   # Share of each stage's requests the --plan estimate expects to be served without an API call, e.g. {"on_topic": 0.8} with the topic classifier
+        self.planTokenPrices = None     # USD per 1,000 tokens by "chat_input", "chat_output", "embedding", "gemini_input", "gemini_output", None for RunPlanner.DEFAULT_TOKEN_PRICES
+        self.planStageLatency = None    # Seconds per request by endpoint ("chat", "embedding", "gemini"), None for RunPlanner.DEFAULT_STAGE_LATENCY
+        self.planRateLimits = None      # Quota by endpoint, e.g. {"chat": {"requests_per_minute": 300, "tokens_per_minute": 40000}}, None for no limit
+        self.shortCircuitRules = None   # Rule names from ShortCircuitPolicy.DEFAULT_RULES that skip the remaining stages of a failed question, None runs every stage
         self.GeminiApiKey = GEMINI_API_KEY
         self.GeminiServiceEndpoint = GEMINI_SERVICE_ENDPOINT
 
@@ -60,9 +133,82 @@ class ApiConfiguration:
     embedModelName: str
     processingThreads: int
     openAiRequestTimeout: int
+    httpMaxConnections: int
+    httpKeepAliveExpiry: float
+    httpHttp2: bool
+    adaptiveTimeouts: bool
+    timeoutPercentile: float
+    timeoutMultiplier: float
+    minAdaptiveTimeout: float
+    hedgeRequests: bool
+    hedgePercentile: float
+    hedgeMaxRate: float
+    latencyWindow: int
+    latencyMinSamples: int
+    chatDeployments: list
+    embeddingDeployments: list
+    deploymentPolicy: str
+    deploymentEjectSeconds: float
+    retryRules: dict
+    retryBudgetRatio: float
+    retryBudgetMinimum: int
+    circuitFailureThreshold: int
+    circuitCooldown: float
+    runDeadlineSeconds: float
+    runDeadlineAt: float
     summaryWordCount: int
     chunkDurationMins: int
     maxTokens: int
     discardIfBelow: int 
+    chunkCompactionThreshold: float
+    chunkIndexDir: str
+    searchBlockSize: int
+    processingWorkers: int
+    searchShards: int
+    searchShardAddresses: list
+    articleFanOut: int
+    articleKeyField: str
+    articleFanOutAudit: bool
+    retrievalMode: str
+    lexicalHitThreshold: float
+    hybridCandidates: int
+    fuseFollowUpStages: bool
+    stageGraph: bool
+    streamingPipeline: bool
+    streamQueueSize: int
+    logJsonLines: bool
+    logFile: str
+    logPayloadSampleRate: float
+    logPayloadMaxChars: int
+    profileStages: bool
+    profileMemory: bool
+    profileDir: str
+    enrichmentBatchSize: int
+    enrichmentAuditSample: int
+    questionGenerationShardSize: int
+    questionDedupThreshold: float
+    regenerateDuplicateQuestions: bool
+    followUpTopicClassifier: bool
+    topicClassifierBand: tuple
+    topicPrototypeFile: str
+    topicClassifierAuditRate: float
+    adaptiveStopping: bool
+    adaptiveTargetWidths: dict
+    adaptiveConfidence: float
+    adaptiveMinQuestions: int
+    adaptiveMaxQuestions: int
+    adaptiveCostBudget: int
+    adaptiveBatchSize: int
+    adaptiveSeed: int
+    queueLeaseSize: int
+    queueVisibilityTimeout: int
+    queueMaxAttempts: int
+    resultsDatabase: str
+    runId: str
+    planCacheHitRates: dict
+    planTokenPrices: dict
+    planStageLatency: dict
+    planRateLimits: dict
+    shortCircuitRules: list
     GeminiApiKey: str
     GeminiServiceEndpoint: str
\ No newline at end of file
@@ -0,0 +1,175 @@
+# Standard library imports
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.util import Finalize
+from typing import Any, Dict, List, Optional
+
+from common.ApiConfiguration import ApiConfiguration
+
+# The format logging.basicConfig uses, kept so the console output looks as it always has
+PLAIN_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Attributes every LogRecord has, left out of the extra fields of a JSON line
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Formats a record as one JSON object per line, with the time, level, logger, thread and message, any
+        fields passed with extra=..., and the traceback if there is one.
+        """
+        line = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        line.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+class AsyncQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Hands the record over as it is. The message is formatted by the writer thread, not the calling thread, so
+        arguments passed to a log call must not be changed after it.
+        """
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # A forked worker inherits the handler but not the writer thread, so it starts its own
+        if _writer.get("pid") != os.getpid() or "listener" not in _writer:
+            with _writer_lock:
+                if _writer.get("pid") != os.getpid() or "listener" not in _writer:
+                    _start_writer(_writer["handlers"])
+        super().emit(record)
+
+
+class TruncatedPayload:
+    def __init__(self, payload: Any, max_chars: int) -> None:
+        """
+        Wraps a payload so it is only turned into text, and cut to max_chars, when the writer thread formats it.
+
+        :param payload: The request or response to log.
+        :param max_chars: The characters kept, 0 to keep them all.
+
+        :return: Nothing is returned by this method.
+        """
+        self.payload = payload
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        text = str(self.payload)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... [{len(text) - self.max_chars} more characters]"
+        return text
+
+
+# The writer thread of this process, its queue and handlers, and the payload log settings
+_writer: Dict[str, Any] = {}
+_writer_lock = threading.Lock()
+_payload_settings = {"sample_rate": 1.0, "max_chars": 0}
+
+
+def setup_logging(config: ApiConfiguration = None, level: int = logging.INFO) -> None:
+    """
+    Sends every log record through a queue to a background writer thread, so a log call on a request thread
+    costs a queue put rather than formatting and console I/O. Replaces the root logger's handlers.
+
+    Without a configuration, logging is set up once to the console in the usual format and later calls do nothing,
+    so modules can call it on import. With one, logging is set up again from config.logJsonLines, config.logFile,
+    config.logPayloadSampleRate and config.logPayloadMaxChars.
+
+    :param config: The ApiConfiguration holding the logging settings, or None for the defaults.
+    :param level: The root logger level.
+
+    :return: Nothing is returned by this method.
+    """
+    with _writer_lock:
+        if config is None and _writer:
+            return
+
+        formatter = JsonLinesFormatter() if config is not None and config.logJsonLines else logging.Formatter(PLAIN_FORMAT)
+        handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+        if config is not None and config.logFile:
+            handlers.append(logging.FileHandler(config.logFile, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        if config is not None:
+            _payload_settings["sample_rate"] = config.logPayloadSampleRate
+            _payload_settings["max_chars"] = config.logPayloadMaxChars
+
+        _stop_writer()
+        for handler in _writer.get("handlers", []):
+            handler.close()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(_start_writer(handlers))
+        root.setLevel(level)
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, level: int = logging.INFO) -> None:
+    """
+    Logs a request or response payload for a sample of the calls, cut to the configured length. Neither the
+    sampling nor the cut formats the payload on the calling thread.
+
+    :param logger: The logger.
+    :param message: The message, with one "%s" for the payload.
+    :param payload: The payload.
+    :param level: The level to log at.
+
+    :return: Nothing is returned by this method.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if _payload_settings["sample_rate"] < 1.0 and random.random() >= _payload_settings["sample_rate"]:
+        return
+    logger.log(level, message, TruncatedPayload(payload, _payload_settings["max_chars"]))
+
+
+def flush_logging() -> None:
+    """
+    Writes out every record still queued and stops the writer thread. Logging after this starts it again.
+    """
+    with _writer_lock:
+        _stop_writer()
+
+
+def _start_writer(handlers: List[logging.Handler]) -> AsyncQueueHandler:
+    """
+    Starts this process's writer thread and returns a handler feeding it, reusing the existing handler if there is one.
+    """
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    handler = _writer.get("handler") or AsyncQueueHandler(records)
+    handler.queue = records
+    if _writer.get("pid") != os.getpid():
+        # A worker process ends without running atexit, but it does run multiprocessing finalizers
+        Finalize(None, flush_logging, exitpriority=0)
+    _writer.update(pid=os.getpid(), queue=records, listener=listener, handlers=handlers, handler=handler)
+    return handler
+
+
+def _stop_writer() -> None:
+    listener: Optional[QueueListener] = _writer.get("listener")
+    if listener is not None and _writer.get("pid") == os.getpid():
+        listener.stop()
+    _writer.pop("listener", None)
+
+
+atexit.register(flush_logging)
@@ -0,0 +1,126 @@
+# Standard library imports
+import os
+import threading
+from typing import Dict, Any
+
+# Third-party imports
+import httpx
+from openai import AzureOpenAI, DefaultHttpxClient
+
+from common.ApiConfiguration import ApiConfiguration
+
+
+class ClientFactory:
+    def __init__(self, config: ApiConfiguration) -> None:
+        """
+        Builds the Azure OpenAI clients for chat and embeddings on top of one shared HTTP connection pool, so
+        every call reuses kept-alive TLS connections instead of each client opening its own.
+
+        :param config: The ApiConfiguration holding the endpoints, key and HTTP pool settings.
+
+        :return: Nothing is returned by this method.
+        """
+        self.config = config
+        self._http_client: httpx.Client = None
+        self._clients: Dict[Any, AzureOpenAI] = {}
+        self._lock = threading.Lock()
+
+    def http_client(self) -> httpx.Client:
+        """
+        Returns the shared HTTP client, creating it on first use.
+
+        :return: An httpx client with keep-alive connection limits sized to the configured concurrency.
+        """
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=connection_limit(self.config),
+                        max_keepalive_connections=connection_limit(self.config),
+                        keepalive_expiry=self.config.httpKeepAliveExpiry,
+                    ),
+                    http2=self.config.httpHttp2,            # Needs the h2 package
+                    timeout=self.config.openAiRequestTimeout,
+                )
+            return self._http_client
+
+    def client(self, task: str) -> AzureOpenAI:
+        """
+        Returns the client for a task, creating it on first use. Every client shares the same HTTP connection pool.
+
+        :param task: The task the client is for, "chat" or "embedding".
+
+        :return: The AzureOpenAI client.
+        """
+        endpoints = {"chat": self.config.resourceChatCompletionEndpoint, "embedding": self.config.resourceEmbeddingEndpoint}
+        if task not in endpoints:
+            raise ValueError(f"Unknown client task: {task}")
+
+        http_client = self.http_client()
+        with self._lock:
+            if task not in self._clients:
+                self._clients[task] = AzureOpenAI(
+                    azure_endpoint=endpoints[task],
+                    api_key=self.config.apiKey.strip(),
+                    api_version=self.config.apiVersion,
+                    http_client=http_client,
+                )
+            return self._clients[task]
+
+    def client_for(self, endpoint: str, api_key: str) -> AzureOpenAI:
+        """
+        Returns the client for a member of a deployment pool, creating it on first use on the shared HTTP connection pool.
+
+        :param endpoint: The Azure OpenAI resource endpoint.
+        :param api_key: The key of the resource.
+
+        :return: The AzureOpenAI client.
+        """
+        http_client = self.http_client()
+        with self._lock:
+            if (endpoint, api_key) not in self._clients:
+                self._clients[(endpoint, api_key)] = AzureOpenAI(
+                    azure_endpoint=endpoint,
+                    api_key=api_key,
+                    api_version=self.config.apiVersion,
+                    http_client=http_client,
+                )
+            return self._clients[(endpoint, api_key)]
+
+    def close(self) -> None:
+        """
+        Closes the shared HTTP connection pool. Clients handed out before are unusable afterwards.
+        """
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._clients = {}
+
+
+def connection_limit(config: ApiConfiguration) -> int:
+    """
+    Returns the size of the shared connection pool: config.httpMaxConnections, or enough for a chat and an
+    embedding call in flight on every processing thread, for each member of the largest deployment pool.
+    """
+    return config.httpMaxConnections or (2 * config.processingThreads + 2) * max(1, len(config.chatDeployments or ()), len(config.embeddingDeployments or ()))
+
+
+# One factory per process, so forked workers never share the parent's sockets
+_factories: Dict[int, ClientFactory] = {}
+_factories_lock = threading.Lock()
+
+
+def get_client_factory(config: ApiConfiguration) -> ClientFactory:
+    """
+    Returns this process's shared client factory, creating it from the configuration on first use.
+
+    :param config: The ApiConfiguration used if the factory does not exist yet.
+
+    :return: The ClientFactory shared by everything in this process.
+    """
+    with _factories_lock:
+        factory = _factories.get(os.getpid())
+        if factory is None:
+            factory = _factories[os.getpid()] = ClientFactory(config)
+        return factory
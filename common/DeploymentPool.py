@@ -0,0 +1,219 @@
+# Standard library imports
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional, TypeVar
+
+from openai import AzureOpenAI
+
+from common.ApiConfiguration import ApiConfiguration
+from common.ClientFactory import get_client_factory
+from common.RetryPolicy import classify_error, OUTAGE_ERRORS
+
+T = TypeVar("T")
+
+# Routing policies
+LEAST_OUTSTANDING = "least_outstanding"
+WEIGHTED = "weighted"
+
+
+class Deployment:
+    def __init__(self, endpoint: str, deployment: str, api_key: str, weight: float = 1.0) -> None:
+        """
+        One member of a deployment pool: a deployment of the model on an Azure OpenAI resource, with its own quota.
+
+        :param endpoint: The Azure OpenAI resource endpoint, e.g. "https://studiomodels2.openai.azure.com/".
+        :param deployment: The deployment name sent as the model.
+        :param api_key: The key of the resource.
+        :param weight: The member's share of the traffic relative to the others, e.g. its quota.
+
+        :return: Nothing is returned by this method.
+        """
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.api_key = api_key
+        self.weight = weight
+        self.outstanding = 0            # Requests in flight
+        self.ejected_until = 0.0        # Monotonic time the member is left out of routing until
+        self.current_weight = 0.0       # Smooth weighted round-robin state
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint}#{self.deployment}"
+
+
+class DeploymentPool:
+    def __init__(self, config: ApiConfiguration, task: str, members: List[Deployment]) -> None:
+        """
+        Routes the requests of one task over a pool of equivalent deployments, so throughput grows with each
+        deployment's quota. A member that is throttled or failing is ejected from routing for a while.
+
+        :param config: The ApiConfiguration holding the routing policy and ejection time.
+        :param task: The task the pool serves, "chat" or "embedding".
+        :param members: The deployments.
+
+        :return: Nothing is returned by this method.
+        """
+        if not members:
+            raise ValueError(f"Deployment pool for {task} has no members")
+        if config.deploymentPolicy not in (LEAST_OUTSTANDING, WEIGHTED):
+            raise ValueError(f"Unknown deployment policy: {config.deploymentPolicy}")
+        self.config = config
+        self.task = task
+        self.members = members
+        self._lock = threading.Lock()
+
+    def call(self, request: Callable[[AzureOpenAI, str], T]) -> T:
+        """
+        Sends a request to the member chosen by the routing policy. If the member is throttled or failing it is
+        ejected and the request goes straight to another healthy member, without waiting for a retry.
+
+        :param request: Makes the request with the member's client and deployment name and returns the response.
+
+        :return: The response.
+
+        :raises Exception: The last member's error, once no healthy member is left to fail over to.
+        """
+        while True:
+            member = self._acquire()
+            try:
+                response = request(get_client_factory(self.config).client_for(member.endpoint, member.api_key), member.deployment)
+            except Exception as e:
+                if not self._release(member, e) or not self._has_healthy_member():
+                    raise
+                continue
+            self._release(member, None)
+            return response
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the requests, errors and ejections of each member.
+        """
+        with self._lock:
+            return {member.name: {"requests": member.requests, "errors": member.errors, "ejections": member.ejections} for member in self.members}
+
+    def _acquire(self) -> Deployment:
+        """
+        Chooses a member that is not ejected, or the one coming back soonest if all are, and counts the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            healthy = [member for member in self.members if member.ejected_until <= now]
+            if not healthy:
+                healthy = [min(self.members, key=lambda member: member.ejected_until)]
+
+            if self.config.deploymentPolicy == LEAST_OUTSTANDING:
+                fewest = min(member.outstanding / member.weight for member in healthy)
+                member = random.choice([member for member in healthy if member.outstanding / member.weight == fewest])
+            else:
+                # Smooth weighted round robin: spreads each member's turns evenly instead of in bursts
+                total = sum(member.weight for member in healthy)
+                for candidate in healthy:
+                    candidate.current_weight += candidate.weight
+                member = max(healthy, key=lambda candidate: candidate.current_weight)
+                member.current_weight -= total
+
+            member.outstanding += 1
+            member.requests += 1
+            return member
+
+    def _release(self, member: Deployment, error: Optional[Exception]) -> bool:
+        """
+        Counts the request as finished, ejecting the member if it was throttled or the deployment failed.
+
+        :return: True if the member was ejected.
+        """
+        with self._lock:
+            member.outstanding -= 1
+            if error is None:
+                return False
+            member.errors += 1
+            error_class = classify_error(error)
+            if error_class != "rate_limit" and error_class not in OUTAGE_ERRORS:
+                return False
+            member.ejections += 1
+            member.ejected_until = time.monotonic() + ejection_seconds(error, self.config.deploymentEjectSeconds)
+            return True
+
+    def _has_healthy_member(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            return any(member.ejected_until <= now for member in self.members)
+
+
+def ejection_seconds(error: Exception, default: float) -> float:
+    """
+    Returns how long to eject a member for: the Retry-After of a 429 if the API sent one, otherwise the default.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after) if retry_after else default
+    except ValueError:
+        return default
+
+
+def build_pool(config: ApiConfiguration, task: str) -> Optional[DeploymentPool]:
+    """
+    Builds the pool of a task from config.chatDeployments or config.embeddingDeployments.
+
+    Each entry is a dictionary with "endpoint", "deployment", optionally "weight", and the resource key either
+    as "api_key_env", the environment variable holding it, or not at all to use the main key.
+
+    :param config: The ApiConfiguration.
+    :param task: "chat" or "embedding".
+
+    :return: The DeploymentPool, or None if no pool is configured for the task.
+    """
+    entries = config.chatDeployments if task == "chat" else config.embeddingDeployments
+    if not entries:
+        return None
+    members = []
+    for entry in entries:
+        api_key = os.getenv(entry["api_key_env"]) if entry.get("api_key_env") else config.apiKey
+        if not api_key:
+            raise EnvironmentError(f"No API key for deployment {entry['deployment']} at {entry['endpoint']}")
+        members.append(Deployment(entry["endpoint"], entry["deployment"], api_key.strip(), entry.get("weight", 1.0)))
+    return DeploymentPool(config, task, members)
+
+
+# One set of pools per process, so the outstanding counts of forked workers are their own
+_pools: Dict[int, Dict[str, Optional[DeploymentPool]]] = {}
+_pools_lock = threading.Lock()
+
+
+def get_deployment_pool(config: ApiConfiguration, task: str) -> Optional[DeploymentPool]:
+    """
+    Returns this process's deployment pool for a task, building it from the configuration on first use.
+
+    :param config: The ApiConfiguration used if the pool does not exist yet.
+    :param task: "chat" or "embedding".
+
+    :return: The DeploymentPool, or None if the task uses the single configured deployment.
+    """
+    with _pools_lock:
+        pools = _pools.setdefault(os.getpid(), {})
+        if task not in pools:
+            pools[task] = build_pool(config, task)
+        return pools[task]
+
+
+def route_request(config: ApiConfiguration, task: str, client: AzureOpenAI, request: Callable[[AzureOpenAI, Optional[str]], T]) -> T:
+    """
+    Sends a request through the task's deployment pool, or to the given client when no pool is configured.
+
+    :param config: The ApiConfiguration.
+    :param task: "chat" or "embedding".
+    :param client: The client of the single configured deployment.
+    :param request: Makes the request with a client and a deployment name, None for the configured default.
+
+    :return: The response.
+    """
+    pool = get_deployment_pool(config, task)
+    if pool is None:
+        return request(client, None)
+    return pool.call(request)
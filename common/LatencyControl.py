@@ -0,0 +1,209 @@
+# Standard library imports
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Any, Optional, TypeVar
+
+import numpy as np
+
+from common.ApiConfiguration import ApiConfiguration
+from common.ClientFactory import connection_limit
+
+T = TypeVar("T")
+
+
+class LatencyController:
+    def __init__(self, config: ApiConfiguration) -> None:
+        """
+        Tracks rolling API latency per stage and uses it to cut the tail of slow requests.
+
+        With adaptive timeouts, a stage's timeout is a multiple of its recent high percentile instead of the fixed
+        openAiRequestTimeout, so a stalled request fails (and is retried) in seconds rather than a minute. With
+        hedging, a request still running after the stage's hedge percentile gets a duplicate, and whichever
+        answers first is used. The share of requests that may be hedged is capped to protect the quota.
+
+        :param config: The ApiConfiguration holding the latency settings.
+
+        :return: Nothing is returned by this method.
+        """
+        self.config = config
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._executor: ThreadPoolExecutor = None
+        self._workers = 2 * connection_limit(config)     # Room for a primary and a hedge per pooled connection
+        self._busy = 0                                  # Executor workers taken by requests running or about to run
+
+    def call(self, stage: str, request: Callable[[float], T]) -> T:
+        """
+        Runs one API request under the stage's timeout, hedging it if it runs long.
+
+        :param stage: The pipeline stage the request belongs to, e.g. "enrichment" or "embedding".
+        :param request: Makes the request with the given timeout in seconds and returns the response.
+
+        :return: The first successful response.
+        """
+        timeout = self.timeout(stage)
+        with self._lock:
+            self._requests += 1
+        hedge_delay = self.percentile(stage, self.config.hedgePercentile) if self.config.hedgeRequests else None
+
+        if hedge_delay is None:
+            response, elapsed = _timed(request, timeout)
+            self.record(stage, elapsed)
+            return response
+
+        # A request queued behind the ones it is meant to race would spend its hedge delay waiting, so requests are
+        # only handed to the executor while it has a worker free, and otherwise run here without a hedge
+        if not self._reserve_worker():
+            response, elapsed = _timed(request, timeout)
+            self.record(stage, elapsed)
+            return response
+
+        executor = self._get_executor()
+        futures = [self._submit(executor, request, timeout)]
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done and self._reserve_worker():
+            if self._allow_hedge():
+                futures.append(self._submit(executor, request, timeout))
+            else:
+                self._release_worker()
+
+        # The losing request cannot be aborted mid-flight, its response is discarded when it arrives
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    response, elapsed = future.result()
+                    self.record(stage, elapsed)
+                    if future is not futures[0]:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return response
+                error = future.exception()
+        raise error
+
+    def timeout(self, stage: str) -> float:
+        """
+        Returns the timeout for the stage's next request: a multiple of its timeout percentile, bounded by
+        minAdaptiveTimeout and openAiRequestTimeout, or openAiRequestTimeout until enough latencies are known.
+        """
+        if not self.config.adaptiveTimeouts:
+            return self.config.openAiRequestTimeout
+        latency = self.percentile(stage, self.config.timeoutPercentile)
+        if latency is None:
+            return self.config.openAiRequestTimeout
+        return min(max(latency * self.config.timeoutMultiplier, self.config.minAdaptiveTimeout), self.config.openAiRequestTimeout)
+
+    def percentile(self, stage: str, percentile: float) -> Optional[float]:
+        """
+        Returns a percentile of the stage's recent latencies in seconds, or None below latencyMinSamples of them.
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(stage, ()))
+        if len(latencies) < self.config.latencyMinSamples:
+            return None
+        return float(np.percentile(latencies, percentile))
+
+    def record(self, stage: str, elapsed: float) -> None:
+        """
+        Adds the latency of a successful request to the stage's rolling window.
+        """
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=self.config.latencyWindow)).append(elapsed)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the latency percentiles and current timeout of every stage, and how many requests were hedged.
+        """
+        with self._lock:
+            stages = {stage: list(latencies) for stage, latencies in self._latencies.items()}
+            totals = {"requests": self._requests, "hedged": self._hedges, "hedge_wins": self._hedge_wins}
+        totals["stages"] = {
+            stage: {
+                "samples": len(latencies),
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "p99": float(np.percentile(latencies, 99)),
+                "timeout": self.timeout(stage),
+            }
+            for stage, latencies in stages.items() if latencies
+        }
+        return totals
+
+    def _allow_hedge(self) -> bool:
+        """
+        Takes a hedge from the budget if fewer than hedgeMaxRate of all requests have been hedged so far.
+        """
+        with self._lock:
+            if self._hedges + 1 > self.config.hedgeMaxRate * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+    def _reserve_worker(self) -> bool:
+        """
+        Takes an executor worker for a request if one is free.
+        """
+        with self._lock:
+            if self._busy >= self._workers:
+                return False
+            self._busy += 1
+            return True
+
+    def _release_worker(self) -> None:
+        with self._lock:
+            self._busy -= 1
+
+    def _submit(self, executor: ThreadPoolExecutor, request: Callable[[float], T], timeout: float) -> Future:
+        """
+        Runs a request on a reserved executor worker, giving the worker back once the request has finished or been cancelled.
+        """
+        future = executor.submit(_timed, request, timeout)
+        future.add_done_callback(lambda _: self._release_worker())
+        return future
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """
+        Returns the thread pool hedged requests run on, room for a primary and a hedge per pooled connection.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="hedged-request")
+            return self._executor
+
+
+def _timed(request: Callable[[float], T], timeout: float) -> tuple:
+    """
+    Runs a request and returns its response with the time it took.
+    """
+    start = time.monotonic()
+    response = request(timeout)
+    return response, time.monotonic() - start
+
+
+# One controller per process, latencies are not shared with forked workers
+_controllers: Dict[int, LatencyController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_latency_controller(config: ApiConfiguration) -> LatencyController:
+    """
+    Returns this process's latency controller, creating it from the configuration on first use.
+
+    :param config: The ApiConfiguration used if the controller does not exist yet.
+
+    :return: The LatencyController shared by every API call in this process.
+    """
+    with _controllers_lock:
+        controller = _controllers.get(os.getpid())
+        if controller is None:
+            controller = _controllers[os.getpid()] = LatencyController(config)
+        return controller
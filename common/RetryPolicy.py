@@ -0,0 +1,255 @@
+# Standard library imports
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Any, TypeVar
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError, InternalServerError, OpenAIError
+
+from common.ApiConfiguration import ApiConfiguration
+
+T = TypeVar("T")
+
+# Error classes and how often and how long to retry each. Errors not listed (bad requests, authentication, other 4xx) are never retried.
+DEFAULT_RETRY_RULES = {
+    "rate_limit": {"attempts": 8, "min_wait": 2.0, "max_wait": 30.0},    # 429, the Retry-After header wins when the API sends one
+    "server": {"attempts": 4, "min_wait": 1.0, "max_wait": 10.0},        # 5xx
+    "timeout": {"attempts": 3, "min_wait": 0.5, "max_wait": 5.0},        # Request timed out
+    "connection": {"attempts": 4, "min_wait": 1.0, "max_wait": 10.0},    # Connection refused, reset or DNS failure
+    "other": {"attempts": 3, "min_wait": 1.0, "max_wait": 5.0},          # Anything else raised while handling the response
+}
+
+# Error classes that count towards opening an endpoint's circuit. A 429 is back-pressure, not an outage.
+OUTAGE_ERRORS = {"server", "timeout", "connection"}
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised without calling the API while an endpoint's circuit is open after repeated failures.
+    """
+
+
+class RunDeadlineExceeded(RuntimeError):
+    """
+    Raised instead of calling or waiting once the run deadline has passed.
+    """
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float) -> None:
+        """
+        Initialises a circuit breaker for one endpoint.
+
+        :param failure_threshold: Consecutive outage errors after which the circuit opens.
+        :param cooldown: Seconds the circuit stays open before one probe request is let through.
+
+        :return: Nothing is returned by this method.
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Checks whether a request may be sent: always while closed, one probe at a time once the cooldown has passed.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        """
+        Closes the circuit.
+        """
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        """
+        Counts an outage error, opening the circuit at the threshold or re-opening it after a failed probe.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def record_inconclusive(self) -> None:
+        """
+        Ends a probe that failed with an error saying nothing about an outage, e.g. a 429 or a bad request, leaving the
+        circuit as it is so the next request probes again.
+        """
+        with self._lock:
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return "closed" if self._opened_at is None else "half_open" if self._probing else "open"
+
+
+class RetryPolicy:
+    def __init__(self, config: ApiConfiguration) -> None:
+        """
+        Retries API calls by error class, within a retry budget shared by the whole process, behind a circuit
+        breaker per endpoint and up to the run deadline.
+
+        :param config: The ApiConfiguration holding the retry settings and the run deadline.
+
+        :return: Nothing is returned by this method.
+        """
+        self.config = config
+        self.rules = {**DEFAULT_RETRY_RULES, **(config.retryRules or {})}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retries = 0
+
+    def call(self, endpoint: str, request: Callable[[], T]) -> T:
+        """
+        Makes a request, retrying it according to the rule for each error it raises.
+
+        :param endpoint: The endpoint the request goes to, "chat" or "embedding", each with its own circuit.
+        :param request: Makes the request and returns the response.
+
+        :return: The response.
+
+        :raises CircuitOpenError: If the endpoint's circuit is open.
+        :raises RunDeadlineExceeded: If the run deadline passes before a response.
+        :raises OpenAIError: The last error, once it may not be retried any more.
+        """
+        breaker = self._breaker(endpoint)
+        with self._lock:
+            self._calls += 1
+
+        attempt = 0
+        while True:
+            self.check_deadline()
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit for the {endpoint} endpoint is open after repeated failures")
+
+            attempt += 1
+            try:
+                response = request()
+            except Exception as e:
+                error_class = classify_error(e)
+                if error_class in OUTAGE_ERRORS:
+                    breaker.record_failure()
+                else:
+                    breaker.record_inconclusive()
+                rule = self.rules.get(error_class)
+                if rule is None or attempt >= rule["attempts"] or not self._take_retry():
+                    raise
+                self._sleep(retry_wait(e, rule, attempt))
+                continue
+
+            breaker.record_success()
+            return response
+
+    def check_deadline(self) -> None:
+        """
+        Raises RunDeadlineExceeded if the run deadline has passed.
+        """
+        if self.deadline_passed():
+            raise RunDeadlineExceeded("Run deadline passed")
+
+    def deadline_passed(self) -> bool:
+        """
+        Checks whether the run deadline, set by run_tests or run_queue_worker in config.runDeadlineAt, has passed.
+        """
+        return self.config.runDeadlineAt is not None and time.time() >= self.config.runDeadlineAt
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the calls made, the retries spent and each endpoint's circuit state.
+        """
+        with self._lock:
+            return {"calls": self._calls, "retries": self._retries, "circuits": {endpoint: breaker.state for endpoint, breaker in self._breakers.items()}}
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(self.config.circuitFailureThreshold, self.config.circuitCooldown)
+            return self._breakers[endpoint]
+
+    def _take_retry(self) -> bool:
+        """
+        Takes a retry from the budget, which allows retryBudgetMinimum retries plus retryBudgetRatio of all calls.
+        """
+        with self._lock:
+            if self._retries >= self.config.retryBudgetMinimum + self.config.retryBudgetRatio * self._calls:
+                return False
+            self._retries += 1
+            return True
+
+    def _sleep(self, seconds: float) -> None:
+        """
+        Waits before a retry, but never past the run deadline.
+        """
+        if self.config.runDeadlineAt is not None:
+            seconds = min(seconds, max(0.0, self.config.runDeadlineAt - time.time()))
+        time.sleep(seconds)
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Returns the retry rule name for an error, or "fatal" for errors that must not be retried.
+    """
+    if isinstance(error, (CircuitOpenError, RunDeadlineExceeded)):
+        return "fatal"
+    if isinstance(error, RateLimitError):
+        return "rate_limit"
+    if isinstance(error, APITimeoutError):
+        return "timeout"
+    if isinstance(error, APIConnectionError):
+        return "connection"
+    if isinstance(error, InternalServerError) or (isinstance(error, APIStatusError) and error.status_code >= 500):
+        return "server"
+    if isinstance(error, OpenAIError):
+        return "fatal"
+    return "other"
+
+
+def retry_wait(error: Exception, rule: Dict[str, float], attempt: int) -> float:
+    """
+    Returns the seconds to wait before the next attempt: the Retry-After header if the API sent one, otherwise
+    exponential backoff with full jitter between the rule's minimum and maximum waits.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), rule["max_wait"])
+        except ValueError:
+            pass
+    return rule["min_wait"] + random.uniform(0, min(rule["max_wait"] - rule["min_wait"], rule["min_wait"] * 2 ** (attempt - 1)))
+
+
+# One policy per process, the retry budget and circuits are not shared with forked workers
+_policies: Dict[int, RetryPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(config: ApiConfiguration) -> RetryPolicy:
+    """
+    Returns this process's retry policy, creating it from the configuration on first use.
+
+    :param config: The ApiConfiguration used if the policy does not exist yet.
+
+    :return: The RetryPolicy shared by every API call in this process.
+    """
+    with _policies_lock:
+        policy = _policies.get(os.getpid())
+        if policy is None:
+            policy = _policies[os.getpid()] = RetryPolicy(config)
+        return policy
@@ -1,5 +1,7 @@
 # Standard library imports
 import os
+from typing import List, Dict, Any, Tuple
+import numpy as np
 from openai import AzureOpenAI
 
 from common.ApiConfiguration import ApiConfiguration
@@ -26,7 +28,7 @@ def ensure_directory_exists(directory):
 HTML_DESTINATION_DIR = os.path.join("data", "web")
 ensure_directory_exists(HTML_DESTINATION_DIR)
 
-def get_embedding(text: str, embedding_client: AzureOpenAI, config: ApiConfiguration, model: str = "text-embedding-3-large"):
+def get_embedding(text: str, embedding_client: AzureOpenAI, config: ApiConfiguration, model: str = "text-embedding-3-large", timeout: float = None):
     # Replace newlines with spaces 
     text = text.replace("\n", " ")
 
@@ -37,7 +39,64 @@ def get_embedding(text: str, embedding_client: AzureOpenAI, config: ApiConfigura
     response = embedding_client.embeddings.create(
         input=[text],
         model=chosen_model,
-        timeout=config.openAiRequestTimeout
+        timeout=timeout or config.openAiRequestTimeout
     )
     
     return response.data[0].embedding
+
+
+def get_embeddings(texts: List[str], embedding_client: AzureOpenAI, config: ApiConfiguration, model: str = "text-embedding-3-large", batch_size: int = 2048, timeout: float = None) -> List[List[float]]:
+    """
+    Generates embeddings for several texts, sending up to batch_size texts per request.
+
+    Parameters:
+    texts (List[str]): The texts to embed.
+    embedding_client (AzureOpenAI): The embeddings client.
+    config (ApiConfiguration): The API configuration.
+    model (str): The embedding model, falling back to config.embedModelName if empty.
+    batch_size (int): Texts per request. 2048 is the most the embeddings API accepts.
+    timeout (float): Seconds per request, config.openAiRequestTimeout if not given.
+
+    Returns:
+    List[List[float]]: One embedding per text, in the same order as the texts.
+    """
+    chosen_model = model if model else config.embedModelName
+    embeddings: List[List[float]] = []
+
+    for start in range(0, len(texts), batch_size):
+        response = embedding_client.embeddings.create(
+            input=[text.replace("\n", " ") for text in texts[start:start + batch_size]],
+            model=chosen_model,
+            timeout=timeout or config.openAiRequestTimeout
+        )
+        # The API does not promise to return the embeddings in input order, each one carries its index
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+
+    return embeddings
+
+
+def build_embedding_matrix(chunks: List[Dict[str, Any]]) -> Tuple[np.ndarray, List[int]]:
+    """
+    Stacks the embeddings of the processed chunks into a row-normalised float32 matrix.
+
+    Chunks that are not dictionaries, have no embedding or have a zero embedding are skipped, the same
+    chunks the similarity loop in process_questions cannot score.
+
+    Parameters:
+    chunks (List[Dict[str, Any]]): The processed chunks, each with an "embedding" field.
+
+    Returns:
+    Tuple[np.ndarray, List[int]]: The (n, d) matrix, and the position in chunks of each matrix row.
+    """
+    positions = [position for position, chunk in enumerate(chunks) if chunk and isinstance(chunk, dict) and chunk.get("embedding")]
+    if not positions:
+        return np.zeros((0, 0), dtype=np.float32), []
+
+    matrix = np.asarray([chunks[position]["embedding"] for position in positions], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1)
+    nonzero = norms > 0
+
+    # Dot products between rows of this matrix are cosine similarities
+    matrix = matrix[nonzero] / norms[nonzero, None]
+    positions = [position for position, keep in zip(positions, nonzero) if keep]
+    return matrix, positions
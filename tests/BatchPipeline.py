@@ -0,0 +1,376 @@
+"""
+Batch Pipeline:
+Runs the chat stages of process_questions through offline batch files instead of synchronous calls, so large
+question sets run at batch pricing and throughput.
+
+    python BatchPipeline.py prepare <state_dir> <source_dir> <test_destination_dir> <developer|tester|business_analyst|questions.json>
+    python BatchPipeline.py ingest <state_dir> <results.jsonl>
+    python BatchPipeline.py stub <requests.jsonl> <results.jsonl>
+    python BatchPipeline.py status <state_dir>
+
+Each stage depends on the one before, so a run goes through up to three batch files: enrichment, follow-up (or
+the fused follow-up), and on-topic. "prepare" writes the first; submit it to the provider's batch API and pass
+the result file to "ingest", which records the answers, runs the synchronous steps in between (retrieval, and
+the Gemini evaluation at the end) and writes the next batch file, until the results are saved. Requests missing
+from or failed in a result file are sent synchronously. "stub" answers a batch file locally, for testing.
+"""
+
+# Standard Library Imports
+import datetime
+import json
+import logging
+import os
+import sys
+from typing import List, Dict, Any, Tuple, Callable, Optional
+
+# Add the project root and scripts directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from DataTest import (
+    TestResult, configure_openai_for_azure, call_openai_chat, chat_request_body, enrichment_messages, follow_up_messages,
+    on_topic_messages, fused_follow_up_messages, parse_fused_follow_up, generate_enriched_question, generate_follow_up_question,
+    generate_follow_up_with_topic, assess_follow_up_on_topic, search_chunk_index, get_hit_threshold, build_chunk_index,
+    save_results, result_to_record, gemini_evaluator, FOLLOW_UP_PROMPT, FOLLOW_UP_ON_TOPIC_PROMPT, FUSED_FOLLOW_UP_PROMPT,
+)
+from ShortCircuitPolicy import ShortCircuitPolicy, STAGE_QUESTION, STAGE_ENRICHMENT, STAGE_FOLLOW_UP
+
+# Stages, in the order their batch files are written
+STAGE_ENRICH = "enrichment"
+STAGE_FOLLOW = "follow_up"
+STAGE_FUSED = "fused_follow_up"
+STAGE_ON_TOPIC = "on_topic"
+STAGE_DONE = "done"
+
+STATE_FILE = "state.json"
+BATCH_URL = "/chat/completions"
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPipeline:
+    def __init__(self, state_dir: str, config: ApiConfiguration, logger: logging.Logger) -> None:
+        """
+        Opens the state of a batch run, kept in state_dir between steps.
+
+        Args:
+            state_dir (str): The directory holding the run's state file and batch files.
+            config (ApiConfiguration): The API configuration instance.
+            logger (logging.Logger): The logger instance.
+
+        Returns:
+            None
+        """
+        self.state_dir = state_dir
+        self.config = config
+        self.logger = logger
+        self.short_circuit_policy = ShortCircuitPolicy(config.shortCircuitRules) if config.shortCircuitRules else None
+        self.state: Dict[str, Any] = {}
+        if os.path.exists(self._state_path()):
+            with open(self._state_path(), "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def prepare(self, questions: List[str], test_mode: str, source_dir: str, test_destination_dir: str) -> str:
+        """
+        Starts a batch run and writes its enrichment batch file.
+
+        Args:
+            questions (List[str]): The questions to process.
+            test_mode (str): The test mode used in the results file name.
+            source_dir (str): The directory of the processed chunks searched after enrichment.
+            test_destination_dir (str): The directory the results are saved to.
+
+        Returns:
+            str: The path of the batch file to submit.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        results = []
+        for question in questions:
+            result = TestResult()
+            result.question = question
+            result.skip_reason = self.short_circuit_policy.check(STAGE_QUESTION, question) if self.short_circuit_policy else ""
+            results.append(result)
+
+        self.state = {"test_mode": test_mode, "source_dir": source_dir, "test_destination_dir": test_destination_dir, "batches": [], "sync_fallbacks": 0}
+        requests = [(position, enrichment_messages(result.question), None) for position, result in enumerate(results) if not result.skip_reason]
+        return self._write_batch(STAGE_ENRICH, requests, results)
+
+    def ingest(self, result_path: str, chat_client, embedding_client) -> Optional[str]:
+        """
+        Records a batch result file and moves the run on to its next batch file, or finishes it.
+
+        Args:
+            result_path (str): The path of the provider's result file for the current batch.
+            chat_client (AzureOpenAI): The chat client, for requests missing from the result file.
+            embedding_client (AzureOpenAI): The embedding client, for retrieval.
+
+        Returns:
+            Optional[str]: The path of the next batch file to submit, or None once the results are saved.
+        """
+        stage = self.state.get("stage")
+        if stage in (None, STAGE_DONE):
+            raise ValueError(f"No batch is waiting for results in {self.state_dir}")
+
+        results = [record_to_result(record) for record in self.state["records"]]
+        answers = read_batch_results(result_path, stage)
+        self.logger.info("Batch %s returned %s answers for %s requests", stage, len(answers), len(self.state["pending"]))
+
+        if stage == STAGE_ENRICH:
+            for position in self.state["pending"]:
+                result = results[position]
+                result.enriched_question_summary = self._answer(answers, position, lambda: generate_enriched_question(chat_client, self.config, result.question, self.logger))
+                if self.short_circuit_policy is not None:
+                    result.skip_reason = self.short_circuit_policy.check(STAGE_ENRICHMENT, result.enriched_question_summary)
+            self._retrieve(results, embedding_client)
+            with_hits = [position for position in self.state["pending"] if results[position].hit_summary and not results[position].skip_reason]
+            if self.config.fuseFollowUpStages:
+                return self._write_batch(STAGE_FUSED, [(position, fused_follow_up_messages(results[position].hit_summary), {"type": "json_object"}) for position in with_hits], results)
+            return self._write_batch(STAGE_FOLLOW, [(position, follow_up_messages(results[position].hit_summary), None) for position in with_hits], results)
+
+        if stage == STAGE_FUSED:
+            for position in self.state["pending"]:
+                result = results[position]
+                try:
+                    result.follow_up, result.follow_up_on_topic = parse_fused_follow_up(answers.get(position))
+                except ValueError as e:
+                    self.logger.warning("Fused follow-up %s rejected (%s), sending it synchronously", position, e)
+                    self.state["sync_fallbacks"] += 1
+                    result.follow_up, result.follow_up_on_topic = generate_follow_up_with_topic(chat_client, self.config, result.hit_summary, self.logger)
+            return self._finish(results)
+
+        if stage == STAGE_FOLLOW:
+            for position in self.state["pending"]:
+                result = results[position]
+                result.follow_up = self._answer(answers, position, lambda: generate_follow_up_question(chat_client, self.config, result.hit_summary, self.logger))
+                if self.short_circuit_policy is not None:
+                    result.skip_reason = self.short_circuit_policy.check(STAGE_FOLLOW_UP, result.follow_up)
+            on_topic = [position for position in self.state["pending"] if not results[position].skip_reason]
+            return self._write_batch(STAGE_ON_TOPIC, [(position, on_topic_messages(results[position].follow_up), None) for position in on_topic], results)
+
+        for position in self.state["pending"]:
+            result = results[position]
+            result.follow_up_on_topic = self._answer(answers, position, lambda: assess_follow_up_on_topic(chat_client, self.config, result.follow_up, self.logger))
+        return self._finish(results)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Returns the current stage, the batch files written so far and the requests sent synchronously.
+        """
+        return {key: self.state.get(key) for key in ("stage", "batches", "sync_fallbacks", "test_mode")}
+
+    def _answer(self, answers: Dict[int, str], position: int, fallback: Callable[[], str]) -> str:
+        """
+        Returns the batch answer of a request, or sends it synchronously if the batch lost or failed it.
+        """
+        if answers.get(position) is not None:
+            return answers[position]
+        self.state["sync_fallbacks"] += 1
+        return fallback()
+
+    def _retrieve(self, results: List[TestResult], embedding_client) -> None:
+        """
+        Searches the chunk index for the enriched questions that were not skipped, the step between enrichment and follow-up.
+        """
+        chunk_index = build_chunk_index(self.config, self.state["source_dir"])
+        searchable = [position for position in self.state["pending"] if not results[position].skip_reason]
+        hits = search_chunk_index(embedding_client, self.config, chunk_index, [results[position].enriched_question_summary for position in searchable], self.logger)
+        hit_threshold = get_hit_threshold(self.config, chunk_index)
+        for position, (relevance, summary) in zip(searchable, hits):
+            results[position].hit_relevance = relevance
+            results[position].hit_summary = summary
+            results[position].hit = relevance > hit_threshold
+
+    def _finish(self, results: List[TestResult]) -> None:
+        """
+        Runs the Gemini evaluation synchronously and saves the results.
+        """
+        for result in results:
+            if not result.skip_reason:
+                result.gemini_evaluation = gemini_evaluator.evaluate(result.question, result.enriched_question_summary)
+        save_results(self.state["test_destination_dir"], results, self.state["test_mode"], self.config)
+        self.state["stage"] = STAGE_DONE
+        self.state["records"] = [result_to_record(result) for result in results]
+        self._save_state()
+        self.logger.info("Batch run finished, %s requests sent synchronously", self.state["sync_fallbacks"])
+
+    def _write_batch(self, stage: str, requests: List[Tuple[int, List[Dict[str, str]], Optional[Dict[str, str]]]], results: List[TestResult]) -> Optional[str]:
+        """
+        Writes a stage's requests as a batch file and saves the state waiting for its results. A stage with no
+        requests is skipped straight to the next one.
+        """
+        self.state["records"] = [result_to_record(result) for result in results]
+        self.state["stage"] = stage
+        self.state["pending"] = [position for position, _, _ in requests]
+        if not requests:
+            # Each later stage needs this one's answers, so with nothing to send the run is finished
+            self.logger.info("No requests for batch %s", stage)
+            return self._finish(results)
+
+        batch_path = os.path.join(self.state_dir, f"batch_{stage}_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jsonl")
+        with open(batch_path, "w", encoding="utf-8") as f:
+            for position, messages, response_format in requests:
+                f.write(json.dumps({
+                    "custom_id": f"{stage}-{position}",
+                    "method": "POST",
+                    "url": BATCH_URL,
+                    "body": chat_request_body(self.config, messages, response_format),
+                }) + "\n")
+        self.state["batches"].append(batch_path)
+        self._save_state()
+        self.logger.info("Wrote %s %s requests to %s", len(requests), stage, batch_path)
+        return batch_path
+
+    def _state_path(self) -> str:
+        return os.path.join(self.state_dir, STATE_FILE)
+
+    def _save_state(self) -> None:
+        """
+        Writes the state atomically, so an interrupted step leaves the previous state intact.
+        """
+        temp_path = self._state_path() + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(temp_path, self._state_path())
+
+
+def record_to_result(record: Dict[str, Any]) -> TestResult:
+    """
+    Rebuilds a test result from the record written by result_to_record.
+    """
+    result = TestResult()
+    result.question = record["question"]
+    result.enriched_question_summary = record["enriched_question"]
+    result.hit = record["hit"]
+    result.hit_summary = record["summary"]
+    result.hit_relevance = record["hitRelevance"]
+    result.follow_up = record["follow_up"]
+    result.follow_up_on_topic = record["follow_up_on_topic"]
+    result.follow_up_topic_score = record["follow_up_topic_score"]
+    result.follow_up_topic_source = record["follow_up_topic_source"]
+    result.gemini_evaluation = record["gemini_evaluation"]
+    result.skip_reason = record["skip_reason"]
+    return result
+
+
+def read_batch_results(result_path: str, stage: str) -> Dict[int, str]:
+    """
+    Reads the answers of a stage from a batch result file.
+
+    Args:
+        result_path (str): The path of the result file, one {"custom_id", "response": {"status_code", "body"}, "error"} object per line.
+        stage (str): The stage the batch was written for.
+
+    Returns:
+        Dict[int, str]: The answer content by question position. Failed requests, and requests whose completion
+        did not finish with "stop", e.g. were cut off at max_tokens, are left out to be sent again synchronously.
+    """
+    answers: Dict[int, str] = {}
+    with open(result_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item_stage, _, position = item.get("custom_id", "").rpartition("-")
+            response = item.get("response") or {}
+            if item_stage != stage or item.get("error") or response.get("status_code") != 200:
+                continue
+            choice = response["body"]["choices"][0]
+            if choice.get("finish_reason") == "stop":     # A truncated answer must not stand in for a summary or follow-up
+                answers[int(position)] = choice["message"]["content"]
+    return answers
+
+
+def stub_completion(body: Dict[str, Any]) -> str:
+    """
+    Answers a chat request deterministically without calling any API, for testing batch runs end to end.
+    """
+    system_prompt, user_message = body["messages"][0]["content"], body["messages"][-1]["content"]
+    if system_prompt == FOLLOW_UP_ON_TOPIC_PROMPT:
+        return "yes"
+    if system_prompt == FOLLOW_UP_PROMPT:
+        return "How is " + " ".join(user_message.split()[:5]) + " used?"
+    if system_prompt == FUSED_FOLLOW_UP_PROMPT:
+        return json.dumps({"follow_up": "How is " + " ".join(user_message.split()[:5]) + " used?", "on_topic": "yes"})
+    return "This article explains " + user_message.rsplit("Question: ", 1)[-1]
+
+
+def process_batch_file(request_path: str, result_path: str, complete: Callable[[Dict[str, Any]], str] = stub_completion) -> int:
+    """
+    Answers a batch file locally and writes a result file in the provider's format.
+
+    Args:
+        request_path (str): The batch file.
+        result_path (str): The result file to write.
+        complete (Callable[[Dict[str, Any]], str]): Answers one request body, stub_completion by default.
+
+    Returns:
+        int: The number of requests answered.
+    """
+    count = 0
+    with open(request_path, "r", encoding="utf-8") as requests, open(result_path, "w", encoding="utf-8") as results:
+        for line in requests:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            content = complete(request["body"])
+            results.write(json.dumps({
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}},
+                "error": None,
+            }) + "\n")
+            count += 1
+    return count
+
+
+def sync_completion(chat_client, config: ApiConfiguration, logger: logging.Logger) -> Callable[[Dict[str, Any]], str]:
+    """
+    Returns a completer for process_batch_file that sends each request synchronously, for small runs.
+    """
+    return lambda body: call_openai_chat(chat_client, body["messages"], config, logger, body.get("response_format"), stage="batch_sync")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    usage = __doc__.split("\n\n")[1]
+    if len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+    command = sys.argv[1]
+
+    if command == "stub" and len(sys.argv) == 4:
+        print(process_batch_file(sys.argv[2], sys.argv[3]), "requests answered")
+        return
+
+    config = ApiConfiguration()
+    pipeline = BatchPipeline(sys.argv[2], config, logger)
+
+    if command == "prepare" and len(sys.argv) == 6:
+        from QueueRunner import PERSONAS, NUM_QUESTIONS
+        source = sys.argv[5]
+        if source in PERSONAS:
+            strategy = PERSONAS[source]()
+            questions = strategy.generate_questions(configure_openai_for_azure(config, "chat"), config, NUM_QUESTIONS, logger)
+            test_mode = strategy.__class__.__name__.replace('PersonaStrategy', '').lower()
+        else:
+            with open(source, "r", encoding="utf-8") as f:
+                questions = json.load(f)
+            test_mode = os.path.splitext(os.path.basename(source))[0]
+        print(pipeline.prepare(questions, test_mode, sys.argv[3], sys.argv[4]))
+
+    elif command == "ingest" and len(sys.argv) == 4:
+        next_batch = pipeline.ingest(sys.argv[3], configure_openai_for_azure(config, "chat"), configure_openai_for_azure(config, "embedding"))
+        print(next_batch or "Finished, results saved")
+
+    elif command == "status":
+        print(json.dumps(pipeline.status(), indent=4))
+
+    else:
+        print(usage)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Chunk Compaction:
+Finds near-duplicate chunks in the knowledge base (overlapping windows, re-ingested articles) and
+keeps one representative per cluster, so the index searched by `process_questions` is smaller and
+duplicate chunks no longer tie for the best hit. Every chunk in a cluster clears the threshold against the
+representative itself, so a chain of pairwise near-duplicates never merges two chunks that are far apart.
+
+Small corpora are compared exactly with blocked all-pairs cosine similarity. Large corpora use
+random-hyperplane LSH to find candidate pairs, which are then confirmed with the exact similarity.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import os
+import sys
+from typing import List, Dict, Any, Tuple
+
+# Third-Party Packages
+import numpy as np
+
+# Add the project root and scripts directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Local Modules
+from common.common_functions import build_embedding_matrix
+
+# Constants
+DEFAULT_COMPACTION_THRESHOLD = 0.97     # Chunks at or above this cosine similarity are treated as duplicates
+DEFAULT_BLOCK_SIZE = 1024               # Rows compared per block in the all-pairs pass
+LSH_MIN_CHUNKS = 20000                  # Switch from exact all-pairs to LSH candidates above this many chunks
+LSH_NUM_BITS = 16                       # Hyperplanes per LSH table
+LSH_NUM_TABLES = 8                      # Independent LSH tables, more tables find more true duplicates
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkCompactor:
+    def __init__(self, threshold: float = DEFAULT_COMPACTION_THRESHOLD, block_size: int = DEFAULT_BLOCK_SIZE, use_lsh: bool = None, seed: int = 0) -> None:
+        """
+        Initializes a new instance of the ChunkCompactor class.
+
+        Args:
+            threshold (float): Cosine similarity at or above which two chunks are considered duplicates.
+            block_size (int): Number of rows compared at a time, bounding memory to block_size x n similarities.
+            use_lsh (bool): Force LSH on or off. None picks LSH automatically for corpora above LSH_MIN_CHUNKS.
+            seed (int): Seed for the LSH hyperplanes so compaction is reproducible.
+
+        Returns:
+            None
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("Compaction threshold must be in the range (0, 1]")
+
+        self.threshold = threshold
+        self.block_size = block_size
+        self.use_lsh = use_lsh
+        self.seed = seed
+
+    def compact(self, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[int, List[int]]]:
+        """
+        Clusters near-duplicate chunks and keeps one representative per cluster.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with an "embedding" field.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Dict[int, List[int]]]: The representative chunks in their original order, and an
+            alias map from each representative's original position to the original positions of every chunk it replaces.
+        """
+        matrix, positions = build_embedding_matrix(chunks)
+        if len(positions) == 0:
+            return [], {}
+
+        use_lsh = self.use_lsh if self.use_lsh is not None else len(positions) > LSH_MIN_CHUNKS
+        pairs = self._lsh_pairs(matrix) if use_lsh else self._blocked_pairs(matrix)
+        neighbours: Dict[int, List[int]] = {}
+        for a, b in pairs:
+            neighbours.setdefault(a, []).append(b)
+            neighbours.setdefault(b, []).append(a)
+
+        # Chunks with the most duplicates become representatives first, each taking its own unclaimed duplicates.
+        # Clustering by connected pairs would chain A~B~C into one cluster even when A and C are far apart.
+        cluster_of = np.full(len(positions), -1)
+        alias_map: Dict[int, List[int]] = {}
+        for representative in sorted(range(len(positions)), key=lambda row: (-len(neighbours.get(row, [])), row)):
+            if cluster_of[representative] >= 0:
+                continue
+            members = [representative] + sorted(row for row in neighbours.get(representative, []) if cluster_of[row] < 0)
+            cluster_of[members] = representative
+            alias_map[positions[representative]] = sorted(positions[row] for row in members)
+            _check_cluster(matrix, representative, members, self.threshold)
+
+        compacted_chunks = [chunks[position] for position in sorted(alias_map)]
+        logger.info("Compacted %s chunks into %s representatives (threshold %s, %s)", len(positions), len(compacted_chunks), self.threshold, "LSH" if use_lsh else "all-pairs")
+
+        return compacted_chunks, {position: alias_map[position] for position in sorted(alias_map)}
+
+    def _blocked_pairs(self, matrix: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Finds all duplicate pairs with an exact all-pairs comparison, one block of rows at a time.
+
+        Args:
+            matrix (np.ndarray): Row-normalised embedding matrix.
+
+        Returns:
+            List[Tuple[int, int]]: Row pairs (i, j) with i < j whose cosine similarity is at or above the threshold.
+        """
+        pairs: List[Tuple[int, int]] = []
+        for start in range(0, matrix.shape[0], self.block_size):
+            block = matrix[start:start + self.block_size]
+            # Only compare against rows from this block onwards, the earlier blocks already saw this one
+            similarities = block @ matrix[start:].T
+            rows, cols = np.nonzero(similarities >= self.threshold)
+            keep = cols > rows
+            pairs.extend(zip((rows[keep] + start).tolist(), (cols[keep] + start).tolist()))
+        return pairs
+
+    def _lsh_pairs(self, matrix: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Finds duplicate pairs among rows that share a random-hyperplane LSH bucket in any table.
+
+        Args:
+            matrix (np.ndarray): Row-normalised embedding matrix.
+
+        Returns:
+            List[Tuple[int, int]]: Row pairs (i, j) with i < j whose cosine similarity is at or above the threshold.
+        """
+        rng = np.random.default_rng(self.seed)
+        powers = 1 << np.arange(LSH_NUM_BITS, dtype=np.int64)
+        pairs = set()
+
+        for _ in range(LSH_NUM_TABLES):
+            hyperplanes = rng.standard_normal((matrix.shape[1], LSH_NUM_BITS)).astype(matrix.dtype)
+            signatures = ((matrix @ hyperplanes) > 0).astype(np.int64) @ powers
+
+            # Group rows by signature and confirm candidates inside each bucket exactly
+            order = np.argsort(signatures, kind="stable")
+            boundaries = np.flatnonzero(np.diff(signatures[order])) + 1
+            for bucket in np.split(order, boundaries):
+                if len(bucket) < 2:
+                    continue
+                for start in range(0, len(bucket), self.block_size):
+                    block_rows = bucket[start:start + self.block_size]
+                    similarities = matrix[block_rows] @ matrix[bucket[start:]].T
+                    rows, cols = np.nonzero(similarities >= self.threshold)
+                    for a, b in zip(block_rows[rows].tolist(), bucket[start:][cols].tolist()):
+                        if a != b:
+                            pairs.add((min(a, b), max(a, b)))
+
+        return sorted(pairs)
+
+    def save_alias_map(self, alias_map: Dict[int, List[int]], output_file: str) -> None:
+        """
+        Saves the alias map to a JSON file so hits on a representative can be traced back to the original chunks.
+
+        Args:
+            alias_map (Dict[int, List[int]]): The alias map returned by compact().
+            output_file (str): The path of the JSON file to write.
+
+        Returns:
+            None
+
+        Raises:
+            IOError: If an I/O error occurs while writing the JSON file.
+        """
+        output_data = {
+            "threshold": self.threshold,
+            "aliases": {str(position): members for position, members in alias_map.items()},
+        }
+        try:
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(output_data, f, indent=4)
+            logger.info(f"Chunk alias map saved to: {output_file}")
+        except IOError as e:
+            logger.error(f"Error saving chunk alias map: {e}")
+            raise
+
+
+def _check_cluster(matrix: np.ndarray, representative: int, members: List[int], threshold: float) -> None:
+    """
+    Raises RuntimeError if a member of a cluster falls below the threshold against its representative.
+    """
+    similarities = matrix[members] @ matrix[representative]
+    if similarities.min() < threshold - 1e-6:      # Allow for rounding between differently blocked products
+        raise RuntimeError(f"Chunk {members[int(np.argmin(similarities))]} is below the compaction threshold against its representative {representative}")
+
+
+def main():
+    """
+    Compacts a chunk JSON file offline: python ChunkCompactor.py <input.json> <output.json> <aliases.json> [threshold]
+
+    Keep the alias map out of the source directory, read_processed_chunks loads the last JSON file it finds there.
+    """
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 4:
+        print("Usage: python ChunkCompactor.py <input.json> <output.json> <aliases.json> [threshold]")
+        sys.exit(1)
+
+    input_file, output_file, alias_file = sys.argv[1], sys.argv[2], sys.argv[3]
+    threshold = float(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_COMPACTION_THRESHOLD
+
+    with open(input_file, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    compactor = ChunkCompactor(threshold)
+    compacted_chunks, alias_map = compactor.compact(chunks)
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(compacted_chunks, f, indent=4)
+    compactor.save_alias_map(alias_map, alias_file)
+
+
+if __name__ == "__main__":
+    main()
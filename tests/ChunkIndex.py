@@ -0,0 +1,518 @@
+"""
+Chunk Index:
+Search back-ends for the knowledge-base chunks scored by `process_questions`.
+
+`MemoryMappedChunkIndex` keeps the embeddings in a flat float32 file on disk and streams over it in
+fixed-size blocks, so a batch of questions can be scored against an index larger than RAM. Blocks are
+scored on a thread pool (NumPy releases the GIL inside the matrix product) and each query keeps a running
+top-k heap, so memory stays bounded by the block size whatever the size of the index.
+
+`SharedMemoryChunkIndex` is loaded once by a parent process into `multiprocessing.shared_memory`, and worker
+processes attach to it through a small picklable handle instead of each re-reading the chunk JSON.
+"""
+
+# Standard Library Imports
+import heapq
+import json
+import logging
+import os
+import sys
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Tuple, Iterable, Optional
+
+# Third-Party Packages
+import numpy as np
+
+# Add the project root and scripts directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Local Modules
+from common.common_functions import build_embedding_matrix
+
+# Constants
+DEFAULT_SEARCH_BLOCK_SIZE = 8192        # Rows scored per block, 8192 x 3072 float32 is 96MB per thread at most
+SEARCH_MEMORY_BUDGET = 256 * 2 ** 20    # Bytes of blocks scored at once across all threads, blocks are made smaller to fit
+INDEX_META_FILE = "index.json"          # Row count and dimension of the index
+EMBEDDINGS_FILE = "embeddings.f32"      # Row-normalised float32 embeddings, one row per chunk
+SUMMARIES_FILE = "summaries.jsonl"      # One JSON-encoded summary per line
+OFFSETS_FILE = "offsets.npy"            # Byte offset of each line in the summaries file
+SOURCE_READ_SIZE = 2 ** 20              # Characters of a chunk file read at a time while streaming its chunks
+
+logger = logging.getLogger(__name__)
+
+
+# Abstract class for chunk search back-ends
+class ChunkIndex(ABC):
+    @abstractmethod
+    def search(self, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        """
+        Scores a batch of query embeddings against every chunk in the index.
+
+        Args:
+            query_embeddings (np.ndarray): A (q, d) matrix of query embeddings, or a single (d,) embedding.
+            top_k (int): The number of best chunks to return per query.
+
+        Returns:
+            List[List[Tuple[float, int]]]: For each query, up to top_k (similarity, chunk id) pairs, best first.
+            Ties are broken in favour of the lower chunk id, like the first-wins scan in process_questions.
+        """
+        pass  # Abstract method to be implemented by subclasses
+
+    @abstractmethod
+    def get_summary(self, chunk_id: int) -> str:
+        """
+        Returns the summary of a chunk in the index.
+
+        Args:
+            chunk_id (int): The id of the chunk, as returned by search().
+
+        Returns:
+            str: The chunk summary.
+        """
+        pass  # Abstract method to be implemented by subclasses
+
+    def best_hits(self, query_embeddings: np.ndarray) -> List[Tuple[float, str]]:
+        """
+        Finds the best-matching chunk for each query, in the form process_questions stores on a TestResult.
+
+        Args:
+            query_embeddings (np.ndarray): A (q, d) matrix of query embeddings.
+
+        Returns:
+            List[Tuple[float, str]]: The best similarity and matching summary per query, (0, None) if nothing scored above zero.
+        """
+        best_hits = []
+        for matches in self.search(query_embeddings, 1):
+            if matches and matches[0][0] > 0:
+                best_hits.append((matches[0][0], self.get_summary(matches[0][1])))
+            else:
+                best_hits.append((0, None))
+        return best_hits
+
+    def worker_handle(self) -> Dict[str, Any]:
+        """
+        Returns a picklable handle that worker processes pass to attach_chunk_index to open the same index.
+
+        Raises:
+            NotImplementedError: If this kind of index cannot be shared with worker processes.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} cannot be shared with worker processes")
+
+
+class InMemoryChunkIndex(ChunkIndex):
+    def __init__(self, chunks: List[Dict[str, Any]], block_size: int = DEFAULT_SEARCH_BLOCK_SIZE, threads: int = 4) -> None:
+        """
+        Builds an index over chunks already held in memory.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with "embedding" and "summary" fields.
+            block_size (int): The number of chunks scored per block.
+            threads (int): The number of blocks scored concurrently.
+
+        Returns:
+            None
+        """
+        self.embeddings, self.positions = build_embedding_matrix(chunks)
+        self.summaries: List[str] = [chunks[position].get("summary") for position in self.positions]
+        self.count = len(self.positions)
+        self.dimension = self.embeddings.shape[1] if self.count else 0
+        self.block_size = block_size
+        self.threads = threads
+
+    def search(self, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        queries = normalise_queries(query_embeddings, self.dimension)
+        return _blocked_search(self.embeddings, queries, top_k, self.block_size, self.threads)
+
+    def get_summary(self, chunk_id: int) -> str:
+        return self.summaries[chunk_id]
+
+
+class MemoryMappedChunkIndex(ChunkIndex):
+    def __init__(self, index_dir: str, block_size: int = DEFAULT_SEARCH_BLOCK_SIZE, threads: int = 4) -> None:
+        """
+        Opens an index written by write_memory_mapped_index without reading the embeddings into memory.
+
+        Args:
+            index_dir (str): The directory holding the index files.
+            block_size (int): The number of chunks scored per block.
+            threads (int): The number of blocks scored concurrently.
+
+        Returns:
+            None
+
+        Raises:
+            FileNotFoundError: If the index directory or one of its files is missing.
+        """
+        with open(os.path.join(index_dir, INDEX_META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        self.index_dir = index_dir
+        self.count: int = meta["count"]
+        self.dimension: int = meta["dimension"]
+        self.block_size = block_size
+        self.threads = threads
+        self.embeddings = np.memmap(os.path.join(index_dir, EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(self.count, self.dimension))
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+
+        logger.info("Opened memory-mapped chunk index at %s: %s chunks, dimension %s", index_dir, self.count, self.dimension)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        queries = normalise_queries(query_embeddings, self.dimension)
+        return _blocked_search(self.embeddings, queries, top_k, self.block_size, self.threads)
+
+    def get_summary(self, chunk_id: int) -> str:
+        with open(os.path.join(self.index_dir, SUMMARIES_FILE), "rb") as f:
+            f.seek(int(self.offsets[chunk_id]))
+            return json.loads(f.readline())
+
+    def worker_handle(self) -> Dict[str, Any]:
+        """
+        Returns what a worker process needs to open the same index, see attach_chunk_index.
+
+        The embeddings file is mapped by every worker, so the operating system shares one copy of its pages.
+        """
+        return {"type": "mmap", "index_dir": self.index_dir, "block_size": self.block_size, "threads": self.threads}
+
+
+class SharedMemoryChunkIndex(ChunkIndex):
+    def __init__(self, handle: Dict[str, Any], owner: bool = False) -> None:
+        """
+        Attaches to an index that a parent process has loaded into shared memory with SharedMemoryChunkIndex.create.
+
+        The embeddings and summary offsets are zero-copy NumPy views over the shared blocks, so attaching costs
+        neither a re-read of the chunk JSON nor a private copy of the embeddings.
+
+        Args:
+            handle (Dict[str, Any]): The handle returned by worker_handle() in the parent process.
+            owner (bool): Whether this instance created the blocks and is responsible for unlinking them.
+
+        Returns:
+            None
+        """
+        self.handle = handle
+        self.owner = owner
+        self.count: int = handle["count"]
+        self.dimension: int = handle["dimension"]
+        self.block_size: int = handle["block_size"]
+        self.threads: int = handle["threads"]
+
+        self._blocks = {name: shared_memory.SharedMemory(name=handle[name]) for name in ("embeddings", "offsets", "summaries")}
+        self.embeddings = np.ndarray((self.count, self.dimension), dtype=np.float32, buffer=self._blocks["embeddings"].buf)
+        self.offsets = np.ndarray((self.count + 1,), dtype=np.int64, buffer=self._blocks["offsets"].buf)
+        self.summaries = self._blocks["summaries"].buf
+
+    @classmethod
+    def create(cls, chunks: List[Dict[str, Any]], block_size: int = DEFAULT_SEARCH_BLOCK_SIZE, threads: int = 4) -> "SharedMemoryChunkIndex":
+        """
+        Loads the processed chunks into shared memory once, for any number of worker processes to attach to.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with "embedding" and "summary" fields.
+            block_size (int): The number of chunks scored per block.
+            threads (int): The number of blocks scored concurrently within one process.
+
+        Returns:
+            SharedMemoryChunkIndex: The owning index. Call close() and unlink() once the workers have finished.
+        """
+        matrix, positions = build_embedding_matrix(chunks)
+        encoded = [json.dumps(chunks[position].get("summary")).encode("utf-8") for position in positions]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(summary) for summary in encoded], dtype=np.int64)
+
+        # SharedMemory rejects zero-sized blocks, so empty indexes still allocate a byte
+        blocks = {
+            "embeddings": shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1)),
+            "offsets": shared_memory.SharedMemory(create=True, size=offsets.nbytes),
+            "summaries": shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]), 1)),
+        }
+        np.ndarray(matrix.shape, dtype=np.float32, buffer=blocks["embeddings"].buf)[:] = matrix
+        np.ndarray(offsets.shape, dtype=np.int64, buffer=blocks["offsets"].buf)[:] = offsets
+        blocks["summaries"].buf[:int(offsets[-1])] = b"".join(encoded)
+
+        handle = {
+            "type": "shared_memory",
+            "count": len(positions),
+            "dimension": matrix.shape[1] if len(positions) else 0,
+            "block_size": block_size,
+            "threads": threads,
+        }
+        handle.update({name: block.name for name, block in blocks.items()})
+        for block in blocks.values():
+            block.close()
+
+        logger.info("Loaded %s chunks into shared memory (%s bytes of embeddings)", len(positions), matrix.nbytes)
+        return cls(handle, owner=True)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        queries = normalise_queries(query_embeddings, self.dimension)
+        return _blocked_search(self.embeddings, queries, top_k, self.block_size, self.threads)
+
+    def get_summary(self, chunk_id: int) -> str:
+        return json.loads(bytes(self.summaries[int(self.offsets[chunk_id]):int(self.offsets[chunk_id + 1])]))
+
+    def worker_handle(self) -> Dict[str, Any]:
+        """
+        Returns the picklable handle that worker processes pass to attach_chunk_index.
+        """
+        return self.handle
+
+    def close(self) -> None:
+        """
+        Releases this process's views of the shared blocks. The blocks themselves stay alive until unlink().
+        """
+        self.embeddings = self.offsets = self.summaries = None
+        for block in self._blocks.values():
+            block.close()
+
+    def unlink(self) -> None:
+        """
+        Frees the shared blocks. Only the owning process should call this, after every worker has finished.
+        """
+        if self.owner:
+            for block in self._blocks.values():
+                block.unlink()
+
+
+def attach_chunk_index(handle: Dict[str, Any]) -> ChunkIndex:
+    """
+    Opens, inside a worker process, the index described by a handle from worker_handle().
+
+    Args:
+        handle (Dict[str, Any]): The handle created in the parent process.
+
+    Returns:
+        ChunkIndex: A view of the parent's index that does not copy the embeddings.
+    """
+    if handle["type"] == "mmap":
+        return MemoryMappedChunkIndex(handle["index_dir"], handle["block_size"], handle["threads"])
+    elif handle["type"] == "shared_memory":
+        return SharedMemoryChunkIndex(handle)
+    elif handle["type"] == "sharded":
+        from ShardedChunkIndex import ShardedChunkIndex     # Imported here, ShardedChunkIndex builds on this module
+        return ShardedChunkIndex(handle["addresses"], handle["authkey"])
+    raise ValueError(f"Unknown chunk index type: {handle['type']}")
+
+
+def write_memory_mapped_index(chunks: Iterable[Dict[str, Any]], index_dir: str) -> int:
+    """
+    Writes chunks to a memory-mapped index, streaming so the chunks never need to be in memory at once.
+
+    Args:
+        chunks (Iterable[Dict[str, Any]]): The processed chunks, each with "embedding" and "summary" fields.
+        index_dir (str): The directory to write the index files into. Created if it does not exist.
+
+    Returns:
+        int: The number of chunks written. Chunks without a usable embedding are skipped.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    count, dimension, offsets = 0, None, []
+
+    with open(os.path.join(index_dir, EMBEDDINGS_FILE), "wb") as embeddings_file, open(os.path.join(index_dir, SUMMARIES_FILE), "wb") as summaries_file:
+        for chunk in chunks:
+            matrix, positions = build_embedding_matrix([chunk])
+            if not positions:
+                continue
+            if dimension is None:
+                dimension = matrix.shape[1]
+            elif matrix.shape[1] != dimension:
+                raise ValueError(f"Chunk embedding has dimension {matrix.shape[1]}, expected {dimension}")
+
+            embeddings_file.write(matrix.tobytes())
+            offsets.append(summaries_file.tell())
+            summaries_file.write(json.dumps(chunk.get("summary")).encode("utf-8") + b"\n")
+            count += 1
+
+    np.save(os.path.join(index_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(index_dir, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"count": count, "dimension": dimension or 0}, f, indent=4)
+
+    logger.info("Wrote %s chunks to memory-mapped index at %s", count, index_dir)
+    return count
+
+
+def source_chunk_file(source_dir: str) -> Optional[str]:
+    """
+    Returns the chunk file a run reads from the source directory: the last JSON file in name order, as the chunk
+    files are written as successive versions of one knowledge base. Both the in-memory and the memory-mapped index
+    are built from this file, so either searches the same corpus.
+
+    Args:
+        source_dir (str): The path to the source directory containing JSON files.
+
+    Returns:
+        Optional[str]: The path of the file, or None if the directory has no JSON files.
+    """
+    filenames = sorted(filename for filename in os.listdir(source_dir) if filename.endswith(".json"))
+    return os.path.join(source_dir, filenames[-1]) if filenames else None
+
+
+def iterate_source_chunks(source_dir: str) -> Iterable[Dict[str, Any]]:
+    """
+    Yields the chunks of the source directory's chunk file, the same chunks read_processed_chunks loads, parsing
+    the file incrementally so a corpus larger than memory can be written to a memory-mapped index.
+
+    Args:
+        source_dir (str): The path to the source directory containing JSON files.
+
+    Returns:
+        Iterable[Dict[str, Any]]: The chunks.
+    """
+    file_path = source_chunk_file(source_dir)
+    if file_path is not None:
+        with open(file_path, "r", encoding="utf-8") as f:
+            yield from iterate_json_array(f)
+
+
+def iterate_json_array(f, read_size: int = SOURCE_READ_SIZE) -> Iterable[Any]:
+    """
+    Yields the elements of the JSON array in a file one at a time, reading read_size characters at a time, so only
+    the element being decoded is held in memory rather than the whole array.
+
+    Args:
+        f: The file, opened in text mode.
+        read_size (int): The characters read at a time.
+
+    Returns:
+        Iterable[Any]: The elements of the array.
+
+    Raises:
+        ValueError: If the file does not hold a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def fill() -> None:
+        nonlocal buffer, position, eof
+        data = f.read(read_size)
+        eof = not data
+        buffer = buffer[position:] + data
+        position = 0
+
+    def skip_whitespace() -> None:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[position:position + 1] != "[":
+        raise ValueError("Chunk file does not hold a JSON array")
+    position += 1
+    first = True
+    while True:
+        skip_whitespace()
+        if buffer[position:position + 1] == "]":
+            return
+        if not first:
+            if buffer[position:position + 1] != ",":
+                raise ValueError(f"Expected ',' or ']' in chunk file, found {buffer[position:position + 1]!r}")
+            position += 1
+            skip_whitespace()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                # A value not yet followed by a separator may continue in the next read, e.g. "1" of "1.5"
+                if eof or (end < len(buffer) and buffer[end] in ",] \t\r\n"):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+        position = end
+        first = False
+        yield element
+
+
+def normalise_queries(query_embeddings: np.ndarray, dimension: int) -> np.ndarray:
+    """
+    Converts query embeddings to a row-normalised float32 (q, d) matrix.
+    """
+    queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+    if queries.shape[1] != dimension:
+        raise ValueError("Query embeddings must have the same dimension as the index")
+
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    if np.any(norms == 0):
+        raise ValueError("Query embeddings must not be zero vectors")
+    return queries / norms
+
+
+def _blocked_search(embeddings: np.ndarray, queries: np.ndarray, top_k: int, block_size: int, threads: int) -> List[List[Tuple[float, int]]]:
+    """
+    Scores normalised queries against an embedding matrix block by block and merges the per-block top-k into running heaps.
+    """
+    count = embeddings.shape[0]
+    heaps: List[List[Tuple[float, int]]] = [[] for _ in range(queries.shape[0])]
+    if count == 0:
+        return heaps
+    block_size = search_block_rows(block_size, threads, embeddings.shape[1])
+
+    # Each block returns only its own top-k per query, which is merged into the running heaps as it completes
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(_score_block, embeddings, start, min(start + block_size, count), queries, top_k) for start in range(0, count, block_size)]
+        for future in as_completed(futures):
+            for heap, candidates in zip(heaps, future.result()):
+                for similarity, chunk_id in candidates:
+                    _push_candidate(heap, similarity, chunk_id, top_k)
+
+    return [sorted([(similarity, -negative_id) for similarity, negative_id in heap], key=lambda match: (-match[0], match[1])) for heap in heaps]
+
+
+def search_block_rows(block_size: int, threads: int, dimension: int) -> int:
+    """
+    Returns the rows to score per block: block_size, made smaller if the blocks the threads score at once would
+    exceed SEARCH_MEMORY_BUDGET.
+    """
+    return max(1, min(block_size, SEARCH_MEMORY_BUDGET // (max(1, threads) * dimension * np.dtype(np.float32).itemsize)))
+
+
+def _score_block(embeddings: np.ndarray, start: int, end: int, queries: np.ndarray, top_k: int) -> List[List[Tuple[float, int]]]:
+    """
+    Scores one block of the index against all queries and returns the block's top-k per query.
+    """
+    block = np.asarray(embeddings[start:end])
+    similarities = block @ queries.T      # (block, q)
+    k = min(top_k, end - start)
+    candidates = []
+    for query, column in zip(queries.astype(np.float64), similarities.T):
+        if k == 1:
+            top = [np.argmax(column)]       # argmax returns the first of tied rows, matching the sequential scan
+        else:
+            top = np.argpartition(-column, k - 1)[:k] if k < len(column) else np.arange(len(column))
+        # Rescore the winners one row at a time, the blocked product's rounding depends on the block shape
+        candidates.append([(float(np.dot(block[row].astype(np.float64), query)), start + int(row)) for row in top])
+    return candidates
+
+
+def _push_candidate(heap: List[Tuple[float, int]], similarity: float, chunk_id: int, top_k: int) -> None:
+    """
+    Adds a candidate to a bounded min-heap of the best matches, preferring lower chunk ids on ties.
+    """
+    entry = (similarity, -chunk_id)
+    if len(heap) < top_k:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+def main():
+    """
+    Builds a memory-mapped index from a source directory: python ChunkIndex.py <source_dir> <index_dir>
+    """
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        print("Usage: python ChunkIndex.py <source_dir> <index_dir>")
+        sys.exit(1)
+
+    write_memory_mapped_index(iterate_source_chunks(sys.argv[1]), sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -15,17 +15,22 @@ Continues with `gemini-1.5-pro` for evaluating the responses generated by GPT-4o
 import logging
 import os
 import json
+import random
+import socket
 import sys
+import textwrap
+import time
+from contextlib import contextmanager
 from logging import Logger
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Iterator, Iterable, Callable
 import numpy as np
 from numpy.linalg import norm
 import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 
 # Third-Party Packages
 from openai import AzureOpenAI, OpenAIError, BadRequestError, APIConnectionError
-from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_not_exception_type
 from GeminiEvaluator import GeminiEvaluator
 
 # Add the project root and scripts directory to the Python path
@@ -35,22 +40,55 @@ sys.path.insert(0, parent_dir)
 
 # Local Modules
 from common.ApiConfiguration import ApiConfiguration
-from common.common_functions import get_embedding
+from common.AsyncLogging import setup_logging, log_payload
+from common.ClientFactory import get_client_factory
+from common.DeploymentPool import route_request, get_deployment_pool
+from common.LatencyControl import get_latency_controller
+from common.RetryPolicy import get_retry_policy, classify_error, CircuitOpenError, RunDeadlineExceeded, OUTAGE_ERRORS
+from common.common_functions import get_embedding, get_embeddings, build_embedding_matrix
 from PersonaStrategy import DeveloperPersonaStrategy, TesterPersonaStrategy, BusinessAnalystPersonaStrategy, PersonaStrategy
+from ChunkCompactor import ChunkCompactor
+from ChunkIndex import ChunkIndex, InMemoryChunkIndex, MemoryMappedChunkIndex, SharedMemoryChunkIndex, attach_chunk_index, source_chunk_file
+from ShardedChunkIndex import ShardedChunkIndex, SHARD_AUTHKEY
+from HierarchicalChunkIndex import HierarchicalChunkIndex
+from ShortCircuitPolicy import ShortCircuitPolicy, STAGE_QUESTION, STAGE_ENRICHMENT, STAGE_FOLLOW_UP
+from QuestionDeduplicator import QuestionDeduplicator
+from LexicalChunkIndex import LexicalChunkIndex, HybridChunkIndex
+from SequentialStopping import SequentialStopRule, STOP_EXHAUSTED, STOP_DEADLINE
+from WorkQueue import WorkQueue
+from StageGraph import StageGraph, format_spans, summarise_stage_graph
+from StreamingPipeline import StreamingPipeline
+from StageProfiler import profile_stage, start_profiling, stop_profiling
+from ResultsStore import ResultsStore, config_snapshot, normalise_persona
+from TopicClassifier import TopicClassifier, load_topic_prototypes, summarise_topic_agreement, UNCERTAIN
 
 # Constants
 SIMILARITY_THRESHOLD = 0.5          # Defines the minimum similarity threshold for a question to be considered a hit
-MAX_RETRIES = 15                    # Maximum number of retries for API calls
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")    # Values of ApiConfiguration.retrievalMode
 NUM_QUESTIONS = 100                 # Number of questions to be generated per test
+MAX_DEDUP_ROUNDS = 3                # Maximum number of rounds of replacement questions generated for removed duplicates
+QUEUE_POLL_SECONDS = 5              # Wait between lease attempts while other workers hold the remaining queue items
+EMBEDDING_BATCH_SIZE = 2048         # Texts per embedding request, the most the embeddings API accepts
 
 # OpenAI prompts used for persona generation, enrichment, and follow-up question generation
 OPENAI_PERSONA_PROMPT =  "You are an AI assistant helping an application developer understand generative AI. You explain complex concepts in simple language, using Python examples if it helps. You limit replies to 50 words or less. If you don't know the answer, say 'I don't know'. If the question is not related to building AI applications, Python, or Large Language Models (LLMs), say 'That doesn't seem to be about AI'."
 ENRICHMENT_PROMPT = "You will be provided with a question about building applications that use generative AI technology. Write a 50 word summary of an article that would be a great answer to the question. Consider enriching the question with additional topics that the question asker might want to understand. Write the summary in the present tense, as though the article exists. If the question is not related to building AI applications, Python, or Large Language Models (LLMs), say 'That doesn't seem to be about AI'.Your response will later be converted into vector embeddings and used for semantic search to find the most relevant document in a curated knowledge base so use the following tone.\n"
 FOLLOW_UP_PROMPT =  "You will be provided with a summary of an article about building applications that use generative AI technology. Write a question of no more than 10 words that a reader might ask as a follow up to reading the article."
 FOLLOW_UP_ON_TOPIC_PROMPT = "You are an AI assistant helping a team of developers understand AI. You explain complex concepts in simple language. Respond 'yes' if the follow-up question is about AI, otherwise respond 'no'."
+BATCH_ENRICHMENT_PROMPT = ENRICHMENT_PROMPT + "You will be given several numbered questions. Answer each one separately, exactly as you would if it were asked on its own. Respond only with a JSON object of the form {\"summaries\": [{\"id\": <question number>, \"summary\": \"<your response>\"}]}, with one entry for every question.\n"
+FUSED_FOLLOW_UP_PROMPT = "You will be provided with a summary of an article about building applications that use generative AI technology. Write a question of no more than 10 words that a reader might ask as a follow up to reading the article. Then decide whether that follow-up question is about AI. Respond only with a JSON object of the form {\"follow_up\": \"<the question>\", \"on_topic\": \"yes\" or \"no\"}."
+
+# Skip reasons of questions left unprocessed by an outage or the run deadline, as opposed to those stopped by a short-circuit rule
+SKIP_RUN_DEADLINE = "run_deadline"
+SKIP_CIRCUIT_OPEN = "circuit_open"
+SKIP_API_OUTAGE = "api_outage"
+UNPROCESSED_REASONS = (SKIP_RUN_DEADLINE, SKIP_CIRCUIT_OPEN, SKIP_API_OUTAGE)
+
+# Response the enrichment prompts ask for when a question is not about AI
+REFUSAL_SENTINEL = "That doesn't seem to be about AI"
 
 # Setup Logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 gemini_evaluator = GeminiEvaluator()  ## Initialize an instance of the GeminiEvaluator for response evaluation
@@ -59,6 +97,9 @@ gemini_evaluator = GeminiEvaluator()  ## Initialize an instance of the GeminiEva
 def configure_openai_for_azure(config: ApiConfiguration, task: str) -> AzureOpenAI:
     """
     Configures OpenAI for Azure using the provided ApiConfiguration.
+
+    Clients come from the process-wide ClientFactory, so chat and embedding clients share one kept-alive HTTP
+    connection pool and asking again for the same task returns the same client.
     
     Args:
         config (ApiConfiguration): The ApiConfiguration object containing the necessary settings.
@@ -67,18 +108,7 @@ def configure_openai_for_azure(config: ApiConfiguration, task: str) -> AzureOpen
     Returns:
         AzureOpenAI: An instance of AzureOpenAI configured with the correct settings.
     """
-    if task == "chat":
-        return AzureOpenAI(
-            azure_endpoint=config.resourceChatCompletionEndpoint,
-            api_key=config.apiKey.strip(),
-            api_version=config.apiVersion
-        )
-    elif task == "embedding":
-        return AzureOpenAI(
-            azure_endpoint=config.resourceEmbeddingEndpoint,
-            api_key=config.apiKey.strip(),
-            api_version=config.apiVersion
-        )
+    return get_client_factory(config).client(task)
 
 # Class to hold test results
 class TestResult:
@@ -101,15 +131,34 @@ class TestResult:
         self.enriched_question_summary: str = ""            # Summary of the enriched question   
         self.hit: bool = False                              # Whether the question was considered a hit based on similarity
         self.hit_relevance: float = 0.0                     # Relevance score of the hit
+        self.hit_summary: str = None                        # Summary of the best-matching chunk
         self.follow_up: str = ""                            # Adding followUp field
         self.follow_up_on_topic: str = ""                   # Adding followUpOnTopic field
+        self.follow_up_topic_score: float = None            # Local topic classifier score of the follow-up, if it was used
+        self.follow_up_topic_verdict: str = ""              # Local topic classifier verdict, empty when inside the uncertainty band
+        self.follow_up_topic_source: str = ""               # "classifier" or "llm", whichever answered follow_up_on_topic
         self.gemini_evaluation: str = ""                    # Field to store Gemini LLM evaluation
+        self.skip_reason: str = ""                          # Short-circuit rule that stopped the remaining stages, if any
+        self.stage_timings: Dict[str, float] = {}           # Seconds spent in each stage, batched stages shared evenly between their questions
+        self.stage_spans: Dict[str, Tuple[float, float]] = {}   # Start and end of each stage, when the stages ran as a graph
+        self.critical_path: List[str] = []                  # Stages on the critical path, when the stages ran as a graph
+
+@contextmanager
+def timed_stage(question_result: TestResult, stage: str) -> Iterator[None]:
+    """
+    Adds the time spent in the block to the question's timing of a stage, whether or not the block succeeds.
+    """
+    start = time.monotonic()
+    try:
+        with profile_stage(stage):
+            yield
+    finally:
+        question_result.stage_timings[stage] = question_result.stage_timings.get(stage, 0.0) + time.monotonic() - start
 
-# Function to call the OpenAI API with retry logic
-@retry(wait=wait_random_exponential(min=5, max=15), stop=stop_after_attempt(MAX_RETRIES), retry=retry_if_not_exception_type(BadRequestError))
-def call_openai_chat(chat_client: AzureOpenAI, messages: List[Dict[str, str]], config: ApiConfiguration, logger: logging.Logger) -> str:
+# Function to call the OpenAI chat API with retry logic
+def call_openai_chat(chat_client: AzureOpenAI, messages: List[Dict[str, str]], config: ApiConfiguration, logger: logging.Logger, response_format: Dict[str, str] = None, stage: str = "chat") -> str:
     """
-    Retries the OpenAI chat API call with exponential backoff and retry logic.
+    Calls the OpenAI chat API, retrying by error class under the process-wide RetryPolicy.
 
     :param chat_client: An instance of the AzureOpenAI class.
     :type chat_client: AzureOpenAI
@@ -119,23 +168,24 @@ def call_openai_chat(chat_client: AzureOpenAI, messages: List[Dict[str, str]], c
     :type config: ApiConfiguration
     :param logger: An instance of the logging.Logger class.
     :type logger: logging.Logger
+    :param response_format: Optional response format, e.g. {"type": "json_object"} for structured output.
+    :type response_format: Dict[str, str]
+    :param stage: The pipeline stage making the call, whose recent latencies set its timeout and hedge delay.
+    :type stage: str
     :return: The content of the first choice in the API response.
     :rtype: str
     :raises RuntimeError: If the finish reason in the API response is not 'stop', 'length', or an empty string.
     :raises OpenAIError: If there is an error with the OpenAI API.
     :raises APIConnectionError: If there is an error with the API connection.
+    :raises CircuitOpenError: If the chat endpoint is failing and its circuit is open.
+    :raises RunDeadlineExceeded: If the run deadline has passed.
     """
-    try:
-        response = chat_client.chat.completions.create(
-            model=config.azureDeploymentName,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=config.maxTokens,
-            top_p=0.0,
-            frequency_penalty=0,
-            presence_penalty=0,
-            timeout=config.openAiRequestTimeout,
-        )
+    def request() -> str:
+        # Each attempt, and each hedge, is routed separately, so it goes to the least loaded healthy deployment
+        response = get_latency_controller(config).call(stage, lambda timeout: route_request(config, "chat", chat_client, lambda client, deployment: client.chat.completions.create(
+            **chat_request_body(config, messages, response_format, deployment),
+            timeout=timeout,
+        )))
         content = response.choices[0].message.content
         finish_reason = response.choices[0].finish_reason
 
@@ -147,13 +197,60 @@ def call_openai_chat(chat_client: AzureOpenAI, messages: List[Dict[str, str]], c
 
         return content
 
+    try:
+        return get_retry_policy(config).call("chat", request)
     except (OpenAIError, APIConnectionError) as e:
         logger.error(f"Error: {e}")
         raise
 
 
+def chat_request_body(config: ApiConfiguration, messages: List[Dict[str, str]], response_format: Dict[str, str] = None, deployment: str = None) -> Dict[str, Any]:
+    """
+    Builds the parameters of a chat completion request, shared by synchronous calls and batch files.
+
+    Args:
+        config (ApiConfiguration): The API configuration instance.
+        messages (List[Dict[str, str]]): The messages to send.
+        response_format (Dict[str, str]): Optional response format, e.g. {"type": "json_object"}.
+        deployment (str): The deployment to send the request to, config.azureDeploymentName if not given.
+
+    Returns:
+        Dict[str, Any]: The request parameters.
+    """
+    body = {
+        "model": deployment or config.azureDeploymentName,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": config.maxTokens,
+        "top_p": 0.0,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+    }
+    # Only send response_format when asked for, so plain-text calls are unchanged
+    if response_format:
+        body["response_format"] = response_format
+    return body
+
+def unprocessed_reason(error: Exception) -> str:
+    """
+    Returns the skip reason recorded for a question that could not be processed because of an error.
+
+    Args:
+        error (Exception): The error raised while processing the question.
+
+    Returns:
+        str: SKIP_RUN_DEADLINE, SKIP_CIRCUIT_OPEN or SKIP_API_OUTAGE, or an empty string if the error is not
+        one a run should survive.
+    """
+    if isinstance(error, RunDeadlineExceeded):
+        return SKIP_RUN_DEADLINE
+    if isinstance(error, CircuitOpenError):
+        return SKIP_CIRCUIT_OPEN
+    if classify_error(error) in OUTAGE_ERRORS:
+        return SKIP_API_OUTAGE
+    return ""
+
 # Function to retrieve text embeddings using OpenAI API with retry logic
-@retry(wait=wait_random_exponential(min=5, max=15), stop=stop_after_attempt(MAX_RETRIES), retry=retry_if_not_exception_type(BadRequestError))
 def get_text_embedding(embedding_client: AzureOpenAI, config: ApiConfiguration, text: str, logger: Logger) -> np.ndarray:
     """
     Retrieves the text embedding for a given text using the OpenAI API.
@@ -171,12 +268,37 @@ def get_text_embedding(embedding_client: AzureOpenAI, config: ApiConfiguration,
         OpenAIError: If an error occurs while retrieving the text embedding.
     """
     try:
-        embedding = get_embedding(text, embedding_client, config)
+        with profile_stage("embedding"):
+            embedding = get_retry_policy(config).call("embedding", lambda: get_latency_controller(config).call("embedding", lambda timeout: route_request(config, "embedding", embedding_client, lambda client, deployment: get_embedding(text, client, config, deployment, timeout=timeout))))
         return np.array(embedding)
     except OpenAIError as e:
         logger.error(f"Error getting text embedding: {e}")
         raise
 
+# Function to retrieve several text embeddings in one API call with retry logic
+def get_text_embeddings(embedding_client: AzureOpenAI, config: ApiConfiguration, texts: List[str], logger: Logger) -> np.ndarray:
+    """
+    Retrieves the text embeddings for several texts using batched OpenAI API requests.
+
+    Args:
+        embedding_client (AzureOpenAI): The OpenAI client instance.
+        config (ApiConfiguration): The API configuration instance.
+        texts (List[str]): The texts for which to retrieve embeddings.
+        logger (Logger): The logger instance.
+
+    Returns:
+        np.ndarray: An (n, d) matrix with one embedding per text.
+
+    Raises:
+        OpenAIError: If an error occurs while retrieving the text embeddings.
+    """
+    try:
+        with profile_stage("embedding"):
+            return np.array(get_retry_policy(config).call("embedding", lambda: get_latency_controller(config).call("embedding_batch", lambda timeout: route_request(config, "embedding", embedding_client, lambda client, deployment: get_embeddings(texts, client, config, deployment, timeout=timeout)))))
+    except OpenAIError as e:
+        logger.error(f"Error getting text embeddings: {e}")
+        raise
+
 # Function to calculate cosine similarity between two vectors
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """
@@ -210,8 +332,32 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
 
     return dot_product / (a_norm * b_norm)
 
+# Messages of each stage's chat request, shared by synchronous calls and batch files
+def enrichment_messages(question: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": OPENAI_PERSONA_PROMPT},
+        {"role": "user", "content": ENRICHMENT_PROMPT + "Question: " + question},
+    ]
+
+def follow_up_messages(text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": FOLLOW_UP_PROMPT},
+        {"role": "user", "content": text},
+    ]
+
+def on_topic_messages(follow_up: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": FOLLOW_UP_ON_TOPIC_PROMPT},
+        {"role": "user", "content": follow_up},
+    ]
+
+def fused_follow_up_messages(text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": FUSED_FOLLOW_UP_PROMPT},
+        {"role": "user", "content": text},
+    ]
+
 # Function to generate enriched questions using OpenAI API
-@retry(wait=wait_random_exponential(min=5, max=15), stop=stop_after_attempt(MAX_RETRIES), retry=retry_if_not_exception_type(BadRequestError))
 def generate_enriched_question(chat_client: AzureOpenAI, config: ApiConfiguration, question: str, logger: logging.Logger) -> str:
     """
     Generates an enriched question using the OpenAI API.
@@ -228,19 +374,140 @@ def generate_enriched_question(chat_client: AzureOpenAI, config: ApiConfiguratio
     Raises:
         BadRequestError: If the API request fails.
     """
-    messages = [
-        {"role": "system", "content": OPENAI_PERSONA_PROMPT},
-        {"role": "user", "content": ENRICHMENT_PROMPT + "Question: " + question},
-    ]
+    messages = enrichment_messages(question)
     logger.info("Making API request to OpenAI...")
-    logger.info("Request payload: %s", messages)
+    log_payload(logger, "Request payload: %s", messages)
 
-    response = call_openai_chat(chat_client, messages, config, logger)
-    logger.info("API response received: %s", response)
+    response = call_openai_chat(chat_client, messages, config, logger, stage="enrichment")
+    log_payload(logger, "API response received: %s", response)
 
     return response
 
 
+def generate_enriched_questions(chat_client: AzureOpenAI, config: ApiConfiguration, questions: List[str], batch_size: int, logger: logging.Logger) -> List[str]:
+    """
+    Generates enriched questions several at a time, sending batch_size numbered questions per request.
+
+    Any item missing from a batch response, or malformed, is re-issued on its own with generate_enriched_question.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance.
+        config (ApiConfiguration): The API configuration instance.
+        questions (List[str]): The questions to be enriched.
+        batch_size (int): The number of questions per request.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        List[str]: The enriched questions, in the same order as the questions.
+    """
+    enriched_summaries: List[str] = []
+    for start in range(0, len(questions), batch_size):
+        batch = questions[start:start + batch_size]
+        numbered_questions = "\n".join(f"{number}. {question}" for number, question in enumerate(batch, start=1))
+        messages = [
+            {"role": "system", "content": OPENAI_PERSONA_PROMPT},
+            {"role": "user", "content": BATCH_ENRICHMENT_PROMPT + "Questions:\n" + numbered_questions},
+        ]
+        logger.info("Making batched enrichment request for %s questions...", len(batch))
+        response = call_openai_chat(chat_client, messages, config, logger, response_format={"type": "json_object"}, stage="batch_enrichment")
+
+        summaries = parse_batch_enrichment(response, len(batch), logger)
+        for question, summary in zip(batch, summaries):
+            if summary is None:
+                # Re-issue the items the batch response lost or mangled one at a time
+                summary = generate_enriched_question(chat_client, config, question, logger)
+            enriched_summaries.append(summary)
+
+    return enriched_summaries
+
+
+def parse_batch_enrichment(response: str, expected_count: int, logger: logging.Logger) -> List[str]:
+    """
+    Validates a batched enrichment response and lines its items up with the numbered questions.
+
+    Args:
+        response (str): The raw completion, expected to be {"summaries": [{"id": int, "summary": str}, ...]}.
+        expected_count (int): The number of questions in the batch.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        List[str]: One summary per question in batch order, None where an item is missing, duplicated or malformed.
+    """
+    summaries: List[str] = [None] * expected_count
+    try:
+        items = json.loads(response).get("summaries")
+    except (TypeError, AttributeError, json.JSONDecodeError) as e:
+        logger.warning("Batched enrichment response is not a JSON object (%s), re-issuing all %s questions", e, expected_count)
+        return summaries
+
+    if not isinstance(items, list):
+        logger.warning("Batched enrichment response has no summaries list, re-issuing all %s questions", expected_count)
+        return summaries
+    if len(items) != expected_count:
+        logger.warning("Batched enrichment returned %s items for %s questions", len(items), expected_count)
+
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("summary"), str) or not item["summary"].strip():
+            continue
+        try:
+            number = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= number <= expected_count:
+            # An id answered twice is ambiguous, so neither answer is trusted
+            summaries[number - 1] = None if number in seen else item["summary"].strip()
+            seen.add(number)
+
+    missing = summaries.count(None)
+    if missing:
+        logger.warning("Re-issuing %s of %s questions missing from the batched enrichment response", missing, expected_count)
+    return summaries
+
+
+def compare_enrichment_modes(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, questions: List[str], batch_size: int, logger: logging.Logger) -> Dict[str, Any]:
+    """
+    Enriches the same questions singly and in batches, and measures how closely the two sets of summaries agree.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance.
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        questions (List[str]): The sample of questions to enrich both ways.
+        batch_size (int): The number of questions per batched request.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        Dict[str, Any]: The mean and minimum cosine similarity between the single and batched summaries, how often both
+        modes agreed on refusing a question, mean word counts, and the individual pairs.
+    """
+    single_summaries = [generate_enriched_question(chat_client, config, question, logger) for question in questions]
+    batched_summaries = generate_enriched_questions(chat_client, config, questions, batch_size, logger)
+
+    pairs = []
+    for question, single, batched in zip(questions, single_summaries, batched_summaries):
+        similarity = cosine_similarity(get_text_embedding(embedding_client, config, single, logger), get_text_embedding(embedding_client, config, batched, logger))
+        pairs.append({
+            "question": question,
+            "single": single,
+            "batched": batched,
+            "similarity": float(similarity),
+            "refusal_agrees": (REFUSAL_SENTINEL in single) == (REFUSAL_SENTINEL in batched),
+        })
+
+    similarities = [pair["similarity"] for pair in pairs]
+    return {
+        "questions": len(pairs),
+        "batch_size": batch_size,
+        "mean_similarity": float(np.mean(similarities)) if pairs else 0.0,
+        "min_similarity": float(np.min(similarities)) if pairs else 0.0,
+        "refusal_agreement": sum(pair["refusal_agrees"] for pair in pairs) / len(pairs) if pairs else 0.0,
+        "mean_single_words": float(np.mean([len(pair["single"].split()) for pair in pairs])) if pairs else 0.0,
+        "mean_batched_words": float(np.mean([len(pair["batched"].split()) for pair in pairs])) if pairs else 0.0,
+        "pairs": pairs,
+    }
+
+
 def generate_follow_up_question(chat_client: AzureOpenAI, config: ApiConfiguration, text: str, logger: logging.Logger) -> str:
     """
     Generates a follow-up question using the OpenAI API.
@@ -257,11 +524,8 @@ def generate_follow_up_question(chat_client: AzureOpenAI, config: ApiConfigurati
     Raises:
         BadRequestError: If the API request fails.
     """
-    messages = [
-        {"role": "system", "content": FOLLOW_UP_PROMPT},
-        {"role": "user", "content": text},
-    ]
-    response = call_openai_chat(chat_client, messages, config, logger)
+    messages = follow_up_messages(text)
+    response = call_openai_chat(chat_client, messages, config, logger, stage="follow_up")
     return response
 
 
@@ -281,14 +545,460 @@ def assess_follow_up_on_topic(chat_client: AzureOpenAI, config: ApiConfiguration
     Raises:
         BadRequestError: If the API request fails.
     """
-    messages = [
-        {"role": "system", "content": FOLLOW_UP_ON_TOPIC_PROMPT},
-        {"role": "user", "content": follow_up},
-    ]
-    response = call_openai_chat(chat_client, messages, config, logger)
+    messages = on_topic_messages(follow_up)
+    response = call_openai_chat(chat_client, messages, config, logger, stage="on_topic")
     return response
 
-def process_questions(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, questions: List[str], processed_question_chunks: List[Dict[str, Any]], logger: logging.Logger) -> List[TestResult]:
+def generate_follow_up_with_topic(chat_client: AzureOpenAI, config: ApiConfiguration, text: str, logger: logging.Logger) -> Tuple[str, str]:
+    """
+    Generates a follow-up question and checks whether it is about AI in a single structured completion.
+
+    Falls back to generate_follow_up_question and assess_follow_up_on_topic if the response does not match the schema.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance.
+        config (ApiConfiguration): The API configuration instance.
+        text (str): The text to generate a follow-up question about.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        Tuple[str, str]: The follow-up question, and 'yes' if it is about AI, 'no' otherwise.
+
+    Raises:
+        BadRequestError: If the API request fails.
+    """
+    messages = fused_follow_up_messages(text)
+    response = call_openai_chat(chat_client, messages, config, logger, response_format={"type": "json_object"}, stage="fused_follow_up")
+
+    try:
+        return parse_fused_follow_up(response)
+    except ValueError as e:
+        # Fall back to the original two-call path rather than losing the follow-up
+        logger.warning("Fused follow-up response rejected (%s), falling back to separate calls", e)
+        follow_up = generate_follow_up_question(chat_client, config, text, logger)
+        return follow_up, assess_follow_up_on_topic(chat_client, config, follow_up, logger)
+
+
+def parse_fused_follow_up(response: str) -> Tuple[str, str]:
+    """
+    Validates a fused follow-up response against its schema.
+
+    Args:
+        response (str): The raw completion, expected to be {"follow_up": str, "on_topic": "yes" | "no"}.
+
+    Returns:
+        Tuple[str, str]: The follow-up question and the normalised on-topic answer, 'yes' or 'no'.
+
+    Raises:
+        ValueError: If the response is not JSON or does not match the schema.
+    """
+    try:
+        payload = json.loads(response)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"response is not JSON: {e}")
+
+    if not isinstance(payload, dict):
+        raise ValueError("response is not a JSON object")
+
+    follow_up = payload.get("follow_up")
+    if not isinstance(follow_up, str) or not follow_up.strip():
+        raise ValueError("follow_up is missing or empty")
+
+    on_topic = str(payload.get("on_topic", "")).strip().strip(".").lower()
+    if on_topic not in {"yes", "no"}:
+        raise ValueError(f"on_topic is {payload.get('on_topic')!r}, expected 'yes' or 'no'")
+
+    return follow_up.strip(), on_topic
+
+def deduplicate_questions(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, questions: List[str], logger: logging.Logger, persona_strategy: PersonaStrategy = None) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Removes questions that are semantically near-duplicates of an earlier question.
+
+    All questions are embedded in one batched call and compared in a single pairwise similarity matrix. When
+    config.regenerateDuplicateQuestions is set and a persona strategy is given, replacements are generated for the
+    removed questions and checked against the survivors in the same way.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance, used to generate replacements.
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        questions (List[str]): The generated questions.
+        logger (logging.Logger): The logger instance.
+        persona_strategy (PersonaStrategy): The persona strategy that generated the questions, used for replacements.
+
+    Returns:
+        Tuple[List[str], Dict[str, Any]]: The questions to process, and a report of each removed question and the kept question it duplicated.
+    """
+    deduplicator = QuestionDeduplicator(config.questionDedupThreshold)
+    kept_questions: List[str] = []
+    kept_embeddings = None
+    removed = []
+    candidates = questions
+
+    for round_number in range(1 + MAX_DEDUP_ROUNDS):
+        if not candidates:
+            break
+
+        embeddings = get_text_embeddings(embedding_client, config, candidates, logger)
+        selection = deduplicator.select(embeddings, kept_embeddings)
+
+        for duplicate in selection["duplicates"]:
+            duplicate_of = duplicate["duplicate_of"]
+            removed.append({
+                "question": candidates[duplicate["position"]],
+                "duplicate_of": kept_questions[-1 - duplicate_of] if duplicate_of < 0 else candidates[duplicate_of],
+                "similarity": duplicate["similarity"],
+                "round": round_number,
+            })
+
+        kept_questions.extend(candidates[position] for position in selection["kept"])
+        kept_rows = embeddings[selection["kept"]]
+        kept_embeddings = kept_rows if kept_embeddings is None else np.vstack([kept_embeddings, kept_rows])
+
+        # Ask the persona for as many new questions as were removed, then check those too
+        shortfall = len(questions) - len(kept_questions)
+        if shortfall <= 0 or not (config.regenerateDuplicateQuestions and persona_strategy):
+            break
+        logger.info("Regenerating %s questions to replace duplicates", shortfall)
+        candidates = persona_strategy.generate_questions(chat_client, config, shortfall, logger)[:shortfall]
+
+    logger.info("Question deduplication kept %s of %s candidates, removed %s duplicates", len(kept_questions), len(kept_questions) + len(removed), len(removed))
+    return kept_questions, {"threshold": config.questionDedupThreshold, "kept": len(kept_questions), "removed": removed}
+
+
+def build_topic_classifier(embedding_client: AzureOpenAI, config: ApiConfiguration, processed_question_chunks: List[Dict[str, Any]], chunk_index: ChunkIndex, logger: logging.Logger) -> TopicClassifier:
+    """
+    Builds the local follow-up topic classifier from a labelled prototype file or, without one, the knowledge-base centroid.
+
+    Args:
+        embedding_client (AzureOpenAI): The OpenAI client instance for embedding the prototype questions.
+        config (ApiConfiguration): The API configuration instance.
+        processed_question_chunks (List[Dict[str, Any]]): The processed chunks, if they were loaded.
+        chunk_index (ChunkIndex): The chunk index, used for the centroid when the chunks were not loaded.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        TopicClassifier: The classifier.
+
+    Raises:
+        ValueError: If there is no prototype file and no local chunk embeddings to take the centroid of.
+    """
+    band = tuple(config.topicClassifierBand) if config.topicClassifierBand else None    # None picks the default for the kind of prototypes
+    if config.topicPrototypeFile:
+        on_topic, off_topic = load_topic_prototypes(config.topicPrototypeFile)
+        embeddings = get_text_embeddings(embedding_client, config, on_topic + off_topic, logger)
+        logger.info("Topic classifier using %s on-topic and %s off-topic prototypes", len(on_topic), len(off_topic))
+        return TopicClassifier(embeddings[:len(on_topic)], embeddings[len(on_topic):], band)
+
+    if processed_question_chunks:
+        embeddings, _ = build_embedding_matrix(processed_question_chunks)
+    elif getattr(chunk_index, "embeddings", None) is not None:
+        embeddings = chunk_index.embeddings
+    else:
+        raise ValueError("Topic classifier needs topicPrototypeFile when the chunk embeddings are not available locally")
+    logger.info("Topic classifier using the centroid of %s chunk embeddings", embeddings.shape[0])
+    return TopicClassifier.from_centroid(embeddings, band)
+
+def assess_follow_ups_locally(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, question_results: List[TestResult], topic_classifier: TopicClassifier, logger: logging.Logger, audit: random.Random = None) -> None:
+    """
+    Fills in follow_up_on_topic for several results with one batched embedding call, asking the LLM only when the
+    local score is inside the uncertainty band, or for a sample of the confident ones to measure agreement.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance, used for the LLM fallback.
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        question_results (List[TestResult]): The results whose follow-up questions need assessing.
+        topic_classifier (TopicClassifier): The local classifier.
+        logger (logging.Logger): The logger instance.
+        audit (random.Random): The generator drawing the audit sample, for callers assessing a few follow-ups at a time.
+
+    Returns:
+        None
+    """
+    start = time.monotonic()
+    verdicts = topic_classifier.classify([result.follow_up for result in question_results], lambda texts: get_text_embeddings(embedding_client, config, texts, logger))
+    classify_seconds = (time.monotonic() - start) / len(question_results)
+    audit = audit or random.Random(0)
+
+    for question_result, (score, verdict) in zip(question_results, verdicts):
+        question_result.follow_up_topic_score = score
+        question_result.follow_up_topic_verdict = verdict
+        question_result.stage_timings["on_topic"] = classify_seconds
+        if verdict == UNCERTAIN or audit.random() < config.topicClassifierAuditRate:
+            with timed_stage(question_result, "on_topic"):
+                question_result.follow_up_on_topic = assess_follow_up_on_topic(chat_client, config, question_result.follow_up, logger)
+            question_result.follow_up_topic_source = "llm"
+        else:
+            question_result.follow_up_on_topic = verdict
+            question_result.follow_up_topic_source = "classifier"
+
+    logger.info("Topic classifier decided %s of %s follow-ups locally", sum(1 for result in question_results if result.follow_up_topic_source == "classifier"), len(question_results))
+
+def topic_agreement_report(question_results: List[TestResult]) -> Dict[str, Any]:
+    """
+    Compares the local topic classifier with the LLM for the follow-ups both assessed.
+
+    Args:
+        question_results (List[TestResult]): The test results.
+
+    Returns:
+        Dict[str, Any]: The agreement report from summarise_topic_agreement.
+    """
+    return summarise_topic_agreement(topic_agreement_records(question_results))
+
+def topic_agreement_records(question_results: List[TestResult]) -> List[Dict[str, Any]]:
+    """
+    Returns the summarise_topic_agreement entries of the results whose follow-up the topic classifier assessed.
+    """
+    return [
+        {
+            "follow_up": result.follow_up,
+            "score": result.follow_up_topic_score,
+            "classifier": result.follow_up_topic_verdict,
+            "llm": result.follow_up_on_topic if result.follow_up_topic_source == "llm" else "",
+        }
+        for result in question_results if result.follow_up_topic_source
+    ]
+
+def search_chunk_index(embedding_client: AzureOpenAI, config: ApiConfiguration, chunk_index: ChunkIndex, summaries: List[str], logger: logging.Logger) -> List[Tuple[float, str]]:
+    """
+    Finds the best chunk for each enriched question summary, embedding the summaries EMBEDDING_BATCH_SIZE to a request
+    unless retrieval is lexical.
+
+    Args:
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        chunk_index (ChunkIndex): The index to search.
+        summaries (List[str]): The enriched question summaries.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        List[Tuple[float, str]]: The best score and matching summary per query, in order.
+    """
+    if isinstance(chunk_index, LexicalChunkIndex):
+        # Lexical retrieval needs only the text, so no embedding call is made at all
+        return best_index_hits(chunk_index, summaries)
+    if not summaries:
+        return []
+    # One request per batch, each retried and hedged on its own
+    embeddings = [get_text_embeddings(embedding_client, config, summaries[start:start + EMBEDDING_BATCH_SIZE], logger) for start in range(0, len(summaries), EMBEDDING_BATCH_SIZE)]
+    return best_index_hits(chunk_index, summaries, np.vstack(embeddings))
+
+def best_index_hits(chunk_index: ChunkIndex, summaries: List[str], embeddings: np.ndarray = None) -> List[Tuple[float, str]]:
+    """
+    Finds the best chunk for each enriched question summary already embedded, or not embedded at all for a
+    LexicalChunkIndex.
+
+    Args:
+        chunk_index (ChunkIndex): The index to search.
+        summaries (List[str]): The enriched question summaries.
+        embeddings (np.ndarray): The embeddings of the summaries, one row each, None for a LexicalChunkIndex.
+
+    Returns:
+        List[Tuple[float, str]]: The best score and matching summary per query, in order.
+    """
+    with profile_stage("similarity_search"):
+        if isinstance(chunk_index, LexicalChunkIndex):
+            return chunk_index.best_text_hits(summaries)
+        if isinstance(chunk_index, HybridChunkIndex):
+            return chunk_index.best_hybrid_hits(summaries, embeddings)
+        return chunk_index.best_hits(embeddings)
+
+def check_retrieval_mode(config: ApiConfiguration) -> None:
+    """
+    Checks that config.retrievalMode is known and can run with the rest of the configuration.
+
+    Raises:
+        ValueError: If the mode is unknown, or is lexical or hybrid with a memory-mapped index, which is dense only.
+    """
+    if config.retrievalMode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {config.retrievalMode}")
+    if config.retrievalMode != "dense" and config.chunkIndexDir:
+        raise ValueError(f"Retrieval mode '{config.retrievalMode}' builds its index from the chunk JSON, set chunkIndexDir to None")
+
+def build_chunk_index(config: ApiConfiguration, source_dir: str) -> ChunkIndex:
+    """
+    Builds the dense, lexical or hybrid chunk index for the configuration, for runs that search one index for every
+    question: batch runs and queue workers.
+
+    Args:
+        config (ApiConfiguration): The API configuration instance.
+        source_dir (str): The directory containing the processed chunks, unless config.chunkIndexDir is set.
+
+    Returns:
+        ChunkIndex: The index.
+    """
+    check_retrieval_mode(config)
+    if config.chunkIndexDir:
+        return MemoryMappedChunkIndex(config.chunkIndexDir, config.searchBlockSize, config.processingThreads)
+    chunks = read_processed_chunks(source_dir)
+    if config.retrievalMode == "lexical":
+        return LexicalChunkIndex(chunks)
+    if config.retrievalMode == "hybrid":
+        return HybridChunkIndex(chunks, config.searchBlockSize, config.processingThreads, config.hybridCandidates)
+    return InMemoryChunkIndex(chunks, config.searchBlockSize, config.processingThreads)
+
+def get_hit_threshold(config: ApiConfiguration, chunk_index: ChunkIndex) -> float:
+    """
+    Returns the score above which a best hit counts as a hit. BM25 scores are not cosine similarities, so lexical
+    retrieval has its own hit threshold.
+    """
+    return config.lexicalHitThreshold if isinstance(chunk_index, LexicalChunkIndex) else SIMILARITY_THRESHOLD
+
+def scan_question_chunks(embedding_client: AzureOpenAI, config: ApiConfiguration, question_result: TestResult, processed_question_chunks: List[Dict[str, Any]], logger: logging.Logger) -> Tuple[float, str]:
+    """
+    Embeds the enriched question and scans the processed chunks for its best hit, marking the question as a hit if
+    any chunk is similar enough.
+
+    Args:
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        question_result (TestResult): The result of the question, holding its enriched summary.
+        processed_question_chunks (List[Dict[str, Any]]): The list of pre-processed question chunks.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        Tuple[float, str]: The highest similarity and the summary of the chunk it belongs to, None if there is none.
+    """
+    # Obtain the text embedding for the enriched question using OpenAI's embedding model.
+    embedding = get_text_embedding(embedding_client, config, question_result.enriched_question_summary, logger)  # Get embedding for the enriched question
+
+    with profile_stage("similarity_search"):
+        best_hit_relevance, best_hit_summary = scan_chunks(processed_question_chunks, embedding)
+
+    # If similarity exceeds the defined threshold, mark the question as a hit
+    if best_hit_relevance > SIMILARITY_THRESHOLD:
+        question_result.hit = True
+    return best_hit_relevance, best_hit_summary
+
+def scan_chunks(processed_question_chunks: List[Dict[str, Any]], embedding: np.ndarray) -> Tuple[float, str]:
+    """
+    Scans the processed chunks for the one most similar to an embedding.
+
+    Args:
+        processed_question_chunks (List[Dict[str, Any]]): The list of pre-processed question chunks.
+        embedding (np.ndarray): The embedding of the enriched question.
+
+    Returns:
+        Tuple[float, str]: The highest similarity, 0 if none is positive, and the summary of its chunk, None if there is none.
+    """
+    # Initialize variables to track the highest similarity score and the corresponding summary.
+    best_hit_relevance = 0      # To track the highest similarity score
+    best_hit_summary = None     # To track the summary corresponding to the highest similarity
+
+    # Iterate through the processed chunks to find the best hit
+    for chunk in processed_question_chunks:
+        # Ensure the chunk is valid and is a dictionary.
+        if chunk and isinstance(chunk, dict):
+            gpt4_embedding = chunk.get("embedding")
+            similarity = cosine_similarity(gpt4_embedding, embedding)
+
+            # Check if this is the best match so far
+            if similarity > best_hit_relevance:
+                best_hit_relevance = similarity
+                best_hit_summary = chunk.get("summary")
+    return best_hit_relevance, best_hit_summary
+
+def process_question_graph(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, question_result: TestResult, processed_question_chunks: List[Dict[str, Any]], logger: logging.Logger, executor: ThreadPoolExecutor, enriched_summary: str = None, batch_hit: Tuple[float, str] = None, upfront_timings: Dict[str, float] = None, hit_threshold: float = SIMILARITY_THRESHOLD, short_circuit_policy: ShortCircuitPolicy = None, topic_classifier: TopicClassifier = None) -> bool:
+    """
+    Runs the stages of one question as a dependency graph rather than a chain. The Gemini judge and the search only
+    need the enriched summary, so the judge runs alongside the search, follow-up and on-topic check, and the
+    critical path is enrichment, then the longer of the two branches.
+
+        enrichment -> gemini
+        enrichment -> retrieval -> follow_up -> on_topic
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance for generating enriched summaries and follow-up questions.
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        question_result (TestResult): The result of the question, filled in by the stages, with their spans and critical path.
+        processed_question_chunks (List[Dict[str, Any]]): The list of pre-processed question chunks, scanned when there is no batch_hit.
+        logger (logging.Logger): The logger instance.
+        executor (ThreadPoolExecutor): Runs the stages, with at least two workers.
+        enriched_summary (str): The enriched summary if it was generated up front.
+        batch_hit (Tuple[float, str]): The best hit if the batched index search found it up front.
+        upfront_timings (Dict[str, float]): Seconds per question of the stages run up front.
+        hit_threshold (float): The score above which a batch_hit counts as a hit.
+        short_circuit_policy (ShortCircuitPolicy): Optional rules that stop the stages of a failed question.
+        topic_classifier (TopicClassifier): Optional local classifier, in which case the on-topic check is left to the caller.
+
+    Returns:
+        bool: True if the follow-up is left for the topic classifier.
+
+    Raises:
+        Exception: The first error raised by a stage, once the stages already running have finished.
+    """
+    upfront_timings = upfront_timings or {}
+    retry_policy = get_retry_policy(config)
+
+    def enrichment(results: Dict[str, Any]) -> str:
+        # Returns the short-circuit rule that stops the remaining stages, if any
+        if enriched_summary is not None:
+            question_result.enriched_question_summary = enriched_summary
+            question_result.stage_timings["enrichment"] = upfront_timings.get("enrichment", 0.0)
+        else:
+            with timed_stage(question_result, "enrichment"):
+                question_result.enriched_question_summary = generate_enriched_question(chat_client, config, question_result.question, logger)
+        return short_circuit_policy.check(STAGE_ENRICHMENT, question_result.enriched_question_summary) if short_circuit_policy else ""
+
+    def gemini(results: Dict[str, Any]) -> None:
+        if results["enrichment"]:
+            return
+        retry_policy.check_deadline()
+        with timed_stage(question_result, "gemini"):
+            question_result.gemini_evaluation = gemini_evaluator.evaluate(question_result.question, question_result.enriched_question_summary)
+
+    def retrieval(results: Dict[str, Any]) -> None:
+        if results["enrichment"]:
+            return
+        if batch_hit is not None:
+            question_result.hit_relevance, question_result.hit_summary = batch_hit
+            question_result.hit = bool(question_result.hit_relevance > hit_threshold)
+            question_result.stage_timings["retrieval"] = upfront_timings.get("retrieval", 0.0)
+        else:
+            with timed_stage(question_result, "retrieval"):
+                question_result.hit_relevance, question_result.hit_summary = scan_question_chunks(embedding_client, config, question_result, processed_question_chunks, logger)
+
+    def follow_up(results: Dict[str, Any]) -> str:
+        # Returns the short-circuit rule that stops the on-topic check, if any
+        if results["enrichment"] or not question_result.hit_summary:
+            return ""
+        with timed_stage(question_result, "follow_up"):
+            if config.fuseFollowUpStages:
+                question_result.follow_up, question_result.follow_up_on_topic = generate_follow_up_with_topic(chat_client, config, question_result.hit_summary, logger)
+                return ""
+            question_result.follow_up = generate_follow_up_question(chat_client, config, question_result.hit_summary, logger)
+        return short_circuit_policy.check(STAGE_FOLLOW_UP, question_result.follow_up) if short_circuit_policy else ""
+
+    def on_topic(results: Dict[str, Any]) -> bool:
+        # Returns True if the check is left for the topic classifier
+        if results["enrichment"] or results["follow_up"] or not question_result.follow_up or config.fuseFollowUpStages:
+            return False
+        if topic_classifier is not None:
+            return True
+        with timed_stage(question_result, "on_topic"):
+            question_result.follow_up_on_topic = assess_follow_up_on_topic(chat_client, config, question_result.follow_up, logger)
+        return False
+
+    graph = StageGraph()
+    graph.add("enrichment", enrichment)
+    graph.add("gemini", gemini, ["enrichment"])
+    graph.add("retrieval", retrieval, ["enrichment"])
+    graph.add("follow_up", follow_up, ["retrieval"])
+    graph.add("on_topic", on_topic, ["follow_up"])
+    try:
+        results = graph.run(executor)
+    finally:
+        question_result.stage_spans = dict(graph.spans)
+        question_result.critical_path = graph.critical_path()
+        logger.debug("Stage graph: %s", format_spans(question_result.stage_spans))
+
+    question_result.skip_reason = results["enrichment"] or results["follow_up"]
+    return results["on_topic"]
+
+def process_questions(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, questions: List[str], processed_question_chunks: List[Dict[str, Any]], logger: logging.Logger, chunk_index: ChunkIndex = None, topic_classifier: TopicClassifier = None) -> List[TestResult]:
     """
     Processes a list of test questions and evaluates their relevance based on their similarity to pre-processed question chunks.
 
@@ -299,6 +1009,13 @@ def process_questions(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, c
         questions (List[str]): The list of test questions to be processed.
         processed_question_chunks (List[Dict[str, Any]]): The list of pre-processed question chunks.
         logger (logging.Logger): The logger instance.
+        chunk_index (ChunkIndex): Optional search index used instead of scanning processed_question_chunks. All questions are
+            enriched and embedded first and the index is searched once for the whole batch. A LexicalChunkIndex is searched
+            by the enriched text alone, and a HybridChunkIndex by both the text and the embedding.
+        topic_classifier (TopicClassifier): Optional local classifier used instead of assess_follow_up_on_topic. The follow-ups
+            are classified together after the loop and only the uncertain ones are sent to the LLM.
+
+    With config.stageGraph on, the stages of each question run as a dependency graph, see process_question_graph.
 
     Returns:
         List[TestResult]: A list of test results, each containing the original question, its enriched version, its relevance to the pre-processed chunks, the follow-up question, and whether the follow-up question is on-topic.
@@ -308,65 +1025,545 @@ def process_questions(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, c
     """
     # Initialize an empty list to store the results of each processed question.
     question_results: List[TestResult] = []
-    
+    pending_topic_results: List[TestResult] = []     # Follow-ups left for the local topic classifier
+
+    # Questions the short-circuit policy rejects as they stand are never sent to any stage.
+    short_circuit_policy = ShortCircuitPolicy(config.shortCircuitRules) if config.shortCircuitRules else None
+    question_skip_reasons = [short_circuit_policy.check(STAGE_QUESTION, question) if short_circuit_policy else "" for question in questions]
+    live_positions = [position for position, skip_reason in enumerate(question_skip_reasons) if not skip_reason]
+
+    enriched_summaries = None
+    batch_hits = None
+    upfront_stop = ""       # Why the up-front stages could not finish, in which case no question is processed further
+    upfront_timings: Dict[str, float] = {}      # Seconds per question of the stages run up front for the whole batch
+    try:
+        # With batched enrichment on, enrich the questions several per request before anything else.
+        if config.enrichmentBatchSize > 1:
+            start = time.monotonic()
+            with profile_stage("enrichment"):
+                batch = generate_enriched_questions(chat_client, config, [questions[position] for position in live_positions], config.enrichmentBatchSize, logger)
+            enriched_summaries = dict(zip(live_positions, batch))
+            upfront_timings["enrichment"] = (time.monotonic() - start) / max(1, len(live_positions))
+
+        # With a chunk index, enrich and embed every question up front so the index is streamed once for the whole batch.
+        if chunk_index is not None:
+            if enriched_summaries is None:
+                start = time.monotonic()
+                enriched_summaries = {}
+                for position in live_positions:
+                    with profile_stage("enrichment"):
+                        enriched_summaries[position] = generate_enriched_question(chat_client, config, questions[position], logger)
+                upfront_timings["enrichment"] = (time.monotonic() - start) / max(1, len(live_positions))
+            start = time.monotonic()
+            searchable_positions = [position for position in live_positions if not (short_circuit_policy and short_circuit_policy.check(STAGE_ENRICHMENT, enriched_summaries[position]))]
+            with profile_stage("retrieval"):
+                hits = search_chunk_index(embedding_client, config, chunk_index, [enriched_summaries[position] for position in searchable_positions], logger)
+            batch_hits = dict(zip(searchable_positions, hits))
+            upfront_timings["retrieval"] = (time.monotonic() - start) / max(1, len(searchable_positions))
+    except Exception as e:
+        upfront_stop = unprocessed_reason(e)
+        if not upfront_stop:
+            raise
+        logger.error(f"Up-front stages stopped, {len(live_positions)} questions left unprocessed: {e}")
+
+    hit_threshold = get_hit_threshold(config, chunk_index)
+
     # Loop through each question in the provided list of questions.
-    for question in questions:
+    retry_policy = get_retry_policy(config)
+    stage_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage") if config.stageGraph else None  # One worker per branch of the stage graph
+    for position, question in enumerate(questions):
         # Create a new TestResult object for the current question to store its results.
         question_result = TestResult()
         question_result.question = question     # Store the original question
 
-        question_result.enriched_question_summary = generate_enriched_question(chat_client, config, question, logger)  # Generate enriched question summary
-        
-        # Obtain the text embedding for the enriched question using OpenAI's embedding model.
-        embedding = get_text_embedding(embedding_client, config, question_result.enriched_question_summary, logger)  # Get embedding for the enriched question
-
-        # Initialize variables to track the highest similarity score and the corresponding summary.
-        best_hit_relevance = 0      # To track the highest similarity score
-        best_hit_summary = None     # To track the summary corresponding to the highest similarity
-
-        # Iterate through the processed chunks to find the best hit
-        for chunk in processed_question_chunks:
-            # Ensure the chunk is valid and is a dictionary.
-            if chunk and isinstance(chunk, dict):
-                gpt4_embedding = chunk.get("embedding")
-                similarity = cosine_similarity(gpt4_embedding, embedding)
-
-                # If similarity exceeds the defined threshold, mark the question as a hit
-                if similarity > SIMILARITY_THRESHOLD:
-                    question_result.hit = True
-
-                # Check if this is the best match so far
-                if similarity > best_hit_relevance:
-                    best_hit_relevance = similarity
-                    best_hit_summary = chunk.get("summary") 
-
-         # Store the highest relevance score and the associated summary in the result.
-        question_result.hit_relevance = best_hit_relevance
-        question_result.hit_summary = best_hit_summary
-
-        # If a relevant summary (best hit) exists, generate a follow-up question and assess its topic relevance.
-        if question_result.hit_summary:
-            # Generate a follow-up question based on the best hit summary.  
-            question_result.follow_up = generate_follow_up_question(chat_client, config, question_result.hit_summary, logger)
-
-            # Check if the follow-up question is relevant to AI and mark it accordingly.  
-            question_result.follow_up_on_topic = assess_follow_up_on_topic(chat_client, config, question_result.follow_up, logger)  
+        # Stop here if the question itself is a known failure, e.g. a generation preamble.
+        question_result.skip_reason = question_skip_reasons[position]
+        if question_result.skip_reason:
+            question_results.append(question_result)
+            continue
+
+        # Past the run deadline, or after the up-front stages stopped, the question is marked unprocessed rather than hung.
+        if upfront_stop or retry_policy.deadline_passed():
+            question_result.enriched_question_summary = (enriched_summaries or {}).get(position, "")
+            question_result.skip_reason = upfront_stop or SKIP_RUN_DEADLINE
+            question_results.append(question_result)
+            continue
+
+        try:
+            if stage_executor is not None:
+                # Run the stages as a graph, with the Gemini judge alongside the search and follow-up.
+                if process_question_graph(chat_client, embedding_client, config, question_result, processed_question_chunks, logger, stage_executor,
+                                          (enriched_summaries or {}).get(position), (batch_hits or {}).get(position), upfront_timings, hit_threshold, short_circuit_policy, topic_classifier):
+                    pending_topic_results.append(question_result)
+                question_results.append(question_result)
+                continue
+
+            if enriched_summaries is not None and position in enriched_summaries:
+                question_result.enriched_question_summary = enriched_summaries[position]  # Take the enriched question summary generated up front
+                question_result.stage_timings["enrichment"] = upfront_timings.get("enrichment", 0.0)
+            else:
+                with timed_stage(question_result, "enrichment"):
+                    question_result.enriched_question_summary = generate_enriched_question(chat_client, config, question, logger)  # Generate enriched question summary
+
+            # Stop here if the enrichment is a refusal, there is nothing worth embedding, searching or judging.
+            if short_circuit_policy is not None:
+                question_result.skip_reason = short_circuit_policy.check(STAGE_ENRICHMENT, question_result.enriched_question_summary)
+                if question_result.skip_reason:
+                    question_results.append(question_result)
+                    continue
+
+            if batch_hits is not None:
+                # Take the best hit already found by the batched index search
+                best_hit_relevance, best_hit_summary = batch_hits[position]
+                question_result.hit = best_hit_relevance > hit_threshold
+                question_result.stage_timings["retrieval"] = upfront_timings.get("retrieval", 0.0)
+            else:
+                with timed_stage(question_result, "retrieval"):
+                    best_hit_relevance, best_hit_summary = scan_question_chunks(embedding_client, config, question_result, processed_question_chunks, logger)
+
+             # Store the highest relevance score and the associated summary in the result.
+            question_result.hit_relevance = best_hit_relevance
+            question_result.hit_summary = best_hit_summary
+
+            # If a relevant summary (best hit) exists, generate a follow-up question and assess its topic relevance.
+            if question_result.hit_summary:
+                if config.fuseFollowUpStages:
+                    # Generate the follow-up question and its on-topic check in one structured completion.
+                    with timed_stage(question_result, "follow_up"):
+                        question_result.follow_up, question_result.follow_up_on_topic = generate_follow_up_with_topic(chat_client, config, question_result.hit_summary, logger)
+                else:
+                    # Generate a follow-up question based on the best hit summary.  
+                    with timed_stage(question_result, "follow_up"):
+                        question_result.follow_up = generate_follow_up_question(chat_client, config, question_result.hit_summary, logger)
+
+                    # Check if the follow-up question is relevant to AI and mark it accordingly, unless the follow-up is itself a refusal.
+                    if short_circuit_policy is not None:
+                        question_result.skip_reason = short_circuit_policy.check(STAGE_FOLLOW_UP, question_result.follow_up)
+                    if not question_result.skip_reason and topic_classifier is not None:
+                        pending_topic_results.append(question_result)
+                    elif not question_result.skip_reason:
+                        with timed_stage(question_result, "on_topic"):
+                            question_result.follow_up_on_topic = assess_follow_up_on_topic(chat_client, config, question_result.follow_up, logger)  
         
-        # Use Gemini to evaluate the Azure OpenAI enriched summary
-        question_result.gemini_evaluation = gemini_evaluator.evaluate(
-            question_result.question,                   # This is the original question
-            question_result.enriched_question_summary   # This is the summary generated by Azure OpenAI
-            ) 
+            # Use Gemini to evaluate the Azure OpenAI enriched summary
+            retry_policy.check_deadline()
+            with timed_stage(question_result, "gemini"):
+                question_result.gemini_evaluation = gemini_evaluator.evaluate(
+                    question_result.question,                   # This is the original question
+                    question_result.enriched_question_summary   # This is the summary generated by Azure OpenAI
+                    ) 
+        except Exception as e:
+            question_result.skip_reason = unprocessed_reason(e)
+            if not question_result.skip_reason:
+                raise
+            logger.error(f"Question left unprocessed: {e}")
 
         # Append the result for the current question to the results list.
         question_results.append(question_result)
 
+    if stage_executor is not None:
+        stage_executor.shutdown()
+
+    # Classify the follow-ups together, so they are embedded in one call and only the uncertain ones cost a chat call.
+    if pending_topic_results:
+        try:
+            assess_follow_ups_locally(chat_client, embedding_client, config, pending_topic_results, topic_classifier, logger)
+        except Exception as e:
+            if not unprocessed_reason(e):
+                raise
+            logger.error(f"Follow-up topic checks left unprocessed: {e}")
+            for question_result in pending_topic_results:
+                question_result.skip_reason = question_result.skip_reason or unprocessed_reason(e)
+
     # Log the total number of processed questions for debugging or tracking purposes.
     logger.debug("Total tests processed: %s", len(question_results))
 
     # Return the list of all test results.
     return question_results
 
+def estimate_api_calls(question_result: TestResult, config: ApiConfiguration) -> float:
+    """
+    Estimates the API calls one processed question cost from the stages its result shows were run.
+
+    Args:
+        question_result (TestResult): The result of the question.
+        config (ApiConfiguration): The API configuration instance the question was processed with.
+
+    Returns:
+        float: The number of calls, with batched enrichment shared across its batch.
+    """
+    if not question_result.enriched_question_summary:
+        return 0.0
+
+    api_calls = 1.0 / max(1, config.enrichmentBatchSize)
+    if question_result.hit_summary or question_result.hit_relevance or question_result.gemini_evaluation:
+        api_calls += 0 if config.retrievalMode == "lexical" else 1
+    if question_result.follow_up:
+        api_calls += 1
+        if question_result.follow_up_on_topic and not config.fuseFollowUpStages and question_result.follow_up_topic_source != "classifier":
+            api_calls += 1
+    if question_result.gemini_evaluation:
+        api_calls += 1
+    return api_calls
+
+def process_questions_adaptively(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, questions: List[str], processed_question_chunks: List[Dict[str, Any]], logger: logging.Logger, chunk_index: ChunkIndex = None, topic_classifier: TopicClassifier = None) -> Tuple[List[TestResult], Dict[str, Any]]:
+    """
+    Processes the questions in a random order, a batch at a time, until the confidence intervals of the run metrics
+    are narrow enough or the question or API-call budget is spent.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance for generating enriched summaries and follow-up questions.
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        questions (List[str]): The list of test questions, of which only as many as needed are processed.
+        processed_question_chunks (List[Dict[str, Any]]): The list of pre-processed question chunks.
+        logger (logging.Logger): The logger instance.
+        chunk_index (ChunkIndex): Optional search index, as for process_questions.
+        topic_classifier (TopicClassifier): Optional local follow-up topic classifier, as for process_questions.
+
+    Returns:
+        Tuple[List[TestResult], Dict[str, Any]]: The results of the processed questions, in processing order, and the
+        stop summary with the stop reason and the interval of each metric.
+    """
+    stop_rule = SequentialStopRule(config.adaptiveTargetWidths, config.adaptiveConfidence, config.adaptiveMinQuestions, config.adaptiveMaxQuestions, config.adaptiveCostBudget)
+    order = list(questions)
+    random.Random(config.adaptiveSeed).shuffle(order)
+
+    question_results: List[TestResult] = []
+    deadline_passed = False
+    for start in range(0, len(order), config.adaptiveBatchSize):
+        if get_retry_policy(config).deadline_passed():
+            deadline_passed = True
+            break
+
+        batch = order[start:start + config.adaptiveBatchSize]
+        if config.adaptiveMaxQuestions is not None:
+            batch = batch[:config.adaptiveMaxQuestions - stop_rule.questions]
+
+        for question_result in process_questions(chat_client, embedding_client, config, batch, processed_question_chunks, logger, chunk_index, topic_classifier):
+            # Skipped and unprocessed questions have no real hit or score, counting them as misses would bias the intervals
+            if question_result.skip_reason:
+                stop_rule.skip(estimate_api_calls(question_result, config))
+            else:
+                stop_rule.update(question_result.hit, question_result.hit_relevance, question_result.gemini_evaluation, estimate_api_calls(question_result, config))
+            question_results.append(question_result)
+
+        if stop_rule.check():
+            break
+
+    stop_summary = stop_rule.summary()
+    stop_summary["stop_reason"] = stop_summary["stop_reason"] or (STOP_DEADLINE if deadline_passed else STOP_EXHAUSTED)
+    stop_summary["available_questions"] = len(questions)
+    logger.info("Adaptive run stopped after %s of %s questions: %s", stop_rule.questions, len(questions), stop_summary["stop_reason"])
+    return question_results, stop_summary
+
+# State of a worker process started by process_questions_in_workers
+_worker_state: Dict[str, Any] = {}
+
+def _init_question_worker(config: ApiConfiguration, index_handle: Dict[str, Any], topic_classifier: TopicClassifier = None) -> None:
+    """
+    Initializes a worker process: builds its own API clients and attaches to the parent's chunk index without copying it.
+
+    Args:
+        config (ApiConfiguration): The API configuration instance.
+        index_handle (Dict[str, Any]): The handle returned by the parent's ChunkIndex.worker_handle().
+        topic_classifier (TopicClassifier): Optional local follow-up topic classifier.
+
+    Returns:
+        None
+    """
+    _worker_state["config"] = config
+    _worker_state["chat_client"] = configure_openai_for_azure(config, "chat")
+    _worker_state["embedding_client"] = configure_openai_for_azure(config, "embedding")
+    _worker_state["chunk_index"] = attach_chunk_index(index_handle)
+    _worker_state["topic_classifier"] = topic_classifier
+
+def _process_question_slice(questions: List[str]) -> List[TestResult]:
+    """
+    Processes one slice of the questions inside a worker process.
+
+    Args:
+        questions (List[str]): The questions in this slice.
+
+    Returns:
+        List[TestResult]: The test results for the slice, in order.
+    """
+    return process_questions(_worker_state["chat_client"], _worker_state["embedding_client"], _worker_state["config"], questions, [], logger, _worker_state["chunk_index"], _worker_state["topic_classifier"])
+
+def process_questions_in_workers(config: ApiConfiguration, questions: List[str], chunk_index: ChunkIndex, num_workers: int, logger: logging.Logger, topic_classifier: TopicClassifier = None) -> List[TestResult]:
+    """
+    Processes the questions across worker processes that all search the same chunk index.
+
+    The index is loaded once by the caller and shared with the workers (shared memory or a memory-mapped file),
+    so adding workers multiplies neither memory nor start-up time.
+
+    Args:
+        config (ApiConfiguration): The API configuration instance.
+        questions (List[str]): The list of test questions to be processed.
+        chunk_index (ChunkIndex): An index that supports worker_handle(), e.g. SharedMemoryChunkIndex or MemoryMappedChunkIndex.
+        num_workers (int): The number of worker processes.
+        logger (logging.Logger): The logger instance.
+        topic_classifier (TopicClassifier): Optional local follow-up topic classifier, copied to each worker.
+
+    Returns:
+        List[TestResult]: The test results, in the same order as the questions.
+    """
+    # Several slices per worker keep every worker busy when some questions take longer than others
+    slice_size = max(1, -(-len(questions) // (num_workers * 4)))
+    question_slices = [questions[start:start + slice_size] for start in range(0, len(questions), slice_size)]
+    logger.info("Processing %s questions in %s slices across %s worker processes", len(questions), len(question_slices), num_workers)
+
+    question_results: List[TestResult] = []
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_question_worker, initargs=(config, chunk_index.worker_handle(), topic_classifier)) as executor:
+        for slice_results in executor.map(_process_question_slice, question_slices):
+            question_results.extend(slice_results)
+
+    return question_results
+
+def stream_questions(chat_client: AzureOpenAI, embedding_client: AzureOpenAI, config: ApiConfiguration, questions: Iterable[str], processed_question_chunks: List[Dict[str, Any]], logger: logging.Logger, writer: "ResultStreamWriter", chunk_index: ChunkIndex = None, topic_classifier: TopicClassifier = None) -> Dict[str, Any]:
+    """
+    Processes the questions as a stream: question source -> enrich -> embed -> search -> follow-up -> judge -> writer,
+    joined by queues of config.streamQueueSize. The stages calling an API each run config.processingThreads workers,
+    the search runs one. Only the questions in the queues are held in memory, each result is written in question
+    order as soon as it and those before it are judged, and a slow stage holds back the stages before it.
+
+    Every question is enriched on its own and searched on its own, the batched up-front stages of process_questions
+    are not used.
+
+    Args:
+        chat_client (AzureOpenAI): The OpenAI client instance for generating enriched summaries and follow-up questions.
+        embedding_client (AzureOpenAI): The OpenAI client instance for generating embeddings.
+        config (ApiConfiguration): The API configuration instance.
+        questions (Iterable[str]): The test questions, read one at a time.
+        processed_question_chunks (List[Dict[str, Any]]): The list of pre-processed question chunks, scanned when there is no chunk index.
+        logger (logging.Logger): The logger instance.
+        writer (ResultStreamWriter): Writes out each result.
+        chunk_index (ChunkIndex): Optional search index used instead of scanning processed_question_chunks.
+        topic_classifier (TopicClassifier): Optional local classifier used instead of assess_follow_up_on_topic, one follow-up at a time.
+
+    Returns:
+        Dict[str, Any]: The questions written, those left unprocessed, the seconds until the first result was written,
+        each stage's work and backpressure from StreamingPipeline.summary, and the topic agreement report if a
+        topic classifier was used.
+    """
+    short_circuit_policy = ShortCircuitPolicy(config.shortCircuitRules) if config.shortCircuitRules else None
+    hit_threshold = get_hit_threshold(config, chunk_index)
+    retry_policy = get_retry_policy(config)
+    topic_audit = random.Random(0)
+
+    def read_questions() -> Iterator[Dict[str, Any]]:
+        for question in questions:
+            question_result = TestResult()
+            question_result.question = question
+            question_result.skip_reason = short_circuit_policy.check(STAGE_QUESTION, question) if short_circuit_policy else ""
+            # "stopped" is set once no further stage may run, a follow-up refusal only stops the on-topic check
+            yield {"result": question_result, "embedding": None, "stopped": bool(question_result.skip_reason)}
+
+    def unless_stopped(stage: Callable[[Dict[str, Any]], None]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        # Runs a stage for the questions still going, marking those past the deadline or hit by an outage unprocessed
+        def run(item: Dict[str, Any]) -> Dict[str, Any]:
+            question_result = item["result"]
+            if item["stopped"]:
+                return item
+            if retry_policy.deadline_passed():
+                question_result.skip_reason = SKIP_RUN_DEADLINE
+                item["stopped"] = True
+                return item
+            try:
+                stage(item)
+            except Exception as e:
+                question_result.skip_reason = unprocessed_reason(e)
+                if not question_result.skip_reason:
+                    raise
+                logger.error(f"Question left unprocessed: {e}")
+                item["stopped"] = True
+            return item
+        return run
+
+    def enrich(item: Dict[str, Any]) -> None:
+        question_result = item["result"]
+        with timed_stage(question_result, "enrichment"):
+            question_result.enriched_question_summary = generate_enriched_question(chat_client, config, question_result.question, logger)
+        if short_circuit_policy is not None:
+            question_result.skip_reason = short_circuit_policy.check(STAGE_ENRICHMENT, question_result.enriched_question_summary)
+            item["stopped"] = bool(question_result.skip_reason)
+
+    def embed(item: Dict[str, Any]) -> None:
+        # Lexical retrieval needs only the text
+        if not isinstance(chunk_index, LexicalChunkIndex):
+            with timed_stage(item["result"], "retrieval"):
+                item["embedding"] = get_text_embedding(embedding_client, config, item["result"].enriched_question_summary, logger)
+
+    def search(item: Dict[str, Any]) -> None:
+        question_result = item["result"]
+        with timed_stage(question_result, "retrieval"):
+            if chunk_index is None:
+                with profile_stage("similarity_search"):
+                    question_result.hit_relevance, question_result.hit_summary = scan_chunks(processed_question_chunks, item["embedding"])
+            else:
+                embeddings = np.vstack([item["embedding"]]) if item["embedding"] is not None else None
+                question_result.hit_relevance, question_result.hit_summary = best_index_hits(chunk_index, [question_result.enriched_question_summary], embeddings)[0]
+            question_result.hit = bool(question_result.hit_relevance > hit_threshold)
+        item["embedding"] = None
+
+    def follow_up(item: Dict[str, Any]) -> None:
+        question_result = item["result"]
+        if not question_result.hit_summary:
+            return
+        if config.fuseFollowUpStages:
+            with timed_stage(question_result, "follow_up"):
+                question_result.follow_up, question_result.follow_up_on_topic = generate_follow_up_with_topic(chat_client, config, question_result.hit_summary, logger)
+            return
+
+        with timed_stage(question_result, "follow_up"):
+            question_result.follow_up = generate_follow_up_question(chat_client, config, question_result.hit_summary, logger)
+        if short_circuit_policy is not None:
+            question_result.skip_reason = short_circuit_policy.check(STAGE_FOLLOW_UP, question_result.follow_up)
+        if question_result.skip_reason:
+            return
+        if topic_classifier is not None:
+            assess_follow_ups_locally(chat_client, embedding_client, config, [question_result], topic_classifier, logger, topic_audit)
+        else:
+            with timed_stage(question_result, "on_topic"):
+                question_result.follow_up_on_topic = assess_follow_up_on_topic(chat_client, config, question_result.follow_up, logger)
+
+    def judge(item: Dict[str, Any]) -> None:
+        question_result = item["result"]
+        retry_policy.check_deadline()
+        with timed_stage(question_result, "gemini"):
+            question_result.gemini_evaluation = gemini_evaluator.evaluate(question_result.question, question_result.enriched_question_summary)
+
+    started = time.monotonic()
+    counts = {"questions": 0, "unprocessed": 0, "first_result_seconds": None}
+    topic_records: List[Dict[str, Any]] = []
+
+    def write(item: Dict[str, Any]) -> None:
+        question_result = item["result"]
+        writer.write(question_result)
+        counts["questions"] += 1
+        counts["unprocessed"] += question_result.skip_reason in UNPROCESSED_REASONS
+        if counts["first_result_seconds"] is None:
+            counts["first_result_seconds"] = time.monotonic() - started
+        if topic_classifier is not None:
+            topic_records.extend(topic_agreement_records([question_result]))
+
+    pipeline = StreamingPipeline([
+        ("enrich", unless_stopped(enrich), config.processingThreads),
+        ("embed", unless_stopped(embed), config.processingThreads),
+        ("search", unless_stopped(search)),
+        ("follow_up", unless_stopped(follow_up), config.processingThreads),
+        ("judge", unless_stopped(judge), config.processingThreads),
+    ], config.streamQueueSize)
+    pipeline.run(read_questions(), write)
+
+    logger.info("Streamed %s questions, first result written after %.1fs", counts["questions"], counts["first_result_seconds"] or 0.0)
+    stream_summary = dict(counts, stages=pipeline.summary())
+    if topic_classifier is not None:
+        stream_summary["topic_agreement"] = summarise_topic_agreement(topic_records)
+    return stream_summary
+
+def run_queue_worker(config: ApiConfiguration, queue_path: str, source_dir: str, logger: logging.Logger, worker_id: str = None, cells: List[str] = None) -> int:
+    """
+    Processes questions leased from a shared work queue until every item is done or has failed for good.
+
+    Any number of workers on the machine holding the queue file can run at once. A worker that dies loses only the
+    items it had leased, which are handed out again when their leases expire.
+
+    The worker searches one index for all its questions, built as build_chunk_index builds it, with the follow-up
+    topic classifier if configured. Settings that change how run_tests builds its index, but that a worker cannot
+    apply, are rejected rather than ignored.
+
+    Args:
+        config (ApiConfiguration): The API configuration instance.
+        queue_path (str): The path of the WorkQueue database.
+        source_dir (str): The directory containing the processed chunks, unless config.chunkIndexDir is set.
+        logger (logging.Logger): The logger instance.
+        worker_id (str): A name unique to this worker, by default the host name and process id.
+        cells (List[str]): Optional cells to take items from, e.g. those of the model this worker is configured for.
+
+    Returns:
+        int: The number of items this worker completed.
+
+    Raises:
+        ValueError: If the configuration uses two-level retrieval, search shards or chunk compaction.
+    """
+    if config.articleFanOut or config.searchShards > 1 or config.searchShardAddresses or config.chunkCompactionThreshold:
+        raise ValueError("Queue workers search a single dense, lexical or hybrid index, set articleFanOut, searchShardAddresses and chunkCompactionThreshold to None and searchShards to 1")
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    config.runDeadlineAt = time.time() + config.runDeadlineSeconds if config.runDeadlineSeconds else None
+    chat_client = configure_openai_for_azure(config, "chat")
+    embedding_client = configure_openai_for_azure(config, "embedding")
+    chunk_index = build_chunk_index(config, source_dir)
+    topic_classifier = build_topic_classifier(embedding_client, config, [], chunk_index, logger) if config.followUpTopicClassifier else None
+
+    queue = WorkQueue(queue_path, config.queueVisibilityTimeout, config.queueMaxAttempts)
+    completed = 0
+    try:
+        while True:
+            items = queue.lease(worker_id, config.queueLeaseSize, cells)
+            if not items:
+                if queue.is_finished(cells):
+                    break
+                time.sleep(QUEUE_POLL_SECONDS)      # The remaining items are leased by other workers
+                continue
+
+            try:
+                question_results = process_questions(chat_client, embedding_client, config, [question for _, _, _, question in items], [], logger, chunk_index, topic_classifier)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed to process {len(items)} queued questions: {e}")
+                for item_id, _, _, _ in items:
+                    if unprocessed_reason(e):
+                        queue.release(item_id, worker_id, unprocessed_reason(e))
+                    else:
+                        queue.fail(item_id, worker_id, str(e))
+                continue
+
+            unprocessed = 0
+            for (item_id, _, _, _), question_result in zip(items, question_results):
+                if question_result.skip_reason in UNPROCESSED_REASONS:
+                    # Left unprocessed by an outage or the deadline, so given back to be retried without using up an attempt
+                    queue.release(item_id, worker_id, question_result.skip_reason)
+                    unprocessed += 1
+                elif queue.complete(item_id, worker_id, result_to_record(question_result)):
+                    completed += 1
+
+            if get_retry_policy(config).deadline_passed():
+                logger.warning("Worker %s stopping at the run deadline", worker_id)
+                break
+            if unprocessed:
+                time.sleep(config.circuitCooldown)      # Give the endpoint time to recover before leasing more
+    finally:
+        queue.close()
+
+    logger.info("Worker %s completed %s queued questions", worker_id, completed)
+    return completed
+
+def merge_queue_results(queue_path: str, test_destination_dir: str, logger: logging.Logger) -> Dict[str, Any]:
+    """
+    Writes one results file per cell of a work queue, in the original question order.
+
+    Args:
+        queue_path (str): The path of the WorkQueue database.
+        test_destination_dir (str): The path to the directory where the test results will be saved.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        Dict[str, Any]: Per cell, the number of results written and the items that were not done.
+    """
+    queue = WorkQueue(queue_path)
+    merge_report = {}
+    try:
+        for cell in sorted(queue.progress()):
+            records, missing = queue.results(cell)
+            if missing:
+                logger.warning("Cell %s has %s questions without results", cell, len(missing))
+            save_result_records(test_destination_dir, records, cell)
+            merge_report[cell] = {"results": len(records), "missing": missing}
+    finally:
+        queue.close()
+    return merge_report
+
 # Function to read processed chunks from the source directory
 def read_processed_chunks(source_dir: str) -> List[Dict[str, Any]]:
     """
@@ -384,15 +1581,12 @@ def read_processed_chunks(source_dir: str) -> List[Dict[str, Any]]:
     """
     processed_question_chunks: List[Dict[str, Any]] = []            # Initialize an empty list to hold the chunks.
     try:
-        # Loop through all files in the specified directory.
-        for filename in os.listdir(source_dir):
-            # Check if the file has a '.json' extension.
-            if filename.endswith(".json"):
-                file_path = os.path.join(source_dir, filename)      # Get the full path to the file.
-                # Open the file and load its contents as JSON.
-                with open(file_path, "r", encoding="utf-8") as f:
-                    chunk = json.load(f)                        # Load JSON data into the chunk variable.
-                    processed_question_chunks = chunk           # Store the JSON content in the processed chunks list.
+        # Find the chunk file, the same one a memory-mapped index is built from.
+        file_path = source_chunk_file(source_dir)
+        if file_path is not None:
+            # Open the file and load its contents as JSON.
+            with open(file_path, "r", encoding="utf-8") as f:
+                processed_question_chunks = json.load(f)    # Store the JSON content in the processed chunks list.
 
     # Handle file not found or I/O errors that occur during file reading.                
     except (FileNotFoundError, IOError) as e:
@@ -406,14 +1600,43 @@ def read_processed_chunks(source_dir: str) -> List[Dict[str, Any]]:
     return processed_question_chunks
 
 # Function to save the results and generated questions
-def save_results(test_destination_dir: str, question_results: List[TestResult], test_mode: str) -> None:
+def result_to_record(result: TestResult) -> Dict[str, Any]:
+    """
+    Converts a test result to the JSON record written to the results file.
+
+    Args:
+        result (TestResult): The test result.
+
+    Returns:
+        Dict[str, Any]: The JSON-serialisable record.
+    """
+    return {
+        "question": result.question,                                # Original question.
+        "enriched_question": result.enriched_question_summary,      # Enriched question summary.
+        "hit": result.hit,                                          # Whether it was a hit or not (based on similarity).
+        "summary": result.hit_summary,                              # The best-matching pre-processed summary.
+        "hitRelevance": result.hit_relevance,                       # Relevance score for the best hit.
+        "follow_up": result.follow_up,                              # Follow-up question generated.
+        "follow_up_on_topic": result.follow_up_on_topic,            # Whether the follow-up is on-topic.
+        "follow_up_topic_score": result.follow_up_topic_score,      # Local topic classifier score, if it was used.
+        "follow_up_topic_source": result.follow_up_topic_source,    # Whether the classifier or the LLM judged the follow-up.
+        "gemini_evaluation": result.gemini_evaluation,              # Evaluation result from Gemini.
+        "skip_reason": result.skip_reason,                          # Short-circuit rule that skipped the remaining stages.
+        "stage_timings": result.stage_timings,                      # Seconds spent in each stage.
+        "stage_spans": result.stage_spans,                          # Start and end of each stage, when they ran as a graph.
+        "critical_path": result.critical_path                       # Stages on the critical path, when they ran as a graph.
+    }
+
+def save_results(test_destination_dir: str, question_results: List[TestResult], test_mode: str, config: ApiConfiguration = None) -> None:
     """
-    Saves the test results to a JSON file in the specified destination directory.
+    Saves the test results to a JSON file in the specified destination directory, and to the results database
+    if config.resultsDatabase is set.
 
     Args:
         test_destination_dir (str): The path to the directory where the test results will be saved.
         question_results (List[TestResult]): A list of TestResult objects containing the test results.
         test_mode (str): The test mode to be used in the output file name.
+        config (ApiConfiguration): The configuration of the run, recorded with it in the results database.
 
     Returns:
         None
@@ -421,20 +1644,34 @@ def save_results(test_destination_dir: str, question_results: List[TestResult],
     Raises:
         IOError: If an I/O error occurs while writing the JSON file.
     """
-    output_data = [
-        {
-            "question": result.question,                                # Original question.
-            "enriched_question": result.enriched_question_summary,      # Enriched question summary.
-            "hit": result.hit,                                          # Whether it was a hit or not (based on similarity).
-            "summary": result.hit_summary,                              # The best-matching pre-processed summary.
-            "hitRelevance": result.hit_relevance,                       # Relevance score for the best hit.
-            "follow_up": result.follow_up,                              # Follow-up question generated.
-            "follow_up_on_topic": result.follow_up_on_topic,            # Whether the follow-up is on-topic.
-            "gemini_evaluation": result.gemini_evaluation               # Evaluation result from Gemini.
-        }
-        for result in question_results                                  # Iterate over each TestResult and serialize it.
-    ]
+    with profile_stage("serialization"):
+        records = [result_to_record(result) for result in question_results]
+        save_result_records(test_destination_dir, records, test_mode)
+
+    if config is not None and config.resultsDatabase:
+        with profile_stage("serialization"):
+            store = ResultsStore(config.resultsDatabase)
+            try:
+                run = store.add_run(records, config.modelName, normalise_persona(test_mode), config.runId, config_snapshot(config))
+            finally:
+                store.close()
+        logger.info(f"Test results saved to {config.resultsDatabase} as run {run}")
+
+def save_result_records(test_destination_dir: str, output_data: List[Dict[str, Any]], test_mode: str) -> None:
+    """
+    Saves test result records, as made by result_to_record, to a JSON file in the specified destination directory.
+
+    Args:
+        test_destination_dir (str): The path to the directory where the test results will be saved.
+        output_data (List[Dict[str, Any]]): The result records, in question order.
+        test_mode (str): The test mode to be used in the output file name.
+
+    Returns:
+        None
 
+    Raises:
+        IOError: If an I/O error occurs while writing the JSON file.
+    """
     # Generate a unique filename for the output based on the current timestamp and test mode.
     current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     output_file = os.path.join(test_destination_dir, f"test_output_v5_{test_mode}_{current_datetime}.json")
@@ -450,6 +1687,96 @@ def save_results(test_destination_dir: str, question_results: List[TestResult],
         logger.error(f"Error saving results: {e}")
         raise
 
+class ResultStreamWriter:
+    def __init__(self, test_destination_dir: str, test_mode: str, config: ApiConfiguration = None, database_batch_size: int = 20) -> None:
+        """
+        Writes test results one at a time as they are produced, to the same JSON file save_results writes and, if
+        config.resultsDatabase is set, to the results database, so no result waits for the end of the run.
+
+        Args:
+            test_destination_dir (str): The path to the directory where the test results will be saved.
+            test_mode (str): The test mode to be used in the output file name.
+            config (ApiConfiguration): The configuration of the run, recorded with it in the results database.
+            database_batch_size (int): Results written to the database per transaction.
+
+        Returns:
+            None
+        """
+        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.output_file = os.path.join(test_destination_dir, f"test_output_v5_{test_mode}_{current_datetime}.json")
+        self.written = 0
+        self.database_batch_size = database_batch_size
+        self._file = open(self.output_file, "w", encoding="utf-8")
+        self._file.write("[")
+        self._store = None
+        self._run = None
+        self._pending: List[Dict[str, Any]] = []
+        if config is not None and config.resultsDatabase:
+            self._store = ResultsStore(config.resultsDatabase)
+            self._run = self._store.add_run([], config.modelName, normalise_persona(test_mode), config.runId, config_snapshot(config))
+
+    def write(self, result: TestResult) -> None:
+        """
+        Writes a result, flushing it to the file straight away.
+        """
+        with profile_stage("serialization"):
+            record = result_to_record(result)
+            # Laid out exactly as json.dump(records, f, indent=4) lays out each element
+            self._file.write(("," if self.written else "") + "\n" + textwrap.indent(json.dumps(record, indent=4), "    "))
+            self._file.flush()
+            self.written += 1
+
+            if self._store is not None:
+                self._pending.append(record)
+                if len(self._pending) >= self.database_batch_size:
+                    self._flush_database()
+
+    def close(self) -> None:
+        """
+        Closes the JSON list and writes the results still pending to the database.
+        """
+        self._file.write("\n]" if self.written else "]")
+        self._file.close()
+        logger.info(f"Test results saved to: {self.output_file}")
+        if self._store is not None:
+            try:
+                self._flush_database()
+            finally:
+                self._store.close()
+            logger.info(f"Test results saved to {self._store.db_path} as run {self._run}")
+
+    def _flush_database(self) -> None:
+        self._store.add_records(self._run, self._pending, self.written - len(self._pending))
+        self._pending = []
+
+# Function to save a diagnostic report produced alongside the test results
+def save_report(test_destination_dir: str, report: Dict[str, Any], report_name: str, test_mode: str) -> None:
+    """
+    Saves a diagnostic report to a JSON file in the specified destination directory.
+
+    Args:
+        test_destination_dir (str): The path to the directory where the report will be saved.
+        report (Dict[str, Any]): The report to save.
+        report_name (str): The name of the report, used as the start of the file name.
+        test_mode (str): The test mode to be used in the output file name.
+
+    Returns:
+        None
+
+    Raises:
+        IOError: If an I/O error occurs while writing the JSON file.
+    """
+    current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_file = os.path.join(test_destination_dir, f"{report_name}_{test_mode}_{current_datetime}.json")
+
+    try:
+        with profile_stage("serialization"), open(output_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        logger.info(f"Report saved to: {output_file}")
+    except IOError as e:
+        logger.error(f"Error saving report: {e}")
+        raise
+
 # Main test-running function
 def run_tests(config: ApiConfiguration, test_destination_dir: str, source_dir: str, num_questions: int = 100, questions: List[str] = None, persona_strategy: PersonaStrategy = None) -> None:
     """
@@ -466,6 +1793,24 @@ def run_tests(config: ApiConfiguration, test_destination_dir: str, source_dir: s
     Returns:
         None
     """
+    setup_logging(config)
+
+    # Profile CPU time and memory by stage, saved once the run has finished or failed
+    profiler = start_profiling(config.profileMemory) if config.profileStages else None
+    try:
+        _run_tests(config, test_destination_dir, source_dir, num_questions, questions, persona_strategy)
+    finally:
+        if profiler is not None:
+            stop_profiling()
+            profiler.save(config.profileDir or test_destination_dir, persona_strategy.__class__.__name__.replace('PersonaStrategy', '').lower())
+
+def _run_tests(config: ApiConfiguration, test_destination_dir: str, source_dir: str, num_questions: int, questions: List[str], persona_strategy: PersonaStrategy) -> None:
+    """
+    Runs the stages of run_tests, which sets up logging and profiling around them.
+    """
+    # The deadline is absolute so it also holds in worker processes, which get a copy of the configuration.
+    config.runDeadlineAt = time.time() + config.runDeadlineSeconds if config.runDeadlineSeconds else None
+
     # Initialize the OpenAI clients for both chat completions and embeddings.
     chat_client = configure_openai_for_azure(config, "chat")
     embedding_client = configure_openai_for_azure(config, "embedding")
@@ -474,9 +1819,15 @@ def run_tests(config: ApiConfiguration, test_destination_dir: str, source_dir: s
     if not test_destination_dir:
         logger.error("Test data folder not provided")                       # Log error message.
         raise ValueError("Test destination directory not provided")         # Raise exception
+
+    # Check the retrieval mode before any question is generated, an unusable one must not cost API calls first
+    check_retrieval_mode(config)
+    if config.retrievalMode != "dense" and config.processingWorkers > 1:
+        raise ValueError(f"Retrieval mode '{config.retrievalMode}' runs in a single process, set processingWorkers to 1")
     
     if persona_strategy:
-        questions = persona_strategy.generate_questions(chat_client, config, NUM_QUESTIONS, logger)
+        with profile_stage("question_generation"):
+            questions = persona_strategy.generate_questions(chat_client, config, NUM_QUESTIONS, logger)
 
     if not questions:
         logger.error("Generated questions are None or empty. Exiting the test.")
@@ -484,6 +1835,121 @@ def run_tests(config: ApiConfiguration, test_destination_dir: str, source_dir: s
     # Determine the test mode based on the strategy
     test_mode = persona_strategy.__class__.__name__.replace('PersonaStrategy', '').lower()
 
-    processed_question_chunks = read_processed_chunks(source_dir)
-    question_results = process_questions(chat_client,embedding_client, config, questions, processed_question_chunks, logger)
-    save_results(test_destination_dir, question_results, test_mode)
\ No newline at end of file
+    # Drop questions that ask effectively the same thing before they cost a full pass through the pipeline
+    if config.questionDedupThreshold:
+        questions, dedup_report = deduplicate_questions(chat_client, embedding_client, config, questions, logger, persona_strategy)
+        save_report(test_destination_dir, dedup_report, "question_duplicates", test_mode)
+
+    # Check batched enrichment against single-question calls on a sample before relying on it for the run
+    if config.enrichmentBatchSize > 1 and config.enrichmentAuditSample:
+        enrichment_audit = compare_enrichment_modes(chat_client, embedding_client, config, questions[:config.enrichmentAuditSample], config.enrichmentBatchSize, logger)
+        logger.info("Batched enrichment audit: mean similarity %.3f, refusal agreement %.2f", enrichment_audit["mean_similarity"], enrichment_audit["refusal_agreement"])
+        save_report(test_destination_dir, enrichment_audit, "enrichment_audit", test_mode)
+
+    # A memory-mapped index is streamed from disk, so the chunk JSON is never loaded into memory
+    chunk_index = None
+    if config.chunkIndexDir:
+        with profile_stage("chunk_loading"):
+            chunk_index = MemoryMappedChunkIndex(config.chunkIndexDir, config.searchBlockSize, config.processingThreads)
+        processed_question_chunks = []
+    else:
+        with profile_stage("chunk_loading"):
+            processed_question_chunks = read_processed_chunks(source_dir)
+
+    # Collapse near-duplicate chunks so they neither inflate the search nor tie for the best hit
+    if config.chunkCompactionThreshold and chunk_index is None:
+        compactor = ChunkCompactor(config.chunkCompactionThreshold)
+        with profile_stage("chunk_compaction"):
+            processed_question_chunks, alias_map = compactor.compact(processed_question_chunks)
+        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        compactor.save_alias_map(alias_map, os.path.join(test_destination_dir, f"chunk_aliases_{test_mode}_{current_datetime}.json"))
+
+    if config.streamingPipeline and (config.adaptiveStopping or config.processingWorkers > 1):
+        raise ValueError("The streaming pipeline runs in a single process without adaptive stopping, set processingWorkers to 1 and adaptiveStopping off")
+
+    # Rank chunks by BM25 over their summaries, alone or fused with the dense ranking
+    if config.retrievalMode == "lexical":
+        chunk_index = LexicalChunkIndex(processed_question_chunks)
+    elif config.retrievalMode == "hybrid":
+        chunk_index = HybridChunkIndex(processed_question_chunks, config.searchBlockSize, config.processingThreads, config.hybridCandidates)
+
+    # Score each question against article centroids first and re-rank only the chunks of the best articles
+    if config.articleFanOut:
+        if chunk_index is not None:
+            raise ValueError("Two-level retrieval builds its own dense index from the chunk JSON, set articleFanOut to None for memory-mapped, lexical or hybrid retrieval")
+        if config.processingWorkers > 1:
+            raise ValueError("Two-level retrieval runs in a single process, set processingWorkers to 1 or articleFanOut to None")
+        chunk_index = HierarchicalChunkIndex(processed_question_chunks, config.articleFanOut, config.articleKeyField, config.articleFanOutAudit)
+
+    # Scatter each query batch over shard servers, either already running elsewhere or started here
+    sharded_index = None
+    if config.searchShardAddresses:
+        if chunk_index is not None:
+            raise ValueError("Shard servers serve a dense in-memory index, set searchShardAddresses to None for memory-mapped, lexical, hybrid or two-level retrieval")
+        if not SHARD_AUTHKEY:
+            logger.error("CHUNK_SHARD_AUTHKEY not set in environment.")
+            raise EnvironmentError("Missing chunk shard authentication key.")
+        sharded_index = ShardedChunkIndex(config.searchShardAddresses, SHARD_AUTHKEY.encode("utf-8"))
+    elif config.searchShards > 1 and chunk_index is None:
+        sharded_index = ShardedChunkIndex.start_local(processed_question_chunks, config.searchShards, config.searchBlockSize)
+    if sharded_index is not None:
+        chunk_index = sharded_index
+
+    # Load the index once and let every worker process attach to it rather than re-reading the chunks
+    shared_index = None
+    if config.processingWorkers > 1 and chunk_index is None:
+        shared_index = SharedMemoryChunkIndex.create(processed_question_chunks, config.searchBlockSize, config.processingThreads)
+        chunk_index = shared_index
+
+    try:
+        # Judge follow-ups locally by embedding similarity and leave only the close calls to the LLM
+        topic_classifier = None
+        if config.followUpTopicClassifier:
+            topic_classifier = build_topic_classifier(embedding_client, config, processed_question_chunks, chunk_index, logger)
+
+        if config.adaptiveStopping:
+            # Stop as soon as the run metrics are known well enough, so cheap cells do not spend the full question budget
+            question_results, stop_summary = process_questions_adaptively(chat_client, embedding_client, config, questions, processed_question_chunks, logger, chunk_index, topic_classifier)
+            save_report(test_destination_dir, stop_summary, "sequential_stop", test_mode)
+        elif config.processingWorkers > 1:
+            question_results = process_questions_in_workers(config, questions, chunk_index, config.processingWorkers, logger, topic_classifier)
+        elif config.streamingPipeline:
+            # Write each result as it comes out of the stages instead of holding every result until the end
+            writer = ResultStreamWriter(test_destination_dir, test_mode, config)
+            try:
+                stream_summary = stream_questions(chat_client, embedding_client, config, questions, processed_question_chunks, logger, writer, chunk_index, topic_classifier)
+            finally:
+                writer.close()
+            question_results = None
+        else:
+            question_results = process_questions(chat_client,embedding_client, config, questions, processed_question_chunks, logger, chunk_index, topic_classifier)
+    finally:
+        if shared_index is not None:
+            shared_index.close()
+            shared_index.unlink()
+        if sharded_index is not None:
+            sharded_index.close()
+
+    if isinstance(chunk_index, HierarchicalChunkIndex) and chunk_index.audit:
+        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        chunk_index.save_audit_report(os.path.join(test_destination_dir, f"two_level_audit_{test_mode}_{current_datetime}.json"))
+    if question_results is None:
+        # The streaming pipeline has written the results already and kept only what the reports need
+        save_report(test_destination_dir, stream_summary, "streaming", test_mode)
+    if topic_classifier is not None:
+        save_report(test_destination_dir, stream_summary["topic_agreement"] if question_results is None else topic_agreement_report(question_results), "topic_agreement", test_mode)
+    if config.adaptiveTimeouts or config.hedgeRequests:
+        save_report(test_destination_dir, get_latency_controller(config).summary(), "latency", test_mode)
+    if config.stageGraph and question_results is not None:
+        graph_results = [result for result in question_results if result.stage_spans]
+        save_report(test_destination_dir, summarise_stage_graph([result.stage_spans for result in graph_results], [result.critical_path for result in graph_results]), "stage_graph", test_mode)
+    retry_summary = get_retry_policy(config).summary()
+    deployment_pools = {task: get_deployment_pool(config, task) for task in ("chat", "embedding")}
+    retry_summary["deployments"] = {task: pool.summary() for task, pool in deployment_pools.items() if pool is not None}
+    if question_results is None:
+        retry_summary["unprocessed"] = stream_summary["unprocessed"]
+    else:
+        retry_summary["unprocessed"] = sum(1 for result in question_results if result.skip_reason in UNPROCESSED_REASONS)
+    save_report(test_destination_dir, retry_summary, "retries", test_mode)
+    if question_results is not None:
+        save_results(test_destination_dir, question_results, test_mode, config)
\ No newline at end of file
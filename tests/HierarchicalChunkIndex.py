@@ -0,0 +1,172 @@
+"""
+Hierarchical Chunk Index:
+Two-level retrieval over the knowledge-base chunks. A coarse pass scores each question against one centroid
+embedding per source article, then only the chunks of the best-matching articles are scored exactly, so the
+cost of a search grows with the number of articles rather than the number of chunks.
+
+With auditing switched on, every search is also run as a full scan and the index counts how often the
+two-level result differs, which is the evidence needed to choose the fan-out.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import os
+import sys
+import threading
+from typing import List, Dict, Any, Tuple
+
+# Third-Party Packages
+import numpy as np
+
+# Add the project root and scripts directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Local Modules
+from common.common_functions import build_embedding_matrix
+from ChunkIndex import ChunkIndex, normalise_queries
+
+# Constants
+DEFAULT_ARTICLE_KEY_FIELD = "filename"      # Chunk field naming the source article, as written by generateVectorEmbeddings.py
+DEFAULT_ARTICLE_FAN_OUT = 8                 # Articles whose chunks are scored exactly for each question
+
+logger = logging.getLogger(__name__)
+
+
+class HierarchicalChunkIndex(ChunkIndex):
+    def __init__(self, chunks: List[Dict[str, Any]], fan_out: int = DEFAULT_ARTICLE_FAN_OUT, article_key_field: str = DEFAULT_ARTICLE_KEY_FIELD, audit: bool = False) -> None:
+        """
+        Groups the chunks by source article and builds one centroid embedding per article.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with "embedding" and "summary" fields.
+            fan_out (int): The number of best-matching articles whose chunks are re-ranked exactly.
+            article_key_field (str): The chunk field that identifies the source article. Chunks without it are treated as articles of their own.
+            audit (bool): Whether to also run a full scan for every search and record where the two results differ.
+
+        Returns:
+            None
+        """
+        if fan_out < 1:
+            raise ValueError("Article fan-out must be at least 1")
+
+        self.embeddings, positions = build_embedding_matrix(chunks)
+        self.summaries: List[str] = [chunks[position].get("summary") for position in positions]
+        self.count = len(positions)
+        self.dimension = self.embeddings.shape[1] if self.count else 0
+        self.fan_out = fan_out
+        self.audit = audit
+
+        # Chunk ids of each article, in the original chunk order
+        articles: Dict[Any, List[int]] = {}
+        for chunk_id, position in enumerate(positions):
+            articles.setdefault(chunks[position].get(article_key_field, ("chunk", position)), []).append(chunk_id)
+        self.article_chunks: List[np.ndarray] = [np.asarray(chunk_ids) for chunk_ids in articles.values()]
+
+        centroids = np.asarray([self.embeddings[chunk_ids].mean(axis=0) for chunk_ids in self.article_chunks], dtype=np.float32).reshape(-1, self.dimension)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+
+        self._audit_lock = threading.Lock()
+        self._audit = {"queries": 0, "differing": 0, "chunks_scored": 0, "relevance_lost": 0.0, "examples": []}
+
+        logger.info("Built two-level index: %s chunks in %s articles, fan-out %s", self.count, len(self.article_chunks), fan_out)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        queries = normalise_queries(query_embeddings, self.dimension)
+        if self.count == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        # Coarse pass: the fan_out best articles per query
+        article_scores = queries @ self.centroids.T
+        fan_out = min(self.fan_out, len(self.article_chunks))
+
+        results = []
+        for query_number, query in enumerate(queries):
+            best_articles = np.argpartition(-article_scores[query_number], fan_out - 1)[:fan_out]
+            candidate_ids = np.sort(np.concatenate([self.article_chunks[article] for article in best_articles]))
+            matches = self._rank(candidate_ids, query, top_k)
+            results.append(matches)
+
+            if self.audit:
+                self._record_audit(query, matches, len(candidate_ids))
+
+        return results
+
+    def get_summary(self, chunk_id: int) -> str:
+        return self.summaries[chunk_id]
+
+    def audit_report(self) -> Dict[str, Any]:
+        """
+        Summarises how the two-level searches compared with a full scan of every chunk.
+
+        Returns:
+            Dict[str, Any]: The number of audited queries, how many best hits differed from the full scan, the mean
+            relevance lost on those, the mean share of chunks scored per query, and a sample of the differences.
+        """
+        with self._audit_lock:
+            queries = self._audit["queries"]
+            differing = self._audit["differing"]
+            return {
+                "fan_out": self.fan_out,
+                "articles": len(self.article_chunks),
+                "chunks": self.count,
+                "queries": queries,
+                "differing_queries": differing,
+                "difference_rate": differing / queries if queries else 0.0,
+                "mean_relevance_lost": self._audit["relevance_lost"] / differing if differing else 0.0,
+                "mean_share_of_chunks_scored": self._audit["chunks_scored"] / queries if queries else 0.0,
+                "examples": list(self._audit["examples"]),
+            }
+
+    def save_audit_report(self, output_file: str) -> None:
+        """
+        Saves the audit report to a JSON file.
+
+        Args:
+            output_file (str): The path of the JSON file to write.
+
+        Returns:
+            None
+
+        Raises:
+            IOError: If an I/O error occurs while writing the JSON file.
+        """
+        try:
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(self.audit_report(), f, indent=4)
+            logger.info(f"Two-level search audit saved to: {output_file}")
+        except IOError as e:
+            logger.error(f"Error saving two-level search audit: {e}")
+            raise
+
+    def _rank(self, candidate_ids: np.ndarray, query: np.ndarray, top_k: int) -> List[Tuple[float, int]]:
+        """
+        Scores the candidate chunks exactly and returns the top_k, best first, lower chunk ids winning ties.
+        """
+        scores = self.embeddings[candidate_ids].astype(np.float64) @ query.astype(np.float64)
+        order = np.lexsort((candidate_ids, -scores))[:top_k]
+        return [(float(scores[row]), int(candidate_ids[row])) for row in order]
+
+    def _record_audit(self, query: np.ndarray, matches: List[Tuple[float, int]], chunks_scored: int) -> None:
+        """
+        Compares one two-level result with a full scan and adds it to the audit counts.
+        """
+        full_scan = self._rank(np.arange(self.count), query, 1)
+        differs = bool(matches) and matches[0][1] != full_scan[0][1]
+
+        with self._audit_lock:
+            self._audit["queries"] += 1
+            self._audit["chunks_scored"] += chunks_scored / self.count
+            if differs:
+                self._audit["differing"] += 1
+                self._audit["relevance_lost"] += full_scan[0][0] - matches[0][0]
+                if len(self._audit["examples"]) < 20:
+                    self._audit["examples"].append({
+                        "two_level_summary": self.summaries[matches[0][1]],
+                        "two_level_relevance": matches[0][0],
+                        "full_scan_summary": self.summaries[full_scan[0][1]],
+                        "full_scan_relevance": full_scan[0][0],
+                    })
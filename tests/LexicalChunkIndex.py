@@ -0,0 +1,205 @@
+"""
+Lexical Chunk Index:
+An in-process BM25 inverted index over the chunk summaries, so retrieval can run without an embedding call and
+exact-term matches such as library names are not lost to dense similarity.
+
+`LexicalChunkIndex` answers text queries on its own, which makes offline smoke runs possible with no embedding
+API calls at all. `HybridChunkIndex` keeps a dense index over the same chunks and fuses the two rankings with
+reciprocal rank fusion, reporting the cosine similarity of the fused winner so the hit threshold keeps its meaning.
+
+Posting lists are stored compactly as three flat arrays (per-term offsets, int32 chunk ids and uint16 term
+frequencies) rather than as Python dictionaries per term.
+"""
+
+# Standard Library Imports
+import logging
+import math
+import re
+from typing import List, Dict, Any, Tuple
+
+# Third-Party Packages
+import numpy as np
+
+# Local Modules
+from ChunkIndex import InMemoryChunkIndex, DEFAULT_SEARCH_BLOCK_SIZE, normalise_queries
+
+# Constants
+BM25_K1 = 1.2                   # Term frequency saturation
+BM25_B = 0.75                   # Document length normalisation
+HYBRID_CANDIDATES = 50          # Chunks taken from each ranking before fusion
+RRF_K = 60                      # Reciprocal rank fusion damping, the usual value from the literature
+
+# Tokens keep internal dots, dashes and pluses so names such as "scikit-learn", "gpt-4o" and "c++" survive
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._+#-][a-z0-9]+)*\+*")
+STOP_WORDS = frozenset("a an and are as at be but by can do does for from how i in is it its of on or that the this to was what when where which who why will with you your".split())
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower-case terms, dropping common stop words.
+    """
+    return [token for token in TOKEN_PATTERN.findall((text or "").lower()) if token not in STOP_WORDS]
+
+
+class LexicalChunkIndex:
+    def __init__(self, chunks: List[Dict[str, Any]], positions: List[int] = None, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        """
+        Builds a BM25 index over the chunk summaries.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with a "summary" field.
+            positions (List[int]): The chunk positions to index, in chunk id order. Defaults to every chunk, and
+                HybridChunkIndex passes the positions of its dense index so both share chunk ids.
+            k1 (float): The BM25 term frequency saturation.
+            b (float): The BM25 document length normalisation.
+
+        Returns:
+            None
+        """
+        if positions is None:
+            positions = [position for position, chunk in enumerate(chunks) if chunk and isinstance(chunk, dict)]
+
+        self.summaries: List[str] = [chunks[position].get("summary") for position in positions]
+        self.count = len(positions)
+        self.k1 = k1
+        self.b = b
+
+        # Count each term once per chunk, then lay the postings out term by term
+        self.vocabulary: Dict[str, int] = {}
+        term_ids, chunk_ids, frequencies = [], [], []
+        lengths = np.zeros(self.count, dtype=np.float32)
+        for chunk_id, summary in enumerate(self.summaries):
+            tokens = tokenize(summary)
+            lengths[chunk_id] = len(tokens)
+            counts: Dict[int, int] = {}
+            for token in tokens:
+                term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            term_ids.extend(counts.keys())
+            chunk_ids.extend([chunk_id] * len(counts))
+            frequencies.extend(counts.values())
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")         # Stable, so each posting list stays in chunk id order
+        self.postings_chunks = np.asarray(chunk_ids, dtype=np.int32)[order]
+        self.postings_frequencies = np.minimum(np.asarray(frequencies, dtype=np.int64)[order], np.iinfo(np.uint16).max).astype(np.uint16)
+        document_frequencies = np.bincount(term_ids, minlength=len(self.vocabulary))
+        self.postings_offsets = np.concatenate([[0], np.cumsum(document_frequencies)]).astype(np.int64)
+
+        self.idf = np.log(1 + (self.count - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+        average_length = lengths.mean() if self.count else 0.0
+        self.length_norm = (k1 * (1 - b + b * lengths / average_length)).astype(np.float32) if average_length else np.full(self.count, k1, dtype=np.float32)
+
+        logger.info("Built BM25 index: %s chunks, %s terms, %s postings", self.count, len(self.vocabulary), len(self.postings_chunks))
+
+    def search_text(self, query_texts: List[str], top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        """
+        Scores a batch of text queries against every chunk.
+
+        Args:
+            query_texts (List[str]): The queries, e.g. enriched question summaries.
+            top_k (int): The number of best chunks to return per query.
+
+        Returns:
+            List[List[Tuple[float, int]]]: For each query, up to top_k (BM25 score, chunk id) pairs, best first. Chunks
+            sharing no term with the query are never returned, and ties go to the lower chunk id.
+        """
+        results = []
+        for query_text in query_texts:
+            scores = np.zeros(self.count, dtype=np.float32)
+            for token in set(tokenize(query_text)):
+                term_id = self.vocabulary.get(token)
+                if term_id is None:
+                    continue
+                start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+                chunk_ids = self.postings_chunks[start:end]
+                frequencies = self.postings_frequencies[start:end].astype(np.float32)
+                scores[chunk_ids] += self.idf[term_id] * frequencies * (self.k1 + 1) / (frequencies + self.length_norm[chunk_ids])
+
+            matched = np.flatnonzero(scores)
+            order = np.lexsort((matched, -scores[matched]))[:top_k]
+            results.append([(float(scores[matched[row]]), int(matched[row])) for row in order])
+        return results
+
+    def best_text_hits(self, query_texts: List[str]) -> List[Tuple[float, str]]:
+        """
+        Finds the best-matching chunk for each text query, in the form process_questions stores on a TestResult.
+
+        The score is normalised by score_bound, so it is the share of the query's highest possible BM25 score, between
+        0 and 1 whatever the length of the query. A raw BM25 score grows with every query term, so a fixed hit
+        threshold on it would mean something different for every question.
+
+        Returns:
+            List[Tuple[float, str]]: The best normalised score and matching summary per query, (0, None) if no chunk shares a term with it.
+        """
+        return [(matches[0][0] / self.score_bound(query_text), self.get_summary(matches[0][1])) if matches else (0, None) for query_text, matches in zip(query_texts, self.search_text(query_texts, 1))]
+
+    def score_bound(self, query_text: str) -> float:
+        """
+        Returns the BM25 score no chunk can reach for a query: every distinct query term at unbounded frequency, with
+        terms missing from the index weighted as the rarest possible term.
+        """
+        unseen_idf = math.log(1 + (self.count + 0.5) / 0.5)
+        return (self.k1 + 1) * sum(float(self.idf[self.vocabulary[token]]) if token in self.vocabulary else unseen_idf for token in set(tokenize(query_text)))
+
+    def get_summary(self, chunk_id: int) -> str:
+        return self.summaries[chunk_id]
+
+
+class HybridChunkIndex(InMemoryChunkIndex):
+    def __init__(self, chunks: List[Dict[str, Any]], block_size: int = DEFAULT_SEARCH_BLOCK_SIZE, threads: int = 4, candidates: int = HYBRID_CANDIDATES) -> None:
+        """
+        Builds a dense index and a BM25 index over the same chunks, sharing chunk ids.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with "embedding" and "summary" fields.
+            block_size (int): The number of chunks scored per block in the dense search.
+            threads (int): The number of blocks scored concurrently in the dense search.
+            candidates (int): The number of chunks taken from each ranking before fusion.
+
+        Returns:
+            None
+        """
+        super().__init__(chunks, block_size, threads)
+        self.lexical = LexicalChunkIndex(chunks, self.positions)
+        self.candidates = candidates
+
+    def search_hybrid(self, query_texts: List[str], query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        """
+        Ranks the chunks by reciprocal rank fusion of the dense and BM25 rankings.
+
+        Args:
+            query_texts (List[str]): The text of each query.
+            query_embeddings (np.ndarray): A (q, d) matrix with the embedding of each query.
+            top_k (int): The number of best chunks to return per query.
+
+        Returns:
+            List[List[Tuple[float, int]]]: For each query, up to top_k (cosine similarity, chunk id) pairs in fused rank order.
+        """
+        dense_results = self.search(query_embeddings, self.candidates)
+        lexical_results = self.lexical.search_text(query_texts, self.candidates)
+        queries = normalise_queries(query_embeddings, self.dimension)
+
+        results = []
+        for query, dense, lexical in zip(queries, dense_results, lexical_results):
+            fused: Dict[int, float] = {}
+            for ranking in (dense, lexical):
+                for rank, (_, chunk_id) in enumerate(ranking):
+                    fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+            best = sorted(fused, key=lambda chunk_id: (-fused[chunk_id], chunk_id))[:top_k]
+            similarities = self.embeddings[best].astype(np.float64) @ query.astype(np.float64) if best else []
+            results.append([(float(similarity), chunk_id) for similarity, chunk_id in zip(similarities, best)])
+        return results
+
+    def best_hybrid_hits(self, query_texts: List[str], query_embeddings: np.ndarray) -> List[Tuple[float, str]]:
+        """
+        Finds the fused best-matching chunk for each query, in the form process_questions stores on a TestResult.
+
+        Returns:
+            List[Tuple[float, str]]: The cosine similarity and summary of the fused winner per query, (0, None) if there is none.
+        """
+        return [(matches[0][0], self.get_summary(matches[0][1])) if matches else (0, None) for matches in self.search_hybrid(query_texts, query_embeddings, 1)]
+
@@ -1,7 +1,10 @@
 # Import necessary modules and libraries
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
+import json
 import logging
+import re
 from openai import AzureOpenAI
 import os
 import sys
@@ -13,13 +16,13 @@ sys.path.insert(0, parent_dir)
 
 # Import common configurations and functions
 from common.ApiConfiguration import ApiConfiguration  # API configuration management
+from common.AsyncLogging import setup_logging  # Queued logging to a background writer
 from common.common_functions import get_embedding  # Function for getting embeddings
 from openai import AzureOpenAI, OpenAIError, BadRequestError, APIConnectionError  # Exception handling for OpenAI API
-from BoxerDataTest_v1 import call_openai_chat  # Function to call OpenAI chat model
 
 
 # Setup Logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Constants for Persona Prompts
@@ -27,8 +30,15 @@ DEVELOPER_PROMPT = "You are a programmer interested in the details of writing ap
 TESTER_PROMPT = "You are a tester who wants to know how to assess and ensure quality in an application that uses LLM technology."
 BUSINESS_ANALYST_PROMPT = "You are a business analyst interested in how people can apply LLM technology to solve business problems."
 
+# Constants for sharded question generation
+SHARD_QUESTIONS_PROMPT = "Generate {count} questions about this topic, focusing on {sub_topic}. Respond only with a JSON object of the form {{\"questions\": [\"<question>\", ...]}} containing exactly {count} distinct questions, with no numbering."
+MAX_TOP_UP_ROUNDS = 3       # Extra rounds of shards requested when validation leaves fewer questions than asked for
+
 # Abstract class for Persona Strategies
 class PersonaStrategy(ABC):
+    # Sub-topics that seed the shards when questions are generated in parallel, so shards do not all ask the same things
+    SUB_TOPICS: List[str] = ["the topic in general"]
+
     @abstractmethod
     def generate_questions(self, chat_client: AzureOpenAI, config: ApiConfiguration, num_questions: int, logger: logging.Logger) -> List[str]:
         """
@@ -59,6 +69,10 @@ class PersonaStrategy(ABC):
     Returns:
         List[str]: A list of questions generated based on the prompt.
         """
+        # Split generation into small concurrent requests when sharding is configured
+        if config.questionGenerationShardSize:
+            return self._generate_questions_sharded(chat_client, config, prompt, num_questions, logger)
+
         # Prepare the messages to be sent to the OpenAI chat API
         messages = [
             {"role": "system", "content": prompt},
@@ -67,15 +81,117 @@ class PersonaStrategy(ABC):
         # Log the prompt that will be used for generating questions
         logger.info("Generating questions with the following prompt: %s", prompt)
 
-        # Call the OpenAI chat model and retrieve the response
-        response = call_openai_chat(chat_client, messages, config, logger)
+        # Call the OpenAI chat model and retrieve the response, under the run's retry policy and latency controller
+        from DataTest import call_openai_chat  # Imported here because DataTest imports this module
+        response = call_openai_chat(chat_client, messages, config, logger, stage="question_generation")
 
         # Split the response into individual questions and filter out empty ones
         questions = response.split('\n')
         return [q for q in questions if q.strip()]
+
+    def _generate_questions_sharded(self, chat_client: AzureOpenAI, config: ApiConfiguration, prompt: str, num_questions: int, logger: logging.Logger) -> List[str]:
+        """
+    Generates exactly num_questions questions as concurrent shards, each seeded with a persona sub-topic.
+
+    Each shard asks for a JSON list of questions. The shards are merged in order, cleaned, de-duplicated
+    and topped up with further shards until num_questions clean questions exist.
+
+    Args:
+        chat_client (AzureOpenAI): An instance of the AzureOpenAI class.
+        config (ApiConfiguration): An instance of the ApiConfiguration class.
+        prompt (str): The persona prompt used as the system message of every shard.
+        num_questions (int): The number of questions to generate.
+        logger (logging.Logger): An instance of the logging.Logger class.
+
+    Returns:
+        List[str]: The questions, num_questions long unless the top-up rounds ran out.
+        """
+        shard_size = config.questionGenerationShardSize
+        questions: List[str] = []
+        seen = set()
+        shard_number = 0
+
+        with ThreadPoolExecutor(max_workers=config.processingThreads) as executor:
+            for round_number in range(1 + MAX_TOP_UP_ROUNDS):
+                missing = num_questions - len(questions)
+                if missing <= 0:
+                    break
+                if round_number > 0:
+                    logger.info("Topping up %s questions after validation (round %s)", missing, round_number)
+
+                # One shard per shard_size questions still missing, cycling through the sub-topics
+                shard_requests = []
+                for start in range(0, missing, shard_size):
+                    sub_topic = self.SUB_TOPICS[shard_number % len(self.SUB_TOPICS)]
+                    shard_requests.append((min(shard_size, missing - start), sub_topic))
+                    shard_number += 1
+
+                shard_results = executor.map(lambda shard: self._generate_question_shard(chat_client, config, prompt, shard[0], shard[1], logger), shard_requests)
+                for shard_questions in shard_results:
+                    for question in shard_questions:
+                        if question.lower() not in seen:
+                            seen.add(question.lower())
+                            questions.append(question)
+
+        if len(questions) < num_questions:
+            logger.warning("Generated %s of %s questions after %s top-up rounds", len(questions), num_questions, MAX_TOP_UP_ROUNDS)
+        return questions[:num_questions]
+
+    def _generate_question_shard(self, chat_client: AzureOpenAI, config: ApiConfiguration, prompt: str, count: int, sub_topic: str, logger: logging.Logger) -> List[str]:
+        """
+    Generates one shard of questions and returns the ones that pass validation.
+
+    Args:
+        chat_client (AzureOpenAI): An instance of the AzureOpenAI class.
+        config (ApiConfiguration): An instance of the ApiConfiguration class.
+        prompt (str): The persona prompt.
+        count (int): The number of questions to ask for.
+        sub_topic (str): The sub-topic the shard focuses on.
+        logger (logging.Logger): An instance of the logging.Logger class.
+
+    Returns:
+        List[str]: The clean questions from the shard, possibly fewer than count.
+        """
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": SHARD_QUESTIONS_PROMPT.format(count=count, sub_topic=sub_topic)},
+        ]
+        from DataTest import call_openai_chat  # Imported here because DataTest imports this module
+        response = call_openai_chat(chat_client, messages, config, logger, stage="question_generation_shard")
+
+        # Models sometimes wrap the JSON in prose or code fences, so parse from the first brace to the last
+        try:
+            payload = json.loads(response[response.index("{"):response.rindex("}") + 1])
+            candidates = payload["questions"]
+            if not isinstance(candidates, list):
+                raise TypeError("questions is not a list")
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Discarding malformed question shard on '%s': %s", sub_topic, e)
+            return []
+
+        questions = [clean_question(candidate) for candidate in candidates if isinstance(candidate, str)]
+        return [question for question in questions if question][:count]
+
+
+def clean_question(text: str) -> str:
+    """
+    Strips numbering, bullets and quotes from a generated question and rejects text that is not a question.
+
+    Args:
+        text (str): A candidate question.
+
+    Returns:
+        str: The cleaned question, or an empty string if the text is blank, a preamble or has no words in it.
+    """
+    question = re.sub(r"^\s*(\d+\s*[.):-]|[-*\u2022])\s*", "", text).strip().strip('"').strip()
+    if not re.search(r"[A-Za-z]{2,}", question) or question.endswith(":"):
+        return ""
+    return question
     
 # Concrete class for Developer Persona Strategy    
 class DeveloperPersonaStrategy(PersonaStrategy):
+    SUB_TOPICS = ["prompt engineering", "retrieval-augmented generation", "embeddings and vector search", "fine-tuning", "Python libraries and SDKs", "agents and tool use", "deployment and scaling", "latency and cost optimisation", "security and privacy", "debugging and evaluating model output"]
+
     def generate_questions(self, chat_client: AzureOpenAI, config: ApiConfiguration, num_questions: int, logger: logging.Logger) -> List[str]:
         """
     Generates a list of questions based on the developer persona.
@@ -93,6 +209,8 @@ class DeveloperPersonaStrategy(PersonaStrategy):
 
 # Concrete class for Tester Persona Strategy
 class TesterPersonaStrategy(PersonaStrategy):
+    SUB_TOPICS = ["test strategy and planning", "evaluating output quality", "detecting hallucinations", "bias and fairness testing", "regression testing of prompts", "performance and load testing", "prompt injection and security testing", "test data generation", "monitoring in production", "acceptance criteria and metrics"]
+
     def generate_questions(self, chat_client: AzureOpenAI, config: ApiConfiguration, num_questions: int, logger: logging.Logger) -> List[str]:
         """
     Generates a list of questions based on the tester persona.
@@ -110,6 +228,8 @@ class TesterPersonaStrategy(PersonaStrategy):
 
 # Concrete class for Business Analyst Persona Strategy
 class BusinessAnalystPersonaStrategy(PersonaStrategy):
+    SUB_TOPICS = ["customer service", "process automation", "data analysis and reporting", "return on investment and cost", "risk, compliance and regulation", "change management and adoption", "requirements gathering", "vendor and model selection", "knowledge management", "measuring business outcomes"]
+
     def generate_questions(self, chat_client: AzureOpenAI, config: ApiConfiguration, num_questions: int, logger: logging.Logger) -> List[str]:
         """
     Generates a list of questions based on the business analyst persona.
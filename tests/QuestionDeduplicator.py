@@ -0,0 +1,77 @@
+"""
+Question Deduplication:
+Removes near-duplicate generated questions before they reach `process_questions`, where each one would
+cost an enrichment, an embedding, a search, a follow-up, an on-topic check and a Gemini judgment.
+
+Questions are compared by the cosine similarity of their embeddings in a single pairwise matrix. The first
+question of each group of near-duplicates is kept, so the order persona generation produced is preserved.
+"""
+
+# Standard Library Imports
+from typing import List, Dict, Any
+
+# Third-Party Packages
+import numpy as np
+
+# Constants
+DEFAULT_DEDUP_THRESHOLD = 0.92      # Questions at or above this cosine similarity ask effectively the same thing
+
+
+class QuestionDeduplicator:
+    def __init__(self, threshold: float = DEFAULT_DEDUP_THRESHOLD) -> None:
+        """
+        Initializes a new instance of the QuestionDeduplicator class.
+
+        Args:
+            threshold (float): Cosine similarity at or above which two questions are duplicates.
+
+        Returns:
+            None
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("Deduplication threshold must be in the range (0, 1]")
+        self.threshold = threshold
+
+    def select(self, embeddings: np.ndarray, kept_embeddings: np.ndarray = None) -> Dict[str, Any]:
+        """
+        Chooses which questions to keep, dropping any question that duplicates an earlier kept one.
+
+        Args:
+            embeddings (np.ndarray): An (n, d) matrix of question embeddings, in question order.
+            kept_embeddings (np.ndarray): Optional (m, d) embeddings of questions already kept, e.g. when
+                checking regenerated replacements against the questions that survived the first pass.
+
+        Returns:
+            Dict[str, Any]: "kept", the positions of the questions to keep, and "duplicates", a list of
+            {"position", "duplicate_of", "similarity"} entries. duplicate_of is a position in embeddings, or
+            -1 - i for row i of kept_embeddings.
+        """
+        matrix = _normalise(embeddings)
+        count = matrix.shape[0]
+        prior = _normalise(kept_embeddings) if kept_embeddings is not None and len(kept_embeddings) else np.zeros((0, matrix.shape[1]), dtype=matrix.dtype)
+
+        similarities = matrix @ matrix.T
+        prior_similarities = matrix @ prior.T
+
+        kept = np.zeros(count, dtype=bool)
+        duplicates = []
+        for position in range(count):
+            # Compare against the questions kept so far: earlier rows of this batch and the prior questions
+            candidates = np.concatenate([prior_similarities[position], np.where(kept[:position], similarities[position, :position], -np.inf)])
+            best = int(np.argmax(candidates)) if len(candidates) else -1
+            if best >= 0 and candidates[best] >= self.threshold:
+                duplicate_of = -1 - best if best < prior.shape[0] else best - prior.shape[0]
+                duplicates.append({"position": position, "duplicate_of": duplicate_of, "similarity": float(candidates[best])})
+            else:
+                kept[position] = True
+
+        return {"kept": np.flatnonzero(kept).tolist(), "duplicates": duplicates}
+
+
+def _normalise(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Returns the embeddings as a row-normalised float32 matrix. Zero rows are left as zeros.
+    """
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
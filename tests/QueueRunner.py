@@ -0,0 +1,126 @@
+"""
+Queue Runner:
+Command-line front end for distributed runs over a shared WorkQueue database.
+
+    python QueueRunner.py enqueue <queue.db> <developer|tester|business_analyst|questions.json> [cell]
+    python QueueRunner.py work <queue.db> <source_dir> [processes] [cell ...]
+    python QueueRunner.py status <queue.db>
+    python QueueRunner.py merge <queue.db> <test_destination_dir>
+
+Enqueue each cell once, start as many worker processes as needed on the machine holding the queue file, then
+merge to write one results file per cell in the original question order. The queue file must be on a local disk,
+not shared storage, see WorkQueue.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+# Add the project root and scripts directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.AsyncLogging import setup_logging
+from DataTest import configure_openai_for_azure, run_queue_worker, merge_queue_results
+from PersonaStrategy import DeveloperPersonaStrategy, TesterPersonaStrategy, BusinessAnalystPersonaStrategy
+from WorkQueue import WorkQueue
+
+# Persona strategies that can be enqueued by name
+PERSONAS = {
+    "developer": DeveloperPersonaStrategy,
+    "tester": TesterPersonaStrategy,
+    "business_analyst": BusinessAnalystPersonaStrategy,
+}
+NUM_QUESTIONS = 100                 # Questions generated per persona cell
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(queue_path: str, source: str, cell: str = None) -> None:
+    """
+    Adds a cell of questions to the queue, generated by a persona or read from a JSON list.
+
+    Args:
+        queue_path (str): The path of the WorkQueue database.
+        source (str): A persona name from PERSONAS, or the path of a JSON file holding a list of questions.
+        cell (str): The cell name, by default "<model>_<persona>" or the file name.
+
+    Returns:
+        None
+    """
+    config = ApiConfiguration()
+    if source in PERSONAS:
+        chat_client = configure_openai_for_azure(config, "chat")
+        questions = PERSONAS[source]().generate_questions(chat_client, config, NUM_QUESTIONS, logger)
+        cell = cell or f"{config.modelName}_{source}"
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            questions = json.load(f)
+        cell = cell or os.path.splitext(os.path.basename(source))[0]
+
+    queue = WorkQueue(queue_path)
+    try:
+        added = queue.enqueue(cell, questions)
+    finally:
+        queue.close()
+    logger.info("Queued %s new questions for cell %s", added, cell)
+
+
+def work(queue_path: str, source_dir: str, cells: list = None) -> None:
+    """
+    Runs one queue worker in this process.
+    """
+    config = ApiConfiguration()
+    setup_logging(config)
+    run_queue_worker(config, queue_path, source_dir, logger, cells=cells)
+
+
+def main():
+    setup_logging()
+    usage = __doc__.split("\n\n")[1]
+    if len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+    command, queue_path = sys.argv[1], sys.argv[2]
+
+    if command == "enqueue" and len(sys.argv) >= 4:
+        enqueue(queue_path, sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+
+    elif command == "work" and len(sys.argv) >= 4:
+        processes = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+        cells = sys.argv[5:] or None
+        # Spawned rather than forked, as the logging writer thread is already running in this process
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=work, args=(queue_path, sys.argv[3], cells)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    elif command == "status":
+        queue = WorkQueue(queue_path)
+        try:
+            for cell, counts in sorted(queue.progress().items()):
+                print(cell, json.dumps(counts))
+        finally:
+            queue.close()
+
+    elif command == "merge" and len(sys.argv) >= 4:
+        os.makedirs(sys.argv[3], exist_ok=True)
+        merge_report = merge_queue_results(queue_path, sys.argv[3], logger)
+        for cell, report in merge_report.items():
+            print(cell, report["results"], "results,", len(report["missing"]), "missing")
+
+    else:
+        print(usage)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Results Store:
+One SQLite database of the results of every run, so cross-run analysis is an indexed query instead of a re-parse
+of every results file.
+
+    python ResultsStore.py import <results.db> <file or directory> [...]
+
+The tables are normalised: runs (model, persona, run id and a snapshot of the configuration), questions (one row
+per question of a run), hits (the best knowledge-base hit of a question) and stage_timings (seconds spent in each
+stage of a question). Runs are indexed by persona, model and run id. Legacy results JSON files can be imported,
+with the model, persona, run and time taken from the file name where it says.
+"""
+
+# Standard Library Imports
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from typing import List, Dict, Any, Optional
+
+# Local Modules
+from SequentialStopping import parse_gemini_score
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    model TEXT,
+    persona TEXT,
+    started_at TEXT,
+    source TEXT UNIQUE,
+    config TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_persona ON runs (persona);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model);
+CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id);
+
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    question TEXT,
+    enriched_question TEXT,
+    follow_up TEXT,
+    follow_up_on_topic TEXT,
+    follow_up_topic_score REAL,
+    follow_up_topic_source TEXT,
+    gemini_evaluation TEXT,
+    gemini_score INTEGER,
+    skip_reason TEXT,
+    UNIQUE (run, position)
+);
+
+CREATE TABLE IF NOT EXISTS hits (
+    question INTEGER PRIMARY KEY REFERENCES questions (id) ON DELETE CASCADE,
+    hit INTEGER,
+    hit_relevance REAL,
+    summary TEXT
+);
+
+CREATE TABLE IF NOT EXISTS stage_timings (
+    question INTEGER NOT NULL REFERENCES questions (id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (question, stage)
+);
+CREATE INDEX IF NOT EXISTS stage_timings_stage ON stage_timings (stage);
+"""
+
+# File name patterns of the legacy results files, tried in order, first match wins
+RUN_PATTERN = re.compile(r"run(\d+)", re.IGNORECASE)
+TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}")
+MODEL_PATTERNS = [
+    (re.compile(r"gpt-?4o|4o", re.IGNORECASE), "gpt-4o"),
+    (re.compile(r"gpt-?3[-.]5|gpt-?3|3[-.]5", re.IGNORECASE), "gpt-3.5"),
+    (re.compile(r"gpt-?4", re.IGNORECASE), "gpt-4"),
+]
+PERSONA_PATTERNS = [
+    (re.compile(r"business_?analyst", re.IGNORECASE), "businessanalyst"),
+    (re.compile(r"BA"), "businessanalyst"),
+    (re.compile(r"develo\w*", re.IGNORECASE), "developer"),
+    (re.compile(r"tester", re.IGNORECASE), "tester"),
+    (re.compile(r"static|nonetype", re.IGNORECASE), "static"),
+]
+
+# Configuration attributes never written to the database
+SECRET_CONFIG_KEYS = {"apiKey", "GeminiApiKey"}
+
+
+class ResultsStore:
+    def __init__(self, db_path: str) -> None:
+        """
+        Opens (and if necessary creates) a results database.
+
+        Args:
+            db_path (str): The path of the SQLite database file.
+
+        Returns:
+            None
+        """
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path, timeout=60)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.executescript(SCHEMA)
+
+    def add_run(self, records: List[Dict[str, Any]], model: str, persona: str, run_id: str = None, config: Dict[str, Any] = None, started_at: str = None, source: str = None) -> int:
+        """
+        Adds a run and its results.
+
+        Args:
+            records (List[Dict[str, Any]]): The result records of the run in question order, as made by DataTest.result_to_record.
+            model (str): The model the run used, e.g. "gpt-4o".
+            persona (str): The persona of the run, e.g. "developer", or "static".
+            run_id (str): The run label, e.g. "run1".
+            config (Dict[str, Any]): The configuration snapshot of the run, see config_snapshot.
+            started_at (str): The ISO time the run started, by default now.
+            source (str): The file the run was imported from, so it is never imported twice.
+
+        Returns:
+            int: The database id of the run.
+        """
+        started_at = started_at or datetime.datetime.now().isoformat(timespec="seconds")
+        with self._connection:
+            run = self._connection.execute(
+                "INSERT INTO runs (run_id, model, persona, started_at, source, config) VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, model, persona, started_at, source, json.dumps(config) if config is not None else None),
+            ).lastrowid
+            self._insert_records(run, records, 0)
+        return run
+
+    def add_records(self, run: int, records: List[Dict[str, Any]], first_position: int) -> None:
+        """
+        Adds more results to a run, e.g. as a streaming run writes them out.
+
+        Args:
+            run (int): The database id of the run, as returned by add_run.
+            records (List[Dict[str, Any]]): The result records, in question order.
+            first_position (int): The position of the first record in the run.
+
+        Returns:
+            None
+        """
+        with self._connection:
+            self._insert_records(run, records, first_position)
+
+    def _insert_records(self, run: int, records: List[Dict[str, Any]], first_position: int) -> None:
+        for position, record in enumerate(records, first_position):
+            question = self._connection.execute(
+                "INSERT INTO questions (run, position, question, enriched_question, follow_up, follow_up_on_topic, follow_up_topic_score, follow_up_topic_source, gemini_evaluation, gemini_score, skip_reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run, position, record.get("question"), record.get("enriched_question"), record.get("follow_up"),
+                    record.get("follow_up_on_topic"), record.get("follow_up_topic_score"), record.get("follow_up_topic_source"),
+                    record.get("gemini_evaluation"), parse_gemini_score(record.get("gemini_evaluation")), record.get("skip_reason"),
+                ),
+            ).lastrowid
+            self._connection.execute(
+                "INSERT INTO hits (question, hit, hit_relevance, summary) VALUES (?, ?, ?, ?)",
+                (question, int(bool(record.get("hit"))), record.get("hitRelevance"), record.get("summary")),
+            )
+            self._connection.executemany(
+                "INSERT INTO stage_timings (question, stage, seconds) VALUES (?, ?, ?)",
+                [(question, stage, seconds) for stage, seconds in (record.get("stage_timings") or {}).items()],
+            )
+
+    def import_legacy_json(self, path: str) -> Optional[int]:
+        """
+        Imports a legacy results JSON file, taking the model, persona, run and time from its file name.
+
+        Args:
+            path (str): The path of the JSON file, holding a list of result records.
+
+        Returns:
+            Optional[int]: The database id of the run, or None if the file was imported before or holds no results.
+        """
+        source = os.path.abspath(path)
+        if self._connection.execute("SELECT 1 FROM runs WHERE source = ?", (source,)).fetchone():
+            logger.info("Already imported: %s", path)
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if not isinstance(records, list) or not records or not isinstance(records[0], dict) or "question" not in records[0]:
+            logger.warning("Not a results file, skipped: %s", path)
+            return None
+
+        labels = parse_legacy_file_name(os.path.basename(path))
+        run = self.add_run(records, labels["model"], labels["persona"], labels["run_id"], started_at=labels["started_at"], source=source)
+        logger.info("Imported %s results from %s as run %s", len(records), path, run)
+        return run
+
+    def import_legacy_dir(self, directory: str) -> List[int]:
+        """
+        Imports every legacy results JSON file under a directory.
+
+        Args:
+            directory (str): The directory to search, including its sub-directories.
+
+        Returns:
+            List[int]: The database ids of the runs imported.
+        """
+        runs = []
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if name.lower().endswith(".json"):
+                    run = self.import_legacy_json(os.path.join(root, name))
+                    if run is not None:
+                        runs.append(run)
+        return runs
+
+    def query(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        """
+        Runs a read query, e.g. "SELECT model, persona, AVG(gemini_score) FROM runs JOIN questions ON questions.run = runs.id GROUP BY model, persona".
+        """
+        return self._connection.execute(sql, parameters).fetchall()
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        self._connection.close()
+
+
+def parse_legacy_file_name(name: str) -> Dict[str, Optional[str]]:
+    """
+    Takes the model, persona, run label and time from a results file name such as
+    "run1_gpt4o_test_output_v5_developer_2024-12-07_11-27-47.json" or "run2BA3-5.json".
+
+    Args:
+        name (str): The file name.
+
+    Returns:
+        Dict[str, Optional[str]]: "model", "persona", "run_id" and "started_at", None where the name does not say.
+    """
+    stem = os.path.splitext(name)[0]
+    timestamp = TIMESTAMP_PATTERN.search(stem)
+    labels = stem[:timestamp.start()] if timestamp else stem     # The time's digits must not be read as a model
+    run = RUN_PATTERN.search(labels)
+    return {
+        "model": next((model for pattern, model in MODEL_PATTERNS if pattern.search(labels)), None),
+        "persona": next((persona for pattern, persona in PERSONA_PATTERNS if pattern.search(labels)), None),
+        "run_id": f"run{run.group(1)}" if run else None,
+        "started_at": datetime.datetime.strptime(timestamp.group(), "%Y-%m-%d_%H-%M-%S").isoformat() if timestamp else None,
+    }
+
+
+def normalise_persona(test_mode: str) -> str:
+    """
+    Returns the persona stored for a run_tests test mode, "static" for a run without a persona strategy.
+    """
+    return "static" if test_mode in ("", "nonetype") else test_mode
+
+
+def config_snapshot(config: Any) -> Dict[str, Any]:
+    """
+    Returns the JSON-serialisable settings of a configuration, without its keys.
+
+    Args:
+        config (ApiConfiguration): The configuration.
+
+    Returns:
+        Dict[str, Any]: The settings by attribute name. Settings that cannot be written as JSON are written as text.
+    """
+    snapshot = {}
+    for key, value in vars(config).items():
+        if key in SECRET_CONFIG_KEYS:
+            continue
+        try:
+            json.dumps(value)
+            snapshot[key] = value
+        except TypeError:
+            snapshot[key] = repr(value)
+    return snapshot
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    usage = __doc__.split("\n\n")[1]
+    if len(sys.argv) < 4 or sys.argv[1] != "import":
+        print(usage)
+        sys.exit(1)
+
+    store = ResultsStore(sys.argv[2])
+    try:
+        for path in sys.argv[3:]:
+            if os.path.isdir(path):
+                store.import_legacy_dir(path)
+            else:
+                store.import_legacy_json(path)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
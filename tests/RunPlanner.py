@@ -0,0 +1,303 @@
+"""
+Run Planner:
+Estimates what a run_tests call will cost before it is made. The planner walks the same stages as run_tests for
+the configuration given, without calling any API, and counts the chat, embedding and Gemini requests each stage
+will make. Tokens are estimated from the prompt constants and the question lengths, cost from the configured
+token prices, and wall-clock time from the configured latencies, concurrency and rate limits. Stages that overlap
+in the run's mode are timed as they overlap: a streamed run takes as long as its slowest stage, and with a stage
+graph the Gemini judge runs alongside the rest of each question.
+
+The estimates are upper bounds where the pipeline's behaviour depends on the answers, e.g. every question is
+assumed to find a hit and so to get a follow-up, and an adaptive run is assumed to use its whole question budget.
+Stages served from a cache or a local model are discounted by the configured cache hit rates.
+"""
+
+# Standard Library Imports
+import math
+from typing import List, Dict, Any
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from DataTest import (
+    NUM_QUESTIONS, EMBEDDING_BATCH_SIZE, OPENAI_PERSONA_PROMPT, ENRICHMENT_PROMPT, BATCH_ENRICHMENT_PROMPT, FOLLOW_UP_PROMPT,
+    FOLLOW_UP_ON_TOPIC_PROMPT, FUSED_FOLLOW_UP_PROMPT, gemini_evaluator,
+)
+from PersonaStrategy import SHARD_QUESTIONS_PROMPT
+
+# Constants
+CHARS_PER_TOKEN = 4                 # Rough length of a token in English text
+TOKENS_PER_WORD = 1.35              # Rough number of tokens in an English word
+MESSAGE_OVERHEAD_TOKENS = 4         # Tokens the chat format adds to every message
+DEFAULT_QUESTION_TOKENS = 20        # Length of a generated question when the questions are not known yet
+FOLLOW_UP_TOKENS = 14               # A follow-up question of no more than 10 words
+VERDICT_TOKENS = 2                  # A "yes"/"no" answer or a Gemini score
+FUSED_FOLLOW_UP_TOKENS = 30         # The JSON object of a fused follow-up and its on-topic check
+
+PIPELINE_STAGES = {                 # Streaming pipeline stage each per-question planner stage runs in
+    "enrichment": "enrich",
+    "embedding": "embed",
+    "follow_up": "follow_up",
+    "fused_follow_up": "follow_up",
+    "on_topic": "follow_up",
+    "topic_classifier_embedding": "follow_up",
+    "gemini": "judge",
+}
+GRAPH_BRANCH_STAGES = ("follow_up", "fused_follow_up", "on_topic")     # Stages a stage graph runs alongside the Gemini judge
+
+DEFAULT_STAGE_LATENCY = {           # Seconds per request of each endpoint when planStageLatency does not say
+    "chat": 3.0,
+    "embedding": 0.5,
+    "gemini": 2.0,
+}
+DEFAULT_TOKEN_PRICES = {            # USD per 1,000 tokens when planTokenPrices does not say, update to the deployment's price list
+    "chat_input": 0.03,
+    "chat_output": 0.06,
+    "embedding": 0.00013,
+    "gemini_input": 0.00125,
+    "gemini_output": 0.005,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in a text.
+    """
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def chat_tokens(*messages: str) -> int:
+    """
+    Estimates the input tokens of a chat request made of the given messages.
+    """
+    return sum(estimate_tokens(message) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def plan_run(config: ApiConfiguration, questions: List[str] = None, persona_prompt: str = None, num_questions: int = NUM_QUESTIONS) -> Dict[str, Any]:
+    """
+    Estimates the requests, tokens, cost and duration of a run without calling any API.
+
+    Args:
+        config (ApiConfiguration): The configuration the run would use.
+        questions (List[str]): The questions of a static run.
+        persona_prompt (str): The persona prompt of a persona run, whose questions are generated first.
+        num_questions (int): The number of questions a persona run generates.
+
+    Returns:
+        Dict[str, Any]: The estimate of every stage, with its endpoint, requests, input and output tokens, cost
+        and seconds, and the totals of the run.
+    """
+    if questions:
+        question_tokens = sum(estimate_tokens(question) for question in questions) / len(questions)
+        num_questions = len(questions)
+    else:
+        question_tokens = DEFAULT_QUESTION_TOKENS
+    summary_tokens = config.summaryWordCount * TOKENS_PER_WORD
+    cache_hit_rates = config.planCacheHitRates or {}
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    def add_stage(name: str, endpoint: str, requests: float, input_tokens: float, output_tokens: float = 0, concurrency: int = 1) -> None:
+        """
+        Adds a stage, discounted by its cache hit rate. Tokens are totals over the stage's requests.
+        """
+        if requests <= 0:
+            return
+        miss_rate = 1.0 - cache_hit_rates.get(name, 0.0)
+        stages[name] = {
+            "endpoint": endpoint,
+            "requests": requests * miss_rate,
+            "input_tokens": input_tokens * miss_rate,
+            "output_tokens": output_tokens * miss_rate,
+            "concurrency": concurrency,
+        }
+
+    # Persona question generation, one completion or one JSON shard per questionGenerationShardSize questions
+    if persona_prompt and not questions:
+        if config.questionGenerationShardSize:
+            shards = math.ceil(num_questions / config.questionGenerationShardSize)
+            shard_prompt = SHARD_QUESTIONS_PROMPT.format(count=config.questionGenerationShardSize, sub_topic="the topic in general")
+            add_stage("question_generation", "chat", shards, shards * chat_tokens(persona_prompt, shard_prompt), num_questions * question_tokens, config.processingThreads)
+        else:
+            add_stage("question_generation", "chat", 1, chat_tokens(persona_prompt, f"Generate {num_questions} questions about this topic."), num_questions * question_tokens)
+
+    if config.questionDedupThreshold:
+        add_stage("question_dedup", "embedding", math.ceil(num_questions / EMBEDDING_BATCH_SIZE), num_questions * question_tokens)
+
+    # An adaptive run stops early, but may use its whole question budget
+    if config.adaptiveStopping and config.adaptiveMaxQuestions:
+        num_questions = min(num_questions, config.adaptiveMaxQuestions)
+
+    # Per-question stages run one question at a time in each worker process, or streamed with processingThreads
+    # workers per API stage. A streamed run enriches and embeds each question on its own.
+    streaming = config.streamingPipeline
+    workers = config.processingThreads if streaming else max(1, config.processingWorkers)
+    enrichment_input = estimate_tokens(OPENAI_PERSONA_PROMPT) + estimate_tokens(ENRICHMENT_PROMPT) + question_tokens + 2 * MESSAGE_OVERHEAD_TOKENS
+    if config.enrichmentBatchSize > 1 and not streaming:
+        batches = math.ceil(num_questions / config.enrichmentBatchSize)
+        batch_input = batches * chat_tokens(OPENAI_PERSONA_PROMPT, BATCH_ENRICHMENT_PROMPT) + num_questions * question_tokens
+        add_stage("batch_enrichment", "chat", batches, batch_input, num_questions * summary_tokens, workers)
+        if config.enrichmentAuditSample:
+            sample = min(config.enrichmentAuditSample, num_questions)
+            add_stage("enrichment_audit", "chat", sample + math.ceil(sample / config.enrichmentBatchSize), 2 * sample * enrichment_input, 2 * sample * summary_tokens)
+            add_stage("enrichment_audit_embedding", "embedding", 2 * sample, 2 * sample * summary_tokens)
+    else:
+        add_stage("enrichment", "chat", num_questions, num_questions * enrichment_input, num_questions * summary_tokens, workers)
+
+    # Lexical retrieval needs no embedding of the enriched question
+    if config.retrievalMode != "lexical":
+        add_stage("embedding", "embedding", embedding_requests(config, num_questions), num_questions * summary_tokens, 0, workers)
+
+    if config.fuseFollowUpStages:
+        add_stage("fused_follow_up", "chat", num_questions, num_questions * (chat_tokens(FUSED_FOLLOW_UP_PROMPT) + summary_tokens + MESSAGE_OVERHEAD_TOKENS), num_questions * FUSED_FOLLOW_UP_TOKENS, workers)
+    else:
+        add_stage("follow_up", "chat", num_questions, num_questions * (chat_tokens(FOLLOW_UP_PROMPT) + summary_tokens + MESSAGE_OVERHEAD_TOKENS), num_questions * FOLLOW_UP_TOKENS, workers)
+        on_topic_input = num_questions * (chat_tokens(FOLLOW_UP_ON_TOPIC_PROMPT) + FOLLOW_UP_TOKENS + MESSAGE_OVERHEAD_TOKENS)
+        if config.followUpTopicClassifier:
+            # The classifier embeds the follow-ups in one batch, only the uncertain ones (the cache misses) reach the LLM
+            # The streaming pipeline classifies each follow-up as it comes
+            classifier_requests = num_questions if streaming else math.ceil(num_questions / EMBEDDING_BATCH_SIZE)
+            add_stage("topic_classifier_embedding", "embedding", classifier_requests, num_questions * FOLLOW_UP_TOKENS, 0, workers if streaming else 1)
+        add_stage("on_topic", "chat", num_questions, on_topic_input, num_questions * VERDICT_TOKENS, workers)
+
+    gemini_input = estimate_tokens(gemini_evaluator.system_instruction_prompt_eval) + question_tokens + summary_tokens
+    add_stage("gemini", "gemini", num_questions, num_questions * gemini_input, num_questions * VERDICT_TOKENS, workers)
+
+    # Price the stages and time them, each at the configured latency shared out over its concurrency
+    prices = {**DEFAULT_TOKEN_PRICES, **(config.planTokenPrices or {})}
+    latencies = {**DEFAULT_STAGE_LATENCY, **(config.planStageLatency or {})}
+    for stage in stages.values():
+        endpoint = stage["endpoint"]
+        if endpoint == "embedding":
+            stage["cost"] = stage["input_tokens"] / 1000 * prices["embedding"]
+        else:
+            stage["cost"] = stage["input_tokens"] / 1000 * prices[f"{endpoint}_input"] + stage["output_tokens"] / 1000 * prices[f"{endpoint}_output"]
+        stage["seconds"] = stage["requests"] * latencies[endpoint] / stage["concurrency"]
+
+    return {"questions": num_questions, "stages": stages, "totals": plan_totals(config, stages, overlapped_seconds(config, stages))}
+
+
+def uses_chunk_index(config: ApiConfiguration) -> bool:
+    """
+    Checks whether run_tests searches a chunk index for the configuration, rather than scanning the chunks in memory
+    question by question.
+    """
+    return bool(config.chunkIndexDir or config.retrievalMode != "dense" or config.articleFanOut or config.searchShardAddresses
+                or config.searchShards > 1 or config.processingWorkers > 1)
+
+
+def embedding_requests(config: ApiConfiguration, num_questions: int) -> int:
+    """
+    Returns the requests that embed the enriched questions. With a chunk index every call of process_questions passes
+    its questions to search_chunk_index together, which embeds them EMBEDDING_BATCH_SIZE to a request: one call for
+    the run, one per adaptive batch or one per worker slice. Without one, and in the streaming pipeline, every question
+    is embedded on its own.
+    """
+    if config.streamingPipeline or not uses_chunk_index(config):
+        return num_questions
+
+    if config.adaptiveStopping:
+        call_size = config.adaptiveBatchSize
+    elif config.processingWorkers > 1:
+        call_size = max(1, -(-num_questions // (config.processingWorkers * 4)))     # The slice size of process_questions_in_workers
+    else:
+        call_size = max(1, num_questions)
+    full_calls, last_call = divmod(num_questions, call_size)
+    return full_calls * math.ceil(call_size / EMBEDDING_BATCH_SIZE) + math.ceil(last_call / EMBEDDING_BATCH_SIZE)
+
+
+def overlapped_seconds(config: ApiConfiguration, stages: Dict[str, Dict[str, Any]]) -> float:
+    """
+    Returns the seconds of the stage times that overlap with other stages and so do not add to the run's time.
+
+    In the streaming pipeline every stage runs at once, so once the pipeline is full the run takes as long as its
+    slowest stage. With a stage graph the Gemini judge of each question runs alongside its follow-up and on-topic
+    check, and its embedding when the question is embedded on its own.
+    """
+    if config.streamingPipeline:
+        pipeline: Dict[str, float] = {}
+        for name, pipeline_stage in PIPELINE_STAGES.items():
+            if name in stages:
+                pipeline[pipeline_stage] = pipeline.get(pipeline_stage, 0.0) + stages[name]["seconds"]
+        return sum(pipeline.values()) - max(pipeline.values(), default=0.0)
+
+    if config.stageGraph and "gemini" in stages:
+        branch = list(GRAPH_BRANCH_STAGES) + ([] if uses_chunk_index(config) else ["embedding"])
+        return min(stages["gemini"]["seconds"], sum(stages[name]["seconds"] for name in branch if name in stages))
+    return 0.0
+
+
+def plan_totals(config: ApiConfiguration, stages: Dict[str, Dict[str, Any]], overlap_seconds: float = 0.0) -> Dict[str, Any]:
+    """
+    Sums the stage estimates per endpoint and projects the run's wall-clock time.
+
+    The time is the longer of the latency-bound time of the stages, run one after another less the time they
+    overlap, and, for each endpoint with a configured rate limit, the time its requests and tokens take to fit under
+    the limit.
+
+    Args:
+        config (ApiConfiguration): The configuration holding the rate limits.
+        stages (Dict[str, Dict[str, Any]]): The stage estimates.
+        overlap_seconds (float): The seconds of the stage times that overlap, from overlapped_seconds.
+
+    Returns:
+        Dict[str, Any]: The requests and tokens per endpoint, the cost and the projected seconds.
+    """
+    endpoints: Dict[str, Dict[str, float]] = {}
+    for stage in stages.values():
+        totals = endpoints.setdefault(stage["endpoint"], {"requests": 0, "input_tokens": 0, "output_tokens": 0})
+        for key in totals:
+            totals[key] += stage[key]
+
+    seconds = sum(stage["seconds"] for stage in stages.values()) - overlap_seconds
+    rate_limited_seconds = 0.0
+    for endpoint, limits in (config.planRateLimits or {}).items():
+        totals = endpoints.get(endpoint)
+        if totals is None:
+            continue
+        if limits.get("requests_per_minute"):
+            rate_limited_seconds = max(rate_limited_seconds, 60 * totals["requests"] / limits["requests_per_minute"])
+        if limits.get("tokens_per_minute"):
+            rate_limited_seconds = max(rate_limited_seconds, 60 * (totals["input_tokens"] + totals["output_tokens"]) / limits["tokens_per_minute"])
+
+    return {
+        "endpoints": endpoints,
+        "cost": sum(stage["cost"] for stage in stages.values()),
+        "latency_seconds": seconds,
+        "overlap_seconds": overlap_seconds,
+        "rate_limited_seconds": rate_limited_seconds,
+        "seconds": max(seconds, rate_limited_seconds),
+    }
+
+
+def combine_plans(plans: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Adds up the plans of the cells of a matrix run, which are run one after another.
+
+    Args:
+        plans (Dict[str, Dict[str, Any]]): The plan of each cell, by cell name.
+
+    Returns:
+        Dict[str, Any]: The requests and tokens per endpoint, cost and seconds of the whole matrix.
+    """
+    combined = {"endpoints": {}, "cost": 0.0, "seconds": 0.0}
+    for plan in plans.values():
+        totals = plan["totals"]
+        combined["cost"] += totals["cost"]
+        combined["seconds"] += totals["seconds"]
+        for endpoint, counts in totals["endpoints"].items():
+            combined_counts = combined["endpoints"].setdefault(endpoint, {"requests": 0, "input_tokens": 0, "output_tokens": 0})
+            for key, value in counts.items():
+                combined_counts[key] += value
+    return combined
+
+
+def format_plan(name: str, plan: Dict[str, Any]) -> str:
+    """
+    Formats a plan as a table of its stages followed by its totals.
+    """
+    lines = [f"Plan for {name}: {plan['questions']} questions", f"  {'stage':<28}{'endpoint':<11}{'requests':>10}{'in tokens':>12}{'out tokens':>12}{'cost $':>10}{'seconds':>10}"]
+    for stage_name, stage in plan["stages"].items():
+        lines.append(f"  {stage_name:<28}{stage['endpoint']:<11}{stage['requests']:>10.0f}{stage['input_tokens']:>12.0f}{stage['output_tokens']:>12.0f}{stage['cost']:>10.2f}{stage['seconds']:>10.0f}")
+    totals = plan["totals"]
+    lines.append(f"  Total cost ${totals['cost']:.2f}, about {totals['seconds'] / 60:.1f} minutes"
+                 + (" (rate limited)" if totals["rate_limited_seconds"] > totals["latency_seconds"] else ""))
+    return "\n".join(lines)
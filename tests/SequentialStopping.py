@@ -0,0 +1,195 @@
+"""
+Sequential Stopping:
+Streaming confidence intervals for the run-level metrics of a test cell (hit rate, mean hit relevance and mean
+Gemini score) and the rule that stops an adaptive run once every interval is narrow enough or a question or
+API-call budget is spent.
+
+Questions must be processed in a random order for the intervals to be valid, since persona generation tends to
+group related questions together.
+"""
+
+# Standard Library Imports
+import math
+import re
+from statistics import NormalDist
+from typing import Dict, Any, Optional
+
+# Constants
+DEFAULT_TARGET_WIDTHS = {           # Full width of the confidence interval at which each metric is known well enough
+    "hit_rate": 0.10,
+    "hit_relevance": 0.02,
+    "gemini_score": 0.25,
+}
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_QUESTIONS = 20          # Intervals from fewer questions are too unreliable to stop on
+
+# Stop reasons
+STOP_CONVERGED = "intervals_converged"
+STOP_QUESTION_BUDGET = "question_budget"
+STOP_COST_BUDGET = "cost_budget"
+STOP_EXHAUSTED = "questions_exhausted"
+STOP_DEADLINE = "run_deadline"
+
+GEMINI_SCORE_PATTERN = re.compile(r"[1-4]")
+
+
+class RunningMean:
+    def __init__(self, binary: bool = False) -> None:
+        """
+        Initializes a running mean and variance (Welford's method).
+
+        Args:
+            binary (bool): Whether the values are 0/1, in which case the Wilson score interval is used, which
+                stays sensible for small samples and for rates near 0 or 1.
+
+        Returns:
+            None
+        """
+        self.binary = binary
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+        """
+        Adds one observation.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def interval(self, z: float) -> Optional[Dict[str, float]]:
+        """
+        Returns the confidence interval of the mean for a standard normal quantile z, or None below two observations.
+        """
+        if self.count < 2:
+            return None
+
+        if self.binary:
+            # Wilson score interval
+            n, p = self.count, self.mean
+            centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+            half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        else:
+            centre = self.mean
+            half_width = z * math.sqrt(self._m2 / (self.count - 1) / self.count)
+
+        return {"mean": self.mean, "lower": centre - half_width, "upper": centre + half_width, "width": 2 * half_width, "count": self.count}
+
+
+class SequentialStopRule:
+    def __init__(self, target_widths: Dict[str, float] = None, confidence: float = DEFAULT_CONFIDENCE, min_questions: int = DEFAULT_MIN_QUESTIONS, max_questions: int = None, max_api_calls: int = None) -> None:
+        """
+        Initializes the stop rule.
+
+        Args:
+            target_widths (Dict[str, float]): Confidence interval width per metric at which the metric is known well enough.
+            confidence (float): The confidence level of the intervals.
+            min_questions (int): The number of measured questions, not counting skipped ones, before the intervals are trusted.
+            max_questions (int): Optional budget of questions.
+            max_api_calls (int): Optional budget of API calls.
+
+        Returns:
+            None
+        """
+        self.target_widths = dict(target_widths or DEFAULT_TARGET_WIDTHS)
+        unknown = set(self.target_widths) - set(DEFAULT_TARGET_WIDTHS)
+        if unknown:
+            raise ValueError(f"Unknown sequential stopping metrics: {sorted(unknown)}")
+
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.min_questions = min_questions
+        self.max_questions = max_questions
+        self.max_api_calls = max_api_calls
+
+        self.metrics = {"hit_rate": RunningMean(binary=True), "hit_relevance": RunningMean(), "gemini_score": RunningMean()}
+        self.questions = 0
+        self.skipped = 0
+        self.api_calls = 0.0
+        self.stop_reason = ""
+
+    def update(self, hit: bool, hit_relevance: float, gemini_evaluation: str, api_calls: float) -> None:
+        """
+        Adds the outcome of one processed question.
+
+        Args:
+            hit (bool): Whether the question was a hit.
+            hit_relevance (float): The relevance of the best hit.
+            gemini_evaluation (str): The Gemini evaluation text, from which a 1-4 score is taken if there is one.
+            api_calls (float): The number of API calls the question cost, fractional where calls are shared by a batch.
+
+        Returns:
+            None
+        """
+        self.questions += 1
+        self.api_calls += api_calls
+        self.metrics["hit_rate"].add(1.0 if hit else 0.0)
+        self.metrics["hit_relevance"].add(float(hit_relevance))
+
+        score = parse_gemini_score(gemini_evaluation)
+        if score is not None:
+            self.metrics["gemini_score"].add(score)
+
+    def skip(self, api_calls: float) -> None:
+        """
+        Adds a question that was skipped or left unprocessed. It counts towards the budgets but not the metrics, as
+        its missing hit and score say nothing about the cell.
+
+        Args:
+            api_calls (float): The number of API calls the question cost before it was skipped.
+
+        Returns:
+            None
+        """
+        self.questions += 1
+        self.skipped += 1
+        self.api_calls += api_calls
+
+    def check(self) -> str:
+        """
+        Decides whether the run can stop.
+
+        Returns:
+            str: The stop reason, or an empty string to carry on. Once a reason is returned it is kept.
+        """
+        if self.stop_reason:
+            return self.stop_reason
+
+        if self.max_questions is not None and self.questions >= self.max_questions:
+            self.stop_reason = STOP_QUESTION_BUDGET
+        elif self.max_api_calls is not None and self.api_calls >= self.max_api_calls:
+            self.stop_reason = STOP_COST_BUDGET
+        elif self.metrics["hit_rate"].count >= self.min_questions and all(self._converged(metric, width) for metric, width in self.target_widths.items()):
+            self.stop_reason = STOP_CONVERGED
+        return self.stop_reason
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the stop reason, the budgets spent and the current interval of each metric.
+        """
+        return {
+            "stop_reason": self.stop_reason,
+            "questions": self.questions,
+            "skipped": self.skipped,
+            "api_calls": self.api_calls,
+            "confidence": self.confidence,
+            "target_widths": self.target_widths,
+            "intervals": {metric: running.interval(self.z) for metric, running in self.metrics.items()},
+        }
+
+    def _converged(self, metric: str, width: float) -> bool:
+        """
+        Checks whether a metric's interval is at most the target width.
+        """
+        interval = self.metrics[metric].interval(self.z)
+        return interval is not None and interval["width"] <= width
+
+
+def parse_gemini_score(gemini_evaluation: str) -> Optional[int]:
+    """
+    Takes the 1-4 score from a Gemini evaluation such as "3\\n", or None if it has none.
+    """
+    match = GEMINI_SCORE_PATTERN.search(gemini_evaluation or "")
+    return int(match.group()) if match else None
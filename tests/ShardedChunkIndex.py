@@ -0,0 +1,306 @@
+"""
+Sharded Chunk Index:
+Partitions the knowledge-base chunks into contiguous shards, each served by its own process over a local TCP or
+Unix-socket connection, and scatters every query batch to all shards before merging the per-shard top-k.
+
+Shards hold contiguous ranges of the chunks and the merge breaks ties on the global chunk id, so the result is the
+same as a single-node search. Shard servers can run on other hosts:
+
+    python ShardedChunkIndex.py serve <chunks.json> <shard number> <shard count> <host:port>
+
+with the same CHUNK_SHARD_AUTHKEY environment variable set on the servers and on the machine running the tests.
+"""
+
+# Standard Library Imports
+import bisect
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Listener, Client, Connection
+from typing import List, Dict, Any, Tuple, Union
+
+# Third-Party Packages
+import numpy as np
+
+# Add the project root and scripts directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Local Modules
+from ChunkIndex import ChunkIndex, InMemoryChunkIndex, DEFAULT_SEARCH_BLOCK_SIZE
+
+# Shared secret for shard connections. Messages are pickled, so servers only accept clients that know the key.
+SHARD_AUTHKEY = os.getenv("CHUNK_SHARD_AUTHKEY")
+
+SHARD_START_TIMEOUT = 300       # Seconds a local shard process gets to build its index and start listening
+_POLL_SECONDS = 0.5             # Wait between checks that a starting shard process is still alive
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+
+
+class ShardedChunkIndex(ChunkIndex):
+    def __init__(self, addresses: List[Address], authkey: bytes, processes: List[multiprocessing.Process] = None, socket_dir: str = None) -> None:
+        """
+        Connects a coordinator to running shard servers.
+
+        Args:
+            addresses (List[Address]): The shard server addresses, in shard order. A "host:port" string, a (host, port) tuple or a Unix socket path.
+            authkey (bytes): The shared secret the shard servers were started with.
+            processes (List[multiprocessing.Process]): Local shard processes owned by this coordinator, stopped by close().
+            socket_dir (str): A directory of the local shards' sockets, removed by close().
+
+        Returns:
+            None
+        """
+        self.addresses = [parse_shard_address(address) for address in addresses]
+        self.authkey = authkey
+        self.processes = processes or []
+        self.socket_dir = socket_dir
+        self._connections = [Client(address, authkey=authkey) for address in self.addresses]
+        self._locks = [threading.Lock() for _ in self._connections]
+
+        # Global chunk id = offset of the shard + id within the shard, in the original chunk order
+        counts = [info["count"] for info in self._scatter("info")]
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64).tolist()
+        self.count = self.offsets[-1]
+
+        logger.info("Connected to %s chunk shards holding %s chunks", len(self.addresses), self.count)
+
+    @classmethod
+    def start_local(cls, chunks: List[Dict[str, Any]], num_shards: int, block_size: int = DEFAULT_SEARCH_BLOCK_SIZE, threads: int = 1) -> "ShardedChunkIndex":
+        """
+        Splits the chunks into contiguous shards and serves each from a local process on a Unix socket.
+
+        Args:
+            chunks (List[Dict[str, Any]]): The processed chunks, each with "embedding" and "summary" fields.
+            num_shards (int): The number of shards and shard processes.
+            block_size (int): The number of chunks scored per block in each shard.
+            threads (int): The number of blocks each shard scores concurrently.
+
+        Returns:
+            ShardedChunkIndex: A coordinator that stops the shard processes when closed.
+
+        Raises:
+            RuntimeError: If a shard process exits or does not start listening within SHARD_START_TIMEOUT seconds.
+        """
+        authkey = os.urandom(32)
+        socket_dir = tempfile.mkdtemp(prefix="chunk_shards_")
+        processes, addresses = [], []
+
+        # Spawned rather than forked, a fork would copy the parent's threads' locks, such as the logging writer's, mid-use
+        context = multiprocessing.get_context("spawn")
+        try:
+            for shard in range(num_shards):
+                parent_conn, child_conn = context.Pipe()
+                address = os.path.join(socket_dir, f"shard_{shard}.sock")
+                process = context.Process(target=serve_shard, args=(shard_chunks(chunks, shard, num_shards), address, authkey, block_size, threads, child_conn), daemon=True)
+                process.start()
+                child_conn.close()      # Only the shard holds its end, so the pipe reports EOF if the shard dies
+                processes.append(process)
+                with parent_conn:
+                    addresses.append(_wait_for_shard(shard, process, parent_conn))
+            return cls(addresses, authkey, processes, socket_dir)
+        except BaseException:
+            _stop_processes(processes)
+            shutil.rmtree(socket_dir, ignore_errors=True)
+            raise
+
+    def search(self, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Tuple[float, int]]]:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        shard_results = self._scatter("search", queries, top_k)
+
+        # Gather: map shard-local ids to global ids and keep the global top-k per query
+        merged = []
+        for query in range(queries.shape[0]):
+            candidates = [(similarity, self.offsets[shard] + chunk_id) for shard, results in enumerate(shard_results) for similarity, chunk_id in results[query]]
+            merged.append(sorted(candidates, key=lambda match: (-match[0], match[1]))[:top_k])
+        return merged
+
+    def get_summary(self, chunk_id: int) -> str:
+        shard = bisect.bisect_right(self.offsets, chunk_id) - 1
+        return self._request(shard, "summary", chunk_id - self.offsets[shard])
+
+    def worker_handle(self) -> Dict[str, Any]:
+        """
+        Returns the handle worker processes pass to attach_chunk_index to open their own connections to the same shards.
+        """
+        return {"type": "sharded", "addresses": self.addresses, "authkey": self.authkey}
+
+    def close(self) -> None:
+        """
+        Closes the shard connections, stops any shard processes this coordinator started and removes their sockets.
+        """
+        for connection in self._connections:
+            connection.close()
+        _stop_processes(self.processes)
+        if self.socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    def _request(self, shard: int, *message) -> Any:
+        """
+        Sends one request to a shard and waits for its reply. Each shard connection serves one request at a time.
+        """
+        with self._locks[shard]:
+            self._connections[shard].send(message)
+            status, payload = self._connections[shard].recv()
+        if status != "ok":
+            raise RuntimeError(f"Chunk shard {self.addresses[shard]} failed: {payload}")
+        return payload
+
+    def _scatter(self, *message) -> List[Any]:
+        """
+        Sends the same request to every shard concurrently and returns the replies in shard order.
+        """
+        with ThreadPoolExecutor(max_workers=len(self._connections)) as executor:
+            return list(executor.map(lambda shard: self._request(shard, *message), range(len(self._connections))))
+
+
+def shard_chunks(chunks: List[Dict[str, Any]], shard: int, num_shards: int) -> List[Dict[str, Any]]:
+    """
+    Returns the contiguous range of chunks that belongs to a shard.
+
+    Args:
+        chunks (List[Dict[str, Any]]): All of the processed chunks.
+        shard (int): The shard number, from 0.
+        num_shards (int): The total number of shards.
+
+    Returns:
+        List[Dict[str, Any]]: The chunks of this shard, in their original order.
+    """
+    shard_size = -(-len(chunks) // num_shards)
+    return chunks[shard * shard_size:(shard + 1) * shard_size]
+
+
+def parse_shard_address(address: Address) -> Address:
+    """
+    Converts "host:port" strings to (host, port) tuples and leaves Unix socket paths and tuples unchanged.
+    """
+    if isinstance(address, (tuple, list)):
+        return (address[0], int(address[1]))
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+def _wait_for_shard(shard: int, process: multiprocessing.Process, ready_conn: Connection) -> Address:
+    """
+    Waits for a local shard process to send the address it is listening on.
+
+    Args:
+        shard (int): The shard number, for the error message.
+        process (multiprocessing.Process): The shard process.
+        ready_conn (Connection): The parent's end of the pipe the shard sends its address on.
+
+    Returns:
+        Address: The shard's address.
+
+    Raises:
+        RuntimeError: If the process exits first or the address does not come within SHARD_START_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + SHARD_START_TIMEOUT
+    while not ready_conn.poll(_POLL_SECONDS):
+        if not process.is_alive():
+            raise RuntimeError(f"Chunk shard {shard} exited with code {process.exitcode} before it started listening")
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Chunk shard {shard} did not start listening within {SHARD_START_TIMEOUT} seconds")
+    try:
+        return ready_conn.recv()
+    except EOFError:
+        process.join(_POLL_SECONDS)
+        raise RuntimeError(f"Chunk shard {shard} exited with code {process.exitcode} before it started listening") from None
+
+
+def _stop_processes(processes: List[multiprocessing.Process]) -> None:
+    """
+    Stops shard processes and waits for them to exit.
+    """
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def serve_shard(chunks: List[Dict[str, Any]], address: Address, authkey: bytes, block_size: int = DEFAULT_SEARCH_BLOCK_SIZE, threads: int = 1, ready_conn: Connection = None) -> None:
+    """
+    Serves searches over one shard of the chunks until the process is stopped.
+
+    Args:
+        chunks (List[Dict[str, Any]]): The chunks of this shard.
+        address (Address): The address to listen on.
+        authkey (bytes): The shared secret clients must present.
+        block_size (int): The number of chunks scored per block.
+        threads (int): The number of blocks scored concurrently.
+        ready_conn (Connection): Optional pipe on which the listening address is sent once the shard is ready.
+
+    Returns:
+        None
+    """
+    index = InMemoryChunkIndex(chunks, block_size, threads)
+    with Listener(parse_shard_address(address), authkey=authkey) as listener:
+        logger.info("Chunk shard with %s chunks listening on %s", index.count, listener.address)
+        if ready_conn is not None:
+            ready_conn.send(listener.address)
+            ready_conn.close()
+
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=_serve_connection, args=(index, connection), daemon=True).start()
+
+
+def _serve_connection(index: InMemoryChunkIndex, connection: Connection) -> None:
+    """
+    Answers requests from one coordinator connection until it is closed.
+    """
+    with connection:
+        while True:
+            try:
+                command, *args = connection.recv()
+            except EOFError:
+                return
+
+            try:
+                if command == "search":
+                    reply = index.search(*args) if index.count else [[] for _ in range(np.atleast_2d(args[0]).shape[0])]
+                elif command == "summary":
+                    reply = index.get_summary(*args)
+                elif command == "info":
+                    reply = {"count": index.count, "dimension": index.dimension}
+                else:
+                    raise ValueError(f"Unknown command: {command}")
+                connection.send(("ok", reply))
+            except Exception as e:
+                logger.error(f"Error serving chunk shard request: {e}")
+                connection.send(("error", str(e)))
+
+
+def main():
+    """
+    Serves one shard on this host: python ShardedChunkIndex.py serve <chunks.json> <shard number> <shard count> <host:port>
+    """
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 6 or sys.argv[1] != "serve":
+        print("Usage: python ShardedChunkIndex.py serve <chunks.json> <shard number> <shard count> <host:port>")
+        sys.exit(1)
+    if not SHARD_AUTHKEY:
+        logger.error("CHUNK_SHARD_AUTHKEY not set in environment.")
+        raise EnvironmentError("Missing chunk shard authentication key.")
+
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    serve_shard(shard_chunks(chunks, int(sys.argv[3]), int(sys.argv[4])), sys.argv[5], SHARD_AUTHKEY.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
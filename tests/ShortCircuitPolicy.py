@@ -0,0 +1,93 @@
+"""
+Short-Circuit Policy:
+Rules that recognise questions or stage responses which are already known failures, such as the
+"Sure, here are 100 questions..." preamble passed through by persona generation or an enrichment that
+answers "That doesn't seem to be about AI". When a rule matches, `process_questions` skips the stages
+that remain for that question and records the rule name as the skip reason.
+"""
+
+# Standard Library Imports
+import re
+from typing import List, Union
+
+# Stages a rule can inspect. A match skips every later stage that depends on it.
+STAGE_QUESTION = "question"         # The question itself, before enrichment
+STAGE_ENRICHMENT = "enrichment"     # The enriched summary, before embedding, search, follow-up and Gemini
+STAGE_FOLLOW_UP = "follow_up"       # The follow-up question, before the on-topic check
+
+
+class ShortCircuitRule:
+    def __init__(self, name: str, stage: str, pattern: str) -> None:
+        """
+        Initializes a rule that matches a stage's text against a case-insensitive regular expression.
+
+        Args:
+            name (str): The rule name, recorded as the skip reason when the rule matches.
+            stage (str): The stage whose text the rule inspects, one of STAGE_QUESTION, STAGE_ENRICHMENT or STAGE_FOLLOW_UP.
+            pattern (str): The regular expression, searched for anywhere in the text.
+
+        Returns:
+            None
+        """
+        if stage not in {STAGE_QUESTION, STAGE_ENRICHMENT, STAGE_FOLLOW_UP}:
+            raise ValueError(f"Unknown short-circuit stage: {stage}")
+
+        self.name = name
+        self.stage = stage
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+
+    def matches(self, text: str) -> bool:
+        """
+        Checks whether a stage's text matches the rule. Missing text always matches.
+        """
+        return text is None or bool(self.pattern.search(text))
+
+
+# Rules available by name to ApiConfiguration.shortCircuitRules
+DEFAULT_RULES = {
+    "generation_preamble": ShortCircuitRule("generation_preamble", STAGE_QUESTION, r"^\W*(sure|certainly|of course|absolutely|here (are|is)|below (are|is))\b.*\bquestions?\b"),
+    "blank_question": ShortCircuitRule("blank_question", STAGE_QUESTION, r"^\W*(\d+\W*)?$"),
+    "off_topic_enrichment": ShortCircuitRule("off_topic_enrichment", STAGE_ENRICHMENT, r"^\W*that doesn['’]?t seem to be about ai"),
+    "unknown_enrichment": ShortCircuitRule("unknown_enrichment", STAGE_ENRICHMENT, r"^\W*i don['’]?t know\W*$"),
+    "blank_enrichment": ShortCircuitRule("blank_enrichment", STAGE_ENRICHMENT, r"^\s*$"),
+    "off_topic_follow_up": ShortCircuitRule("off_topic_follow_up", STAGE_FOLLOW_UP, r"^\W*(that doesn['’]?t seem to be about ai|i don['’]?t know\W*$)"),
+}
+
+
+class ShortCircuitPolicy:
+    def __init__(self, rules: List[Union[str, ShortCircuitRule]]) -> None:
+        """
+        Initializes a policy from rule names in DEFAULT_RULES and/or custom ShortCircuitRule instances.
+
+        Args:
+            rules (List[Union[str, ShortCircuitRule]]): The rules to apply, checked in order.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If a rule name is not in DEFAULT_RULES.
+        """
+        self.rules: List[ShortCircuitRule] = []
+        for rule in rules:
+            if isinstance(rule, str):
+                if rule not in DEFAULT_RULES:
+                    raise ValueError(f"Unknown short-circuit rule: {rule}")
+                rule = DEFAULT_RULES[rule]
+            self.rules.append(rule)
+
+    def check(self, stage: str, text: str) -> str:
+        """
+        Checks a stage's text against the policy's rules for that stage.
+
+        Args:
+            stage (str): The stage the text came from.
+            text (str): The question or the stage's response.
+
+        Returns:
+            str: The name of the first matching rule as the skip reason, or an empty string to carry on.
+        """
+        for rule in self.rules:
+            if rule.stage == stage and rule.matches(text):
+                return rule.name
+        return ""
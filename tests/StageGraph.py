@@ -0,0 +1,150 @@
+"""
+Stage Graph:
+Runs the stages of one question as a small dependency graph instead of a chain. A stage starts as soon as the
+stages it depends on have finished, so independent stages run concurrently, e.g. the Gemini judge of the
+enriched summary alongside the search, follow-up and on-topic check. The start and end of every stage are kept
+so the graph, and the critical path through it, show in the timing output.
+"""
+
+# Standard Library Imports
+import time
+from concurrent.futures import Executor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Any, List, Tuple, Iterable
+
+
+class StageGraph:
+    def __init__(self) -> None:
+        """
+        Initializes an empty graph.
+
+        Returns:
+            None
+        """
+        self.stages: Dict[str, Tuple[Callable[[Dict[str, Any]], Any], Tuple[str, ...]]] = {}
+        self.spans: Dict[str, Tuple[float, float]] = {}     # Start and end of each stage run, in seconds from the start of the graph
+
+    def add(self, name: str, stage: Callable[[Dict[str, Any]], Any], depends_on: Iterable[str] = ()) -> None:
+        """
+        Adds a stage.
+
+        Args:
+            name (str): The stage name, also its key in the timings and results.
+            stage (Callable[[Dict[str, Any]], Any]): Runs the stage. It is given the results of the stages run so far, by name.
+            depends_on (Iterable[str]): The stages that must finish first. They must already be in the graph.
+
+        Returns:
+            None
+        """
+        depends_on = tuple(depends_on)
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self.stages[name] = (stage, depends_on)
+
+    def run(self, executor: Executor) -> Dict[str, Any]:
+        """
+        Runs every stage, each on the executor once its dependencies have finished.
+
+        If a stage raises, no further stage is started, the running ones are waited for and the first error is raised.
+
+        Args:
+            executor (Executor): Runs the stages. It needs a worker per stage that can run at the same time.
+
+        Returns:
+            Dict[str, Any]: The result of each stage, by name.
+        """
+        self.spans = {}
+        results: Dict[str, Any] = {}
+        started = time.monotonic()
+        running: Dict[Future, str] = {}
+        waiting = dict(self.stages)
+        error = None
+
+        while waiting or running:
+            if error is None:
+                for name, (stage, depends_on) in list(waiting.items()):
+                    if all(dependency in results for dependency in depends_on):
+                        del waiting[name]
+                        running[executor.submit(self._run_stage, name, stage, dict(results), started)] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    error = error or e
+
+        if error is not None:
+            raise error
+        return results
+
+    def critical_path(self) -> List[str]:
+        """
+        Returns the stages of the last run on its critical path: from the stage that finished last, back through
+        the dependency that finished last each time.
+        """
+        if not self.spans:
+            return []
+        path = [max(self.spans, key=lambda name: self.spans[name][1])]
+        while True:
+            depends_on = [dependency for dependency in self.stages[path[-1]][1] if dependency in self.spans]
+            if not depends_on:
+                return path[::-1]
+            path.append(max(depends_on, key=lambda name: self.spans[name][1]))
+
+    def _run_stage(self, name: str, stage: Callable[[Dict[str, Any]], Any], results: Dict[str, Any], started: float) -> Any:
+        start = time.monotonic() - started
+        try:
+            return stage(results)
+        finally:
+            self.spans[name] = (start, time.monotonic() - started)
+
+
+def format_spans(spans: Dict[str, Tuple[float, float]]) -> str:
+    """
+    Returns the stage spans as one line in start order, e.g. "enrichment 0.00-1.20s | gemini 1.20-2.05s".
+    """
+    return " | ".join(f"{name} {start:.2f}-{end:.2f}s" for name, (start, end) in sorted(spans.items(), key=lambda item: item[1][0]))
+
+
+def summarise_stage_graph(stage_spans: List[Dict[str, Tuple[float, float]]], critical_paths: List[List[str]]) -> Dict[str, Any]:
+    """
+    Summarises the stage graphs of a run.
+
+    Args:
+        stage_spans (List[Dict[str, Tuple[float, float]]]): The stage spans of each question run as a graph.
+        critical_paths (List[List[str]]): The critical path of each of those questions.
+
+    Returns:
+        Dict[str, Any]: The mean start and end of each stage, the mean wall time of a question against the mean
+        time its stages would take one after the other, and how often each critical path occurred.
+    """
+    stages: Dict[str, Dict[str, float]] = {}
+    for spans in stage_spans:
+        for name, (start, end) in spans.items():
+            stage = stages.setdefault(name, {"questions": 0, "start": 0.0, "end": 0.0})
+            stage["questions"] += 1
+            stage["start"] += start
+            stage["end"] += end
+    for stage in stages.values():
+        stage["start"] /= stage["questions"]
+        stage["end"] /= stage["questions"]
+
+    questions = max(1, len(stage_spans))
+    wall = sum(max((end for _, end in spans.values()), default=0.0) for spans in stage_spans) / questions
+    sequential = sum(sum(end - start for start, end in spans.values()) for spans in stage_spans) / questions
+    paths: Dict[str, int] = {}
+    for path in critical_paths:
+        paths[" > ".join(path)] = paths.get(" > ".join(path), 0) + 1
+
+    return {
+        "questions": len(stage_spans),
+        "stages": stages,
+        "mean_wall_seconds": wall,
+        "mean_sequential_seconds": sequential,
+        "speedup": sequential / wall if wall else None,
+        "critical_paths": paths,
+    }
@@ -0,0 +1,297 @@
+"""
+Stage Profiler:
+Attributes CPU time and memory to the stages of a run. Each stage section runs under its own cProfile profiler
+and is measured with tracemalloc, so a slow or memory-hungry run shows which stage is responsible without
+editing any code.
+
+    profiler = start_profiling()
+    with profile_stage("retrieval"):
+        ...
+    profiler.save(directory, name)
+
+The output is a pstats file of every stage together, one pstats file per stage, and a table of each stage's calls,
+wall time, CPU time and peak memory with the lines that allocated the most at that peak.
+
+Sections nest: while an inner section runs, the outer stage's profiler is paused, so a function's time is counted
+once, against the innermost stage. tracemalloc's peak is process-wide, so peak memory is exact for stages that run
+one at a time and an upper bound for stages that overlap on several threads. Only the process that started
+profiling is profiled, not worker processes.
+"""
+
+# Standard Library Imports
+import cProfile
+import datetime
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Allocation lines kept for each stage's peak
+TOP_ALLOCATIONS = 5
+
+# Frames tracemalloc keeps per allocation
+TRACEMALLOC_FRAMES = 1
+
+
+class StageProfiler:
+    def __init__(self, memory: bool = True) -> None:
+        """
+        Initializes a profiler.
+
+        Args:
+            memory (bool): Whether to trace memory with tracemalloc, which slows allocation-heavy code down considerably.
+
+        Returns:
+            None
+        """
+        self.memory = memory
+        self._profiles: Dict[Tuple[str, int], cProfile.Profile] = {}     # One profiler per stage and thread, a profiler follows a single thread
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+
+    def start(self) -> None:
+        """
+        Starts tracing memory, if it is traced and not being traced already.
+        """
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+
+    def stop(self) -> None:
+        """
+        Stops tracing memory, if this profiler started it.
+        """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @contextmanager
+    def section(self, stage: str) -> Iterator[None]:
+        """
+        Profiles the block as part of a stage.
+
+        Args:
+            stage (str): The stage name, e.g. "enrichment" or "serialization".
+        """
+        stack = self._stack()
+        outer = stack[-1] if stack else None
+        if outer is not None and outer["profile"] is not None:
+            outer["profile"].disable()
+
+        frame = {"stage": stage, "profile": self._profile(stage), "start": 0, "peak": 0, "overhead": 0.0}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if outer is not None:
+                outer["peak"] = max(outer["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start"] = frame["peak"] = current
+
+        stack.append(frame)
+        started = time.perf_counter()
+        if frame["profile"] is not None:
+            try:
+                frame["profile"].enable()
+            except ValueError:
+                frame["profile"] = None     # Another profiler is active, the section is timed and measured without it
+        try:
+            yield
+        finally:
+            if frame["profile"] is not None:
+                frame["profile"].disable()
+            wall = time.perf_counter() - started - frame["overhead"]     # Without the snapshots of nested sections
+            stack.pop()
+
+            peak_bytes = 0
+            if self.memory:
+                frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                peak_bytes = frame["peak"] - frame["start"]
+                if outer is not None:
+                    outer["peak"] = max(outer["peak"], frame["peak"])
+            overhead = self._record(stage, wall, peak_bytes)
+
+            if outer is not None:
+                outer["overhead"] += frame["overhead"] + overhead
+                if outer["profile"] is not None:
+                    outer["profile"].enable()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns per stage the sections profiled, their wall seconds including nested sections, the CPU seconds their
+        profilers counted, which leave nested sections out, the largest memory increase of any one section in bytes,
+        and the lines that allocated the most at that peak.
+        """
+        with self._lock:
+            summary = {stage: dict(stats) for stage, stats in self._stats.items()}
+        for stage, stats in summary.items():
+            stage_stats = self._stage_stats(stage)
+            stats["cpu_seconds"] = stage_stats.total_tt if stage_stats is not None else 0.0
+        return summary
+
+    def save(self, directory: str, name: str) -> Dict[str, str]:
+        """
+        Writes the pstats file of every stage together, a pstats file per stage and the stage table, as JSON and as text.
+
+        Args:
+            directory (str): The directory to write to.
+            name (str): The start of the file names, e.g. the test mode.
+
+        Returns:
+            Dict[str, str]: The paths written, by "pstats", "table" and "text".
+        """
+        os.makedirs(directory, exist_ok=True)
+        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        prefix = os.path.join(directory, f"stage_profile_{name}_{current_datetime}")
+        summary = self.summary()
+
+        combined = None
+        for stage in summary:
+            stage_stats = self._stage_stats(stage)
+            if stage_stats is None:
+                continue
+            stage_stats.dump_stats(f"{prefix}_{stage}.pstats")
+            if combined is None:
+                combined = stage_stats
+            else:
+                combined.add(stage_stats)
+        paths = {"table": f"{prefix}.json", "text": f"{prefix}.txt"}
+        if combined is not None:
+            paths["pstats"] = f"{prefix}.pstats"
+            combined.dump_stats(paths["pstats"])
+
+        with open(paths["table"], "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+        with open(paths["text"], "w", encoding="utf-8") as f:
+            f.write(format_stage_table(summary))
+            if combined is not None:
+                f.write("\n")
+                f.write(top_functions(combined))
+        logger.info("Stage profile saved to: %s\n%s", prefix, format_stage_table(summary))
+        return paths
+
+    def _stack(self) -> List[Dict[str, Any]]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _profile(self, stage: str) -> cProfile.Profile:
+        key = (stage, threading.get_ident())
+        with self._lock:
+            if key not in self._profiles:
+                self._profiles[key] = cProfile.Profile()
+            return self._profiles[key]
+
+    def _record(self, stage: str, wall: float, peak_bytes: int) -> float:
+        """
+        Adds a section to its stage's statistics.
+
+        Returns:
+            float: The seconds spent taking a snapshot, if the section set a new peak.
+        """
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"calls": 0, "wall_seconds": 0.0, "peak_bytes": 0, "top_allocations": []})
+            stats["calls"] += 1
+            stats["wall_seconds"] += wall
+            new_peak = peak_bytes > stats["peak_bytes"]
+            stats["peak_bytes"] = max(stats["peak_bytes"], peak_bytes)
+        if not new_peak:
+            return 0.0
+        # Only a new peak is worth the cost of a snapshot, which is taken once the section has finished
+        started = time.perf_counter()
+        top_allocations = top_allocation_lines(tracemalloc.take_snapshot())
+        with self._lock:
+            stats["top_allocations"] = top_allocations
+        return time.perf_counter() - started
+
+    def _stage_stats(self, stage: str) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = [profile for (profile_stage, _), profile in self._profiles.items() if profile_stage == stage]
+        stage_stats = None
+        for profile in profiles:
+            try:
+                profile_stats = pstats.Stats(profile)
+            except TypeError:
+                continue    # The profiler never ran
+            if stage_stats is None:
+                stage_stats = profile_stats
+            else:
+                stage_stats.add(profile_stats)
+        return stage_stats
+
+
+def top_allocation_lines(snapshot: tracemalloc.Snapshot) -> List[str]:
+    """
+    Returns the lines holding the most memory in a snapshot, leaving out tracemalloc and the import system.
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ])
+    return [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size} bytes in {stat.count} blocks" for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+
+
+def format_stage_table(summary: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Returns the stage table as text, the stages with the most CPU time first.
+    """
+    lines = [f"{'stage':<20} {'calls':>7} {'wall s':>10} {'cpu s':>10} {'peak MiB':>10}"]
+    for stage, stats in sorted(summary.items(), key=lambda item: -item[1].get("cpu_seconds", 0.0)):
+        lines.append(f"{stage:<20} {stats['calls']:>7} {stats['wall_seconds']:>10.3f} {stats.get('cpu_seconds', 0.0):>10.3f} {stats['peak_bytes'] / 2 ** 20:>10.2f}")
+    return "\n".join(lines) + "\n"
+
+
+def top_functions(stats: pstats.Stats, limit: int = 30) -> str:
+    """
+    Returns the functions with the most cumulative time, as pstats prints them.
+    """
+    stream = io.StringIO()
+    pstats.Stats(stream=stream).add(stats).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+# The profiler of the process that started profiling, if any
+_profilers: Dict[int, StageProfiler] = {}
+
+
+def start_profiling(memory: bool = True) -> StageProfiler:
+    """
+    Starts profiling stages in this process.
+
+    Args:
+        memory (bool): Whether to trace memory as well as CPU time.
+
+    Returns:
+        StageProfiler: The profiler, whose sections profile_stage now opens.
+    """
+    stop_profiling()    # A run that failed part way leaves its profiler running
+    profiler = _profilers[os.getpid()] = StageProfiler(memory)
+    profiler.start()
+    return profiler
+
+
+def stop_profiling() -> Optional[StageProfiler]:
+    """
+    Stops profiling stages in this process and returns the profiler, or None if none was started.
+    """
+    profiler = _profilers.pop(os.getpid(), None)
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def profile_stage(stage: str):
+    """
+    Returns a context manager profiling the block as part of a stage, or doing nothing when profiling is off.
+    """
+    profiler = _profilers.get(os.getpid())
+    return profiler.section(stage) if profiler is not None else nullcontext()
@@ -0,0 +1,217 @@
+"""
+Streaming Pipeline:
+Connects the stages of a run with bounded queues, each stage on its own threads, so items flow through one at a
+time instead of every stage materialising the whole question set. Memory stays bounded by the queue sizes however
+many questions there are, the first results reach the sink as soon as they are done, and a slow stage fills its
+input queue and so throttles the stages before it rather than letting their work pile up.
+
+A stage that waits on an API can run several workers, which take items from the same queue and may finish them out
+of order. The sink puts them back into source order, and the source stays no further ahead of the sink than the
+queues and workers can hold, so reordering does not unbound memory.
+"""
+
+# Standard Library Imports
+import queue
+import threading
+import time
+from typing import Callable, Dict, Any, List, Tuple, Iterable, Union
+
+# Marks the end of the stream in a queue
+_END = object()
+
+# Seconds a blocked queue operation waits before checking whether the pipeline has stopped
+_POLL_SECONDS = 0.1
+
+
+class StreamingPipeline:
+    def __init__(self, stages: List[Union[Tuple[str, Callable[[Any], Any]], Tuple[str, Callable[[Any], Any], int]]], queue_size: int = 16) -> None:
+        """
+        Initializes a pipeline.
+
+        Args:
+            stages (List[Union[Tuple[str, Callable[[Any], Any]], Tuple[str, Callable[[Any], Any], int]]]): The stages in
+                order, each a name, a function that takes an item and returns the item passed on to the next stage, and
+                optionally the number of worker threads running the function, 1 if not given.
+            queue_size (int): The items each queue between two stages holds before the stage feeding it has to wait.
+
+        Returns:
+            None
+        """
+        if queue_size < 1:
+            raise ValueError("Queue size must be at least 1")
+        self.stages: List[Tuple[str, Callable[[Any], Any], int]] = [(stage[0], stage[1], stage[2] if len(stage) > 2 else 1) for stage in stages]
+        for name, _, workers in self.stages:
+            if workers < 1:
+                raise ValueError(f"Stage {name} needs at least 1 worker")
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def run(self, source: Iterable[Any], sink: Callable[[Any], None]) -> None:
+        """
+        Streams every item of the source through the stages into the sink. The source is read on its own thread,
+        each stage runs on its own worker threads and the sink runs on the calling thread, in source order.
+
+        If the source, a stage or the sink raises, the pipeline stops and the first error is raised.
+
+        Args:
+            source (Iterable[Any]): The items, read lazily.
+            sink (Callable[[Any], None]): Takes each item coming out of the last stage.
+
+        Returns:
+            None
+        """
+        self._stop.clear()
+        self._error = None
+        self._stats = {name: {"workers": 1, "items": 0, "busy_seconds": 0.0, "blocked_seconds": 0.0, "max_queue": 0} for name in ["source"] + [name for name, _, _ in self.stages] + ["sink"]}
+        for name, _, workers in self.stages:
+            self._stats[name]["workers"] = workers
+
+        # Items between the source and the sink, at most what the queues and workers hold, so the sink's reorder buffer is bounded too
+        in_flight = threading.Semaphore(self.queue_size * (len(self.stages) + 1) + sum(workers for _, _, workers in self.stages))
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._read_source, args=(source, queues[0], in_flight), name="stream-source", daemon=True)]
+        for (name, stage, workers), inbox, outbox in zip(self.stages, queues, queues[1:]):
+            running = {"workers": workers}
+            for worker in range(workers):
+                threads.append(threading.Thread(target=self._run_stage, args=(name, stage, inbox, outbox, running), name=f"stream-{name}-{worker}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            self._drain(sink, queues[-1], in_flight)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns per stage of the last run its workers, the items it passed on, the seconds its workers spent working,
+        the seconds spent blocked on a full output queue, which is where backpressure shows, and the deepest its input
+        queue got.
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def _read_source(self, source: Iterable[Any], outbox: queue.Queue, in_flight: threading.Semaphore) -> None:
+        try:
+            for position, item in enumerate(source):
+                if not self._acquire(in_flight) or not self._put("source", outbox, (position, item)):
+                    return
+                self._count("source", 0.0)
+            self._put("source", outbox, _END)
+        except Exception as e:
+            self._fail(e)
+
+    def _run_stage(self, name: str, stage: Callable[[Any], Any], inbox: queue.Queue, outbox: queue.Queue, running: Dict[str, int]) -> None:
+        try:
+            while True:
+                entry = self._get(name, inbox)
+                if entry is None:
+                    return      # The pipeline stopped
+                if entry is _END:
+                    # Put the end back for the stage's other workers, the last of them to finish passes it on
+                    self._put(name, inbox, _END)
+                    with self._lock:
+                        running["workers"] -= 1
+                        last = running["workers"] == 0
+                    if last:
+                        self._put(name, outbox, _END)
+                    return
+
+                position, item = entry
+                start = time.monotonic()
+                result = stage(item)
+                self._count(name, time.monotonic() - start)
+                if not self._put(name, outbox, (position, result)):
+                    return
+        except Exception as e:
+            self._fail(e)
+
+    def _drain(self, sink: Callable[[Any], None], inbox: queue.Queue, in_flight: threading.Semaphore) -> None:
+        """
+        Passes the items coming out of the last stage to the sink in source order, holding back those that overtook an earlier item.
+        """
+        waiting: Dict[int, Any] = {}
+        next_position = 0
+        try:
+            while True:
+                entry = self._get("sink", inbox)
+                if entry is None or entry is _END:
+                    return
+                position, item = entry
+                waiting[position] = item
+                while next_position in waiting:
+                    start = time.monotonic()
+                    sink(waiting.pop(next_position))
+                    self._count("sink", time.monotonic() - start)
+                    in_flight.release()
+                    next_position += 1
+        except Exception as e:
+            self._fail(e)
+
+    def _acquire(self, in_flight: threading.Semaphore) -> bool:
+        """
+        Waits until the source may send another item, counting the wait as the source being blocked.
+
+        Returns:
+            bool: False if the pipeline stopped first.
+        """
+        start = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if in_flight.acquire(timeout=_POLL_SECONDS):
+                    return True
+            return False
+        finally:
+            with self._lock:
+                self._stats["source"]["blocked_seconds"] += time.monotonic() - start
+
+    def _get(self, name: str, inbox: queue.Queue) -> Any:
+        """
+        Takes the next item, or returns None once the pipeline has stopped.
+        """
+        with self._lock:
+            self._stats[name]["max_queue"] = max(self._stats[name]["max_queue"], inbox.qsize())
+        while not self._stop.is_set():
+            try:
+                return inbox.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return None
+
+    def _put(self, name: str, outbox: queue.Queue, item: Any) -> bool:
+        """
+        Passes an item on, waiting while the next stage is behind.
+
+        Returns:
+            bool: False if the pipeline stopped before the item could be passed on.
+        """
+        start = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    outbox.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            with self._lock:
+                self._stats[name]["blocked_seconds"] += time.monotonic() - start
+
+    def _count(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._stats[name]["items"] += 1
+            self._stats[name]["busy_seconds"] += seconds
+
+    def _fail(self, error: Exception) -> None:
+        with self._lock:
+            self._error = self._error or error
+        self._stop.set()
@@ -0,0 +1,162 @@
+"""
+Topic Classifier:
+A local stand-in for `assess_follow_up_on_topic`, which spends a chat completion on a yes/no "is this about AI"
+judgment for every follow-up question. Follow-ups are embedded in batches and scored with NumPy against on-topic
+prototypes, either the centroid of the knowledge-base chunks or a small labelled set of example questions.
+
+Scores clearly above or below the uncertainty band are decided locally. Scores inside the band return an empty
+verdict so the caller can fall back to the LLM, and comparing both on a sample gives the agreement report used
+to tune the band.
+"""
+
+# Standard Library Imports
+import json
+from typing import List, Dict, Any, Tuple, Callable
+
+# Third-Party Packages
+import numpy as np
+
+# Constants
+DEFAULT_TOPIC_BAND = (0.30, 0.45)       # Scores inside this range are too close to call and go to the LLM
+DEFAULT_PROTOTYPE_BAND = (-0.05, 0.05)  # The same for on-minus-off scores, which centre on 0 rather than on a typical similarity
+
+# Verdicts, in the same form as the answers to FOLLOW_UP_ON_TOPIC_PROMPT
+ON_TOPIC = "yes"
+OFF_TOPIC = "no"
+UNCERTAIN = ""
+
+
+class TopicClassifier:
+    def __init__(self, on_topic_embeddings: np.ndarray, off_topic_embeddings: np.ndarray = None, band: Tuple[float, float] = None) -> None:
+        """
+        Initializes a classifier from prototype embeddings.
+
+        A text's score is its best cosine similarity to an on-topic prototype, less its best similarity to an
+        off-topic prototype when there are any. A similarity and a difference of similarities sit on different
+        scales, so without a band given the classifier takes DEFAULT_TOPIC_BAND for the first and
+        DEFAULT_PROTOTYPE_BAND for the second.
+
+        Args:
+            on_topic_embeddings (np.ndarray): An (m, d) matrix of on-topic prototypes, e.g. the knowledge-base centroid.
+            off_topic_embeddings (np.ndarray): Optional (n, d) matrix of off-topic prototypes.
+            band (Tuple[float, float]): The uncertainty band. Scores above it are on-topic, scores below it off-topic.
+                None for the default band of the kind of score.
+
+        Returns:
+            None
+        """
+        self.on_topic = _normalise(on_topic_embeddings)
+        self.off_topic = _normalise(off_topic_embeddings) if off_topic_embeddings is not None and len(off_topic_embeddings) else None
+        if self.on_topic.shape[0] == 0:
+            raise ValueError("Topic classifier needs at least one on-topic prototype")
+
+        if band is None:
+            band = DEFAULT_PROTOTYPE_BAND if self.off_topic is not None else DEFAULT_TOPIC_BAND
+        lower, upper = band
+        if lower > upper:
+            raise ValueError("Topic classifier band must be (lower, upper) with lower <= upper")
+
+        self.band = (lower, upper)
+        self._cache: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_centroid(cls, embeddings: np.ndarray, band: Tuple[float, float] = None, block_size: int = 65536) -> "TopicClassifier":
+        """
+        Builds a classifier whose only prototype is the centroid of the knowledge-base chunk embeddings.
+
+        Args:
+            embeddings (np.ndarray): The (n, d) chunk embeddings, e.g. from build_embedding_matrix or a memory-mapped index.
+            band (Tuple[float, float]): The uncertainty band, None for DEFAULT_TOPIC_BAND.
+            block_size (int): The number of rows normalised at a time, so a memory-mapped matrix is never loaded whole.
+
+        Returns:
+            TopicClassifier: The classifier.
+        """
+        total = np.zeros(embeddings.shape[1], dtype=np.float64)
+        for start in range(0, embeddings.shape[0], block_size):
+            total += _normalise(embeddings[start:start + block_size]).sum(axis=0)
+        return cls(total[np.newaxis, :], None, band)
+
+    def classify(self, texts: List[str], embed: Callable[[List[str]], np.ndarray]) -> List[Tuple[float, str]]:
+        """
+        Scores texts against the prototypes, embedding only the texts not seen before in one batched call.
+
+        Args:
+            texts (List[str]): The texts to classify, e.g. follow-up questions.
+            embed (Callable[[List[str]], np.ndarray]): Returns an (n, d) matrix of embeddings for a list of texts.
+
+        Returns:
+            List[Tuple[float, str]]: A (score, verdict) pair per text, the verdict being ON_TOPIC, OFF_TOPIC or
+            UNCERTAIN when the score falls inside the band.
+        """
+        missing = list(dict.fromkeys(text for text in texts if text not in self._cache))
+        if missing:
+            for text, embedding in zip(missing, _normalise(embed(missing))):
+                self._cache[text] = embedding
+
+        if not texts:
+            return []
+
+        matrix = np.vstack([self._cache[text] for text in texts])
+        scores = (matrix @ self.on_topic.T).max(axis=1)
+        if self.off_topic is not None:
+            scores = scores - (matrix @ self.off_topic.T).max(axis=1)
+
+        lower, upper = self.band
+        return [(float(score), ON_TOPIC if score > upper else OFF_TOPIC if score < lower else UNCERTAIN) for score in scores]
+
+
+def load_topic_prototypes(prototype_file: str) -> Tuple[List[str], List[str]]:
+    """
+    Reads a labelled prototype set.
+
+    Args:
+        prototype_file (str): A JSON file of the form {"on_topic": [questions], "off_topic": [questions]}.
+
+    Returns:
+        Tuple[List[str], List[str]]: The on-topic and off-topic example questions.
+    """
+    with open(prototype_file, "r", encoding="utf-8") as f:
+        prototypes = json.load(f)
+    return list(prototypes.get("on_topic", [])), list(prototypes.get("off_topic", []))
+
+
+def summarise_topic_agreement(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compares the local verdicts with the LLM's answers for the follow-ups both assessed.
+
+    Args:
+        records (List[Dict[str, Any]]): One {"follow_up", "score", "classifier", "llm"} entry per follow-up. "classifier"
+            is the local verdict and "llm" the LLM's answer, empty when the LLM was not asked.
+
+    Returns:
+        Dict[str, Any]: How many follow-ups had a confident local verdict or were sent to the LLM, the agreement rate
+        where both answered, and the disagreements.
+    """
+    compared = [record for record in records if record["classifier"] and record["llm"]]
+    disagreements = [record for record in compared if _as_verdict(record["llm"]) != record["classifier"]]
+    return {
+        "assessed": len(records),
+        "confident": sum(1 for record in records if record["classifier"]),
+        "sent_to_llm": sum(1 for record in records if record["llm"]),
+        "uncertain": sum(1 for record in records if not record["classifier"]),
+        "compared": len(compared),
+        "agreement_rate": 1 - len(disagreements) / len(compared) if compared else None,
+        "disagreements": disagreements,
+    }
+
+
+def _as_verdict(answer: str) -> str:
+    """
+    Reduces a free-text LLM answer such as "Yes." to ON_TOPIC or OFF_TOPIC.
+    """
+    return ON_TOPIC if answer.strip().lower().startswith(ON_TOPIC) else OFF_TOPIC
+
+
+def _normalise(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Returns the embeddings as a row-normalised float32 matrix. Zero rows are left as zeros.
+    """
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
@@ -0,0 +1,238 @@
+"""
+Work Queue:
+A durable SQLite lease queue of (cell, question) work items, so a large question set can be processed by any
+number of worker processes sharing the database file. The database runs in write-ahead log mode, which needs every
+worker on the machine holding the file: it is not safe on a network file system.
+
+A worker leases a few items at a time. A lease expires after the visibility timeout, so the items of a worker
+that dies are handed out again, up to a maximum number of attempts, and nothing else is lost. Results are stored
+against each item's position in its cell, so the merge step can rebuild each cell's results in the original order.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import sqlite3
+import time
+from typing import List, Dict, Any, Tuple
+
+# Constants
+DEFAULT_VISIBILITY_TIMEOUT = 600    # Seconds a leased item stays invisible to other workers
+DEFAULT_MAX_ATTEMPTS = 3            # Leases an item gets before it is marked as failed
+
+# Item states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cell TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    UNIQUE (cell, position)
+);
+CREATE INDEX IF NOT EXISTS work_items_status ON work_items (status, lease_expires);
+"""
+
+
+class WorkQueue:
+    def __init__(self, db_path: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> None:
+        """
+        Opens (and if necessary creates) a queue database.
+
+        Args:
+            db_path (str): The path of the SQLite database file, shared by every worker.
+            visibility_timeout (float): Seconds before an unfinished lease expires and its item is handed out again.
+            max_attempts (int): The number of leases an item gets before it is marked as failed.
+
+        Returns:
+            None
+        """
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+        # Autocommit mode, transactions are opened explicitly so leasing can take the write lock up front
+        self._connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def enqueue(self, cell: str, questions: List[str]) -> int:
+        """
+        Adds a cell's questions to the queue. Questions already queued for the cell at the same position are left alone,
+        so enqueueing the same cell twice is harmless.
+
+        Args:
+            cell (str): The cell the questions belong to, e.g. "gpt-4_developer". Used as the test mode when merging.
+            questions (List[str]): The questions, in order.
+
+        Returns:
+            int: The number of items added.
+        """
+        with self._transaction():
+            cursor = self._connection.executemany(
+                "INSERT OR IGNORE INTO work_items (cell, position, question) VALUES (?, ?, ?)",
+                [(cell, position, question) for position, question in enumerate(questions)],
+            )
+        return cursor.rowcount
+
+    def lease(self, worker_id: str, limit: int = 1, cells: List[str] = None) -> List[Tuple[int, str, int, str]]:
+        """
+        Leases up to limit items that are pending or whose previous lease has expired.
+
+        Args:
+            worker_id (str): A name unique to the worker, recorded as the lease owner.
+            limit (int): The maximum number of items to lease.
+            cells (List[str]): Optional cells to take items from, e.g. those of the model this worker is configured for.
+
+        Returns:
+            List[Tuple[int, str, int, str]]: The leased (item id, cell, position, question) tuples.
+        """
+        now = time.time()
+        cell_filter = f" AND cell IN ({', '.join('?' * len(cells))})" if cells else ""
+
+        with self._transaction():
+            # Items whose last lease expired with no attempts left are given up on
+            self._connection.execute(
+                "UPDATE work_items SET status = ?, error = COALESCE(error, 'lease expired') WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            rows = self._connection.execute(
+                f"SELECT id, cell, position, question FROM work_items WHERE (status = ? OR (status = ? AND lease_expires < ?)){cell_filter} ORDER BY id LIMIT ?",
+                (PENDING, LEASED, now, *(cells or []), limit),
+            ).fetchall()
+            self._connection.executemany(
+                "UPDATE work_items SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ? WHERE id = ?",
+                [(LEASED, worker_id, now + self.visibility_timeout, row[0]) for row in rows],
+            )
+        return rows
+
+    def complete(self, item_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Stores the result of a leased item.
+
+        Args:
+            item_id (int): The item id.
+            worker_id (str): The worker that leased it.
+            result (Dict[str, Any]): The JSON-serialisable result.
+
+        Returns:
+            bool: False if the lease had already expired and been taken by another worker, in which case the result is discarded.
+        """
+        with self._transaction():
+            cursor = self._connection.execute(
+                "UPDATE work_items SET status = ?, result = ?, error = NULL, lease_expires = NULL WHERE id = ? AND status = ? AND lease_owner = ?",
+                (DONE, json.dumps(result), item_id, LEASED, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, item_id: int, worker_id: str, error: str) -> None:
+        """
+        Gives back a leased item after an error, to be retried until it runs out of attempts.
+
+        Args:
+            item_id (int): The item id.
+            worker_id (str): The worker that leased it.
+            error (str): A description of the error.
+
+        Returns:
+            None
+        """
+        with self._transaction():
+            self._connection.execute(
+                "UPDATE work_items SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, lease_expires = NULL WHERE id = ? AND status = ? AND lease_owner = ?",
+                (self.max_attempts, FAILED, PENDING, error, item_id, LEASED, worker_id),
+            )
+
+    def release(self, item_id: int, worker_id: str, reason: str) -> None:
+        """
+        Gives back a leased item that was not processed, e.g. because its endpoint was down or the run deadline
+        passed, without counting the lease as one of its attempts.
+
+        Args:
+            item_id (int): The item id.
+            worker_id (str): The worker that leased it.
+            reason (str): Why the item was not processed.
+
+        Returns:
+            None
+        """
+        with self._transaction():
+            self._connection.execute(
+                "UPDATE work_items SET status = ?, attempts = MAX(attempts - 1, 0), error = ?, lease_expires = NULL WHERE id = ? AND status = ? AND lease_owner = ?",
+                (PENDING, reason, item_id, LEASED, worker_id),
+            )
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        """
+        Counts the items in each state, per cell.
+
+        Returns:
+            Dict[str, Dict[str, int]]: {cell: {status: count}}.
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        for cell, status, count in self._connection.execute("SELECT cell, status, COUNT(*) FROM work_items GROUP BY cell, status"):
+            counts.setdefault(cell, {})[status] = count
+        return counts
+
+    def is_finished(self, cells: List[str] = None) -> bool:
+        """
+        Checks whether every item (of the given cells) is done or has failed for good.
+        """
+        cell_filter = f" AND cell IN ({', '.join('?' * len(cells))})" if cells else ""
+        row = self._connection.execute(f"SELECT COUNT(*) FROM work_items WHERE status IN (?, ?){cell_filter}", (PENDING, LEASED, *(cells or []))).fetchone()
+        return row[0] == 0
+
+    def results(self, cell: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Returns a cell's results in question order.
+
+        Args:
+            cell (str): The cell.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: The results of the completed items, and the
+            position, question and error of each item that is not done.
+        """
+        completed, missing = [], []
+        for position, question, status, result, error in self._connection.execute("SELECT position, question, status, result, error FROM work_items WHERE cell = ? ORDER BY position", (cell,)):
+            if status == DONE:
+                completed.append(json.loads(result))
+            else:
+                missing.append({"position": position, "question": question, "status": status, "error": error})
+        return completed, missing
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        self._connection.close()
+
+    def _transaction(self) -> "_ImmediateTransaction":
+        """
+        Returns a context manager that holds the database write lock for its duration.
+        """
+        return _ImmediateTransaction(self._connection)
+
+
+class _ImmediateTransaction:
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
@@ -1,11 +1,16 @@
 import os
+import sys
 import json
 import logging
 from typing import List
-import openai
 
-# Assuming ApiConfiguration is defined as shown, with the given constants:
-from Apiconfiguration import ApiConfiguration
+# Add the project root to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+from common.ApiConfiguration import ApiConfiguration
+from common.ClientFactory import get_client_factory
 
 # Set up logging
 logging.basicConfig(
@@ -16,8 +21,9 @@ logging.basicConfig(
 # Configuration parameters
 CHUNK_SIZE = 1000    # Number of characters per chunk
 CHUNK_OVERLAP = 200  # Overlap between chunks
-INPUT_DIR = "D:\Dissertation - City, Univeristy of London\Evaluating-AI-Learning-Assistants\input data\"  # Directory containing .txt files
-OUTPUT_JSON = "data\embeddings_output.json"
+INPUT_DIR = r"D:\Dissertation - City, Univeristy of London\Evaluating-AI-Learning-Assistants\input data"  # Directory containing .txt files
+OUTPUT_JSON = os.path.join("data", "embeddings_output.json")
+EMBEDDING_ENDPOINT = "https://braidlms.openai.azure.com/"  # Resource the existing chunk vectors were generated on
 
 # Initialize configuration
 config = ApiConfiguration()
@@ -31,12 +37,8 @@ if not config.azureEmbedDeploymentName:
     logging.error("Azure embedding deployment name not set in ApiConfiguration.")
     raise ValueError("Missing azureEmbedDeploymentName in ApiConfiguration.")
 
-# Set the openai configuration for Azure
-openai.api_type = "azure"
-
-openai.api_base = "https://braidlms.openai.azure.com/"
-openai.api_version = config.apiVersion
-openai.api_key = config.apiKey
+# Embeddings client on the same resource as before, sharing the process-wide HTTP connection pool so each chunk reuses a kept-alive connection
+embedding_client = get_client_factory(config).client_for(EMBEDDING_ENDPOINT, config.apiKey.strip())
 
 def get_embedding(text: str, config: ApiConfiguration):
     """
@@ -45,12 +47,12 @@ def get_embedding(text: str, config: ApiConfiguration):
     text = text.replace("\n", " ")
 
     try:
-        response = openai.Embedding.create(
+        response = embedding_client.embeddings.create(
             input=[text],
-            engine=config.azureEmbedDeploymentName,  # Deployment name for embeddings
+            model=config.azureEmbedDeploymentName,  # Deployment name for embeddings
             timeout=config.openAiRequestTimeout
         )
-        return response["data"][0]["embedding"]
+        return response.data[0].embedding
     except Exception as e:
         logging.error(f"Error generating embedding: {e}")
         raise